@@ -1,16 +1,95 @@
+import re
+
 from django.contrib import admin
 from django.contrib import messages
-from .models import PhoneNumber, CallRecord, DTMFSequence, CallQueue, SMSMessage
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models.functions import Now
+from django.utils.translation import gettext_lazy as _
+from .caching import QUEUE, invalidate, invalidate_phones
+from .events import publish_bulk
+from .models import PhoneNumber, CallRecord, DTMFSequence, CallQueue, SMSMessage, LLMBatchJob
+from .pagination import EstimatedCountPaginator
+
+# Строка поиска, похожая на номер телефона: цифры и разделители
+PHONE_SEARCH_RE = re.compile(r'^[\d\s()+.-]+$')
+
+
+class PhoneNumberAutocompleteFilter(admin.RelatedFieldListFilter):
+    """
+    Фильтр по номеру с автодополнением.
+
+    Стандартный фильтр по ForeignKey выводит ссылку на каждый номер в базе;
+    этот ищет номер через autocomplete-представление админки.
+    """
+    template = 'admin/calls/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.source_opts = model._meta
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def field_choices(self, field, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    @property
+    def selected_label(self):
+        if not self.lookup_val:
+            return ''
+        return str(PhoneNumber.objects.filter(pk=self.lookup_val).first() or self.lookup_val)
+
+    def choices(self, changelist):
+        # Шаблон ссылки, в которую JS подставляет выбранный номер
+        self.query_string_template = changelist.get_query_string(
+            {self.lookup_kwarg: '__value__'}, [self.lookup_kwarg_isnull]
+        )
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            'display': _('All'),
+        }
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Базовый класс админки для таблиц на сотни тысяч строк.
+
+    Количество строк берется из оценки Postgres вместо COUNT(*), поиск по номеру
+    идет по началу номера (индекс calls_phone_number_idx), а в списках с фильтром
+    по номеру подключаются скрипты автодополнения.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        if any(isinstance(item, tuple) and item[1] is PhoneNumberAutocompleteFilter for item in self.list_filter):
+            media += AutocompleteSelect(self.model._meta.get_field('phone_number'), self.admin_site).media
+        return media
+
+    def get_search_results(self, request, queryset, search_term):
+        # "+1 (555) 010-0146" ищется как начало номера 15550100146
+        if PHONE_SEARCH_RE.match(search_term):
+            search_term = re.sub(r'\D', '', search_term)
+        return super().get_search_results(request, queryset, search_term)
+
 
 @admin.register(PhoneNumber)
-class PhoneNumberAdmin(admin.ModelAdmin):
+class PhoneNumberAdmin(LargeTableAdmin):
     list_display = ('number', 'status', 'created_at')
-    search_fields = ('number',)
+    search_fields = ('number__startswith',)
     list_filter = ('status', 'created_at')
 
     def mark_as_completed(self, request, queryset):
         # Обновляем статус для выбранных записей
-        updated = queryset.update(status='completed')
+        phone_ids = list(queryset.values_list('id', flat=True))
+        updated = queryset.update(status='completed', updated_at=Now())
+        # update() не отправляет сигналы
+        invalidate_phones(phone_ids)
+        invalidate(QUEUE)
+        publish_bulk('completed', updated)
         
         # Выводим сообщение о результате
         if updated == 1:
@@ -27,29 +106,40 @@ class PhoneNumberAdmin(admin.ModelAdmin):
     actions = ['mark_as_completed']
 
 @admin.register(CallRecord)
-class CallRecordAdmin(admin.ModelAdmin):
+class CallRecordAdmin(LargeTableAdmin):
     list_display = ('phone_number', 'recording_file', 'duration', 'created_at')
-    list_filter = ('created_at',)
-    search_fields = ('phone_number__number', 'recording_file')
-    raw_id_fields = ('phone_number',)
+    list_filter = (('phone_number', PhoneNumberAutocompleteFilter), 'created_at')
+    search_fields = ('phone_number__number__startswith',)
+    autocomplete_fields = ('phone_number',)
+    list_select_related = ('phone_number',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Строка, похожая на номер, ищется по номеру, остальные - по началу имени файла
+        # (индекс calls_record_file_idx): OR по столбцам двух таблиц не использует индексы
+        search_term = search_term.strip()
+        if not search_term or PHONE_SEARCH_RE.match(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(recording_file__startswith=search_term), False
 
 @admin.register(DTMFSequence)
-class DTMFSequenceAdmin(admin.ModelAdmin):
+class DTMFSequenceAdmin(LargeTableAdmin):
     list_display = ('phone_number', 'get_sequence_display', 'created_at')
-    search_fields = ('phone_number__number',)
-    list_filter = ('phone_number',)
-    raw_id_fields = ('phone_number',)
+    search_fields = ('phone_number__number__startswith',)
+    list_filter = (('phone_number', PhoneNumberAutocompleteFilter),)
+    autocomplete_fields = ('phone_number',)
+    list_select_related = ('phone_number',)
 
     def get_sequence_display(self, obj):
         return str(obj.sequence)
     get_sequence_display.short_description = 'Sequence'
 
 @admin.register(CallQueue)
-class CallQueueAdmin(admin.ModelAdmin):
+class CallQueueAdmin(LargeTableAdmin):
     list_display = ('phone_number', 'get_dtmf_display', 'status', 'attempts', 'created_at')
-    list_filter = ('status', 'created_at')
-    search_fields = ('phone_number__number',)
-    raw_id_fields = ('phone_number',)
+    list_filter = ('status', ('phone_number', PhoneNumberAutocompleteFilter), 'created_at')
+    search_fields = ('phone_number__number__startswith',)
+    autocomplete_fields = ('phone_number',)
+    list_select_related = ('phone_number',)
     readonly_fields = ('attempts', 'last_error')
 
     def get_dtmf_display(self, obj):
@@ -57,7 +147,15 @@ class CallQueueAdmin(admin.ModelAdmin):
     get_dtmf_display.short_description = 'DTMF Sequence'
 
 @admin.register(SMSMessage)
-class SMSMessageAdmin(admin.ModelAdmin):
+class SMSMessageAdmin(LargeTableAdmin):
     list_display = ('sender_number', 'message_text', 'received_at', 'status', 'response_text')
-    search_fields = ('sender_number', 'message_text', 'response_text')
+    # icontains по текстам использует триграммные индексы calls_sms_*_trgm_idx
+    search_fields = ('sender_number__startswith', 'message_text', 'response_text')
     list_filter = ('status', 'received_at')
+
+@admin.register(LLMBatchJob)
+class LLMBatchJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'batch_status', 'request_count', 'applied_count', 'failed_count', 'created_at')
+    list_filter = ('kind', 'status')
+    search_fields = ('batch_id',)
+    readonly_fields = [field.name for field in LLMBatchJob._meta.fields]
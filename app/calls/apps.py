@@ -3,3 +3,15 @@ from django.apps import AppConfig
 class CallsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'calls'
+
+    def ready(self):
+        # Подключаем обработчики сигналов Celery для метрик задач
+        from . import metrics  # noqa: F401
+        # Обработчики сигналов моделей, поддерживающие счетчики номеров
+        from . import counters  # noqa: F401
+        # Публикация изменений статусов в ленту событий
+        from . import events  # noqa: F401
+        # Инвалидация кэша ответов дашборда
+        from . import caching  # noqa: F401
+        # Пробуждение диспетчера при появлении работы
+        from . import dispatcher  # noqa: F401
@@ -0,0 +1,50 @@
+"""
+Асинхронные версии API-представлений для запуска под ASGI (core.asgi).
+
+Ожидание базы, Redis и диска не занимает поток воркера, поэтому один процесс
+держит тысячи одновременных соединений дашборда: опрос очереди, списки номеров,
+SSE-ленту и долгую отдачу записей медленным клиентам. Логика ответов общая с
+синхронными представлениями в views.py.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, Http404, StreamingHttpResponse
+
+from . import events as live_events
+from .models import PhoneNumber
+from .pagination import akeyset_page
+from .recordings import resolve_recording_path, recording_response, afile_range_iterator
+from .views import PHONE_LIST_FIELDS, _page_limit, phone_list_response, cached_queue_count
+
+
+async def queue_count(request):
+    """Возвращает количество номеров в очереди на обработку"""
+    # Кэш синхронный: при промахе подсчет выполняется в пуле потоков
+    count = await sync_to_async(cached_queue_count, thread_sensitive=False)()
+    return JsonResponse({'count': count})
+
+
+async def phone_list(request):
+    """API endpoint для получения списка номеров (см. views.phone_list)"""
+    phones, next_cursor = await akeyset_page(
+        PhoneNumber.objects.values(*PHONE_LIST_FIELDS), request.GET.get('cursor'), _page_limit(request)
+    )
+    return phone_list_response(request, phones, next_cursor)
+
+
+async def events(request):
+    """Лента изменений статусов в формате server-sent events"""
+    response = StreamingHttpResponse(live_events.astream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+    return response
+
+
+async def serve_recording(request, filepath):
+    """Отдает файл записи, читая его в пуле потоков по мере отправки клиенту"""
+    # Проверка пути и stat - блокирующие системные вызовы, выполняем вне event loop
+    file_path = await sync_to_async(resolve_recording_path, thread_sensitive=False)(filepath)
+    if not file_path:
+        raise Http404(f"Recording {filepath} not found")
+    return await sync_to_async(recording_response, thread_sensitive=False)(
+        request, file_path, iterator=afile_range_iterator
+    )
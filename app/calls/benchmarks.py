@@ -0,0 +1,245 @@
+"""
+Бенчмарки горячих путей calls.tasks и calls.services.
+
+Заполняет базу реалистичным объемом данных, подменяет все сетевые вызовы
+(звонки, OpenAI, постановку задач Celery) и измеряет для каждой операции
+время выполнения, количество SQL-запросов и пиковое потребление памяти.
+"""
+import itertools
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime
+from unittest import mock
+
+from celery.app.task import Task
+from django.conf import settings
+from django.db import connection, reset_queries, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .counters import refresh_counters
+from .models import PhoneNumber, CallRecord, DTMFSequence, CallQueue
+
+logger = logging.getLogger('calls.benchmarks')
+
+SEED_BATCH_SIZE = 10000
+
+MENU_TRANSCRIPTION = (
+    "Thank you for calling. For billing, press 1. For technical support menu, press 2. "
+    "For account information, press 3. To speak with a representative, press 0."
+)
+
+STUB_OPTIONS = [
+    {"digit": "1", "action": "billing", "submenu": False},
+    {"digit": "2", "action": "technical support menu", "submenu": True},
+    {"digit": "3", "action": "account information", "submenu": False},
+]
+
+
+def _tree_paths(depth, breadth):
+    """Все пути дерева меню заданной глубины и ширины, по уровням."""
+    digits = [str(d) for d in range(1, breadth + 1)]
+    for level in range(1, depth + 1):
+        for path in itertools.product(digits, repeat=level):
+            yield list(path)
+
+
+def seed(numbers=10000, records=1000000, deep_numbers=100, tree_depth=4, tree_breadth=3, stdout=None):
+    """
+    Заполняет базу тестовыми данными.
+
+    Записи звонков распределяются по номерам равномерно; каждая 50-я запись
+    без транскрипции, каждая 40-я с короткой транскрипцией (зависшие записи).
+    Для первых deep_numbers номеров создается полное дерево DTMF.
+    """
+    def report(message):
+        if stdout:
+            stdout.write(message)
+
+    PhoneNumber.objects.bulk_create(
+        [PhoneNumber(number=f"1800{i:07d}", status='completed') for i in range(numbers)],
+        batch_size=SEED_BATCH_SIZE
+    )
+    phone_ids = list(PhoneNumber.objects.order_by('id').values_list('id', flat=True))
+    report(f"Seeded {len(phone_ids)} phone numbers")
+
+    batch = []
+    for i in range(records):
+        if i % 50 == 0:
+            transcription = None
+        elif i % 40 == 0:
+            transcription = "Hello?"
+        else:
+            transcription = MENU_TRANSCRIPTION
+        batch.append(CallRecord(
+            phone_number_id=phone_ids[i % len(phone_ids)],
+            recording_file=f"bench-{i}.wav",
+            dtmf_sequence=list(str(i)),  # Уникальный путь, чтобы повторная постановка в очередь не конфликтовала
+            transcription=transcription,
+        ))
+        if len(batch) >= SEED_BATCH_SIZE:
+            CallRecord.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        CallRecord.objects.bulk_create(batch)
+
+    # Разносим записи по времени, чтобы часть из них попала в окно зависших
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE calls_callrecord SET created_at = NOW() - (id % 2880) * INTERVAL '1 minute'"
+        )
+    report(f"Seeded {records} call records")
+
+    sequences = []
+    paths = list(_tree_paths(tree_depth, tree_breadth))
+    for phone_id in phone_ids[:deep_numbers]:
+        for n, path in enumerate(paths):
+            sequences.append(DTMFSequence(
+                phone_number_id=phone_id,
+                sequence=path,
+                description=f"Option {'-'.join(path)}",
+                level=len(path),
+                is_submenu=len(path) < tree_depth,
+                explored=n % 2 == 0,
+            ))
+    DTMFSequence.objects.bulk_create(sequences, batch_size=SEED_BATCH_SIZE)
+    report(f"Seeded {len(sequences)} DTMF sequences")
+
+    refresh_counters()
+
+
+def _stubs():
+    """Подменяет сетевые вызовы и постановку задач в очередь."""
+    return [
+        # Клиент OpenAI требует ключ при создании, хотя запросы не отправляются
+        override_settings(OPENAI_API_KEY=settings.OPENAI_API_KEY or 'benchmark', METRICS_ENABLED=False,
+                          RESPONSE_CACHE_ENABLED=False),
+        # Redis в бенчмарках не нужен: аренды всегда выдаются
+        mock.patch('calls.leases.acquire_many', side_effect=lambda kind, names, ttl=None: list(names)),
+        mock.patch('calls.leases.release'),
+        mock.patch('calls.services.CallManager.make_call', return_value='bench.wav'),
+        mock.patch('calls.services.TranscriptionService.transcribe_audio', return_value=MENU_TRANSCRIPTION),
+        mock.patch('calls.services.TranscriptionService.analyze_ivr_menu',
+                   side_effect=lambda *args, **kwargs: [dict(o) for o in STUB_OPTIONS]),
+        mock.patch('calls.services.TranscriptionService.analyze_summary_for_dtmf', return_value=[]),
+        mock.patch('calls.services.TranscriptionService.create_summary', return_value=None),
+        mock.patch.object(Task, 'apply_async', return_value=None),
+    ]
+
+
+def _operations():
+    from . import tasks, views
+    from .services import TranscriptionService
+
+    deep_phone_id = DTMFSequence.objects.values_list('phone_number_id', flat=True).order_by('id').first()
+    factory = RequestFactory()
+
+    return {
+        'analyze_transcription_for_dtmf': lambda: TranscriptionService().analyze_transcription_for_dtmf(
+            MENU_TRANSCRIPTION, deep_phone_id
+        ),
+        'process_unprocessed_recordings': tasks.process_unprocessed_recordings,
+        'check_stalled_recordings': tasks.check_stalled_recordings,
+        'check_unexplored_dtmf': tasks.check_unexplored_dtmf,
+        'phone_list': lambda: views.phone_list(factory.get('/api/phone-list/')),
+    }
+
+
+def _run_once(operation):
+    """Выполняет операцию в транзакции, которая затем откатывается."""
+    # Журнал запросов ограничен по длине, поэтому очищаем его перед каждым замером
+    reset_queries()
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+    return elapsed, len(queries)
+
+
+def _peak_memory(operation):
+    with transaction.atomic():
+        tracemalloc.start()
+        try:
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        transaction.set_rollback(True)
+    return peak
+
+
+def run(only=None, repeat=3):
+    """
+    Запускает бенчмарки.
+
+    Returns:
+        dict: {имя операции: {"wall_time_s", "wall_time_min_s", "queries", "peak_memory_kb"}}
+    """
+    results = {}
+    with ExitStack() as stack:
+        for stub in _stubs():
+            stack.enter_context(stub)
+
+        for name, operation in _operations().items():
+            if only and name not in only:
+                continue
+            logger.info(f"Benchmarking {name}")
+            timings = []
+            query_count = 0
+            for _ in range(repeat):
+                elapsed, query_count = _run_once(operation)
+                timings.append(elapsed)
+            results[name] = {
+                'wall_time_s': round(statistics.median(timings), 6),
+                'wall_time_min_s': round(min(timings), 6),
+                'queries': query_count,
+                'peak_memory_kb': round(_peak_memory(operation) / 1024, 1),
+            }
+    return results
+
+
+def build_report(results, scale):
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'scale': scale,
+            'database': connection.vendor,
+            'row_counts': {
+                'phone_numbers': PhoneNumber.objects.count(),
+                'call_records': CallRecord.objects.count(),
+                'dtmf_sequences': DTMFSequence.objects.count(),
+                'call_queue': CallQueue.objects.count(),
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold=1.2):
+    """
+    Сравнивает результаты с базовым отчетом.
+
+    Returns:
+        list: Описания регрессий (время или количество запросов выросли больше чем в threshold раз)
+    """
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        for metric in ('wall_time_s', 'queries', 'peak_memory_kb'):
+            before, after = previous.get(metric), current.get(metric)
+            if before and after and after > before * threshold:
+                regressions.append(f"{name}: {metric} {before} -> {after} (x{after / before:.2f})")
+    return regressions
+
+
+def load_report(path):
+    with open(path) as report_file:
+        return json.load(report_file)
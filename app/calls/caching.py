@@ -0,0 +1,139 @@
+"""
+Кэш ответов дашборда и запросов в Redis с инвалидацией по поколениям.
+
+Каждое закэшированное значение относится к одной или нескольким областям
+(scope): список номеров, очередь, конкретный номер. У области есть счетчик
+поколения, который входит в ключ значения. Сигналы моделей после коммита
+увеличивают поколение затронутых областей, и старые значения просто перестают
+читаться (и истекают по TTL) - без поиска и удаления ключей по шаблону.
+Массовые операции сигналов не отправляют, поэтому их инвалидирует
+refresh_counters().
+
+Ошибки Redis не ломают страницы: значение вычисляется заново без кэша.
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .models import PhoneNumber, CallRecord, DTMFSequence, CallQueue
+
+logger = logging.getLogger('calls.cache')
+
+# Списки номеров вместе со счетчиками
+PHONES = 'phones'
+# Количество номеров в очереди на обработку (зависит только от статусов номеров)
+QUEUE = 'queue'
+# Все страницы номеров сразу: для массового пересчета без списка номеров
+ALL_PHONE_DETAILS = 'phone_details'
+
+_MISSING = object()
+
+
+def phone_scope(phone_id):
+    """Область данных одного номера: карточка, записи, последовательности."""
+    return f"phone:{phone_id}"
+
+
+def _generation_key(scope):
+    return f"generation:{scope}"
+
+
+def _generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Начальное поколение от времени: вытесненный счетчик не вернет ключи к старым значениям
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key, 0)
+    return [str(generations[key]) for key in keys]
+
+
+def cached(name, scopes, compute, *parts, timeout=None):
+    """
+    Значение из кэша или результат compute(), сохраненный в кэш.
+
+    Args:
+        name: Имя кэшируемого значения (метка в метриках hit/miss)
+        scopes: Области, при изменении которых значение устаревает
+        compute: Функция без аргументов, вычисляющая значение
+        parts: Параметры запроса, от которых зависит значение (курсор, лимит и т.п.)
+    """
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return compute()
+    timeout = settings.RESPONSE_CACHE_TIMEOUT if timeout is None else timeout
+    try:
+        key = ':'.join([name, *_generations(scopes), *(str(part) for part in parts)])
+        value = cache.get(key, _MISSING)
+    except redis.RedisError as e:
+        logger.warning(f"Cache unavailable for {name}: {str(e)}")
+        return compute()
+
+    if value is not _MISSING:
+        metrics.inc('calls_cache_requests_total', cache=name, result='hit')
+        return value
+
+    metrics.inc('calls_cache_requests_total', cache=name, result='miss')
+    value = compute()
+    try:
+        cache.set(key, value, timeout)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to cache {name}: {str(e)}")
+    return value
+
+
+def invalidate(*scopes):
+    """Увеличивает поколения областей после коммита текущей транзакции."""
+    if not scopes or not settings.RESPONSE_CACHE_ENABLED:
+        return
+
+    def bump():
+        for scope in set(scopes):
+            key = _generation_key(scope)
+            try:
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    # Счетчика нет: любое новое поколение отличается от прежних ключей
+                    cache.set(key, time.time_ns(), timeout=None)
+            except redis.RedisError as e:
+                logger.warning(f"Failed to invalidate cache scope {scope}: {str(e)}")
+
+    transaction.on_commit(bump)
+
+
+def invalidate_phones(phone_ids=None):
+    """
+    Инвалидирует списки номеров и данные указанных номеров.
+
+    Args:
+        phone_ids: ID номеров; None - все номера
+    """
+    if phone_ids is None:
+        invalidate(PHONES, QUEUE, ALL_PHONE_DETAILS)
+    else:
+        invalidate(PHONES, *(phone_scope(phone_id) for phone_id in phone_ids))
+
+
+@receiver(post_save, sender=PhoneNumber)
+@receiver(post_delete, sender=PhoneNumber)
+def _phone_changed(sender, instance, **kwargs):
+    invalidate(PHONES, QUEUE, phone_scope(instance.pk))
+
+
+@receiver(post_save, sender=CallRecord)
+@receiver(post_delete, sender=CallRecord)
+@receiver(post_save, sender=DTMFSequence)
+@receiver(post_delete, sender=DTMFSequence)
+@receiver(post_save, sender=CallQueue)
+@receiver(post_delete, sender=CallQueue)
+def _phone_child_changed(sender, instance, **kwargs):
+    # Счетчики номера в списке тоже меняются
+    invalidate(PHONES, phone_scope(instance.phone_number_id))
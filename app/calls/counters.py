@@ -0,0 +1,131 @@
+"""
+Денормализованные счетчики PhoneNumber: звонки, транскрипции, исследованные ветки, очередь.
+
+Одиночные сохранения и удаления через ORM обновляют счетчики сигналами атомарным
+F()-инкрементом. Массовые операции (bulk_create, bulk_update, update, raw SQL)
+сигналов не отправляют, поэтому после них вызывается refresh_counters() для
+затронутых номеров. queryset.delete() из-за обработчиков post_delete загружает
+каждую строку и отправляет сигнал на каждую; для больших пачек CallRecord
+удаляются одним DELETE через cursor.execute() и затем вызывается refresh_counters().
+Вместе со счетчиками обновляется updated_at, от которого зависит ETag списка номеров,
+и сбрасывается кэш ответов этих номеров.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Now
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import caching
+from .models import PhoneNumber, CallRecord, DTMFSequence, CallQueue
+
+
+def _increment(phone_id, **deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    PhoneNumber.objects.filter(pk=phone_id).update(
+        updated_at=Now(),
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def _count(model, **filters):
+    """Подзапрос COUNT(*) строк модели для текущего номера."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(phone_number=OuterRef('pk'), **filters)
+            .order_by()
+            .values('phone_number')
+            .annotate(total=Count('*'))
+            .values('total'),
+            output_field=IntegerField()
+        ),
+        Value(0)
+    )
+
+
+def refresh_counters(phone_ids=None):
+    """
+    Пересчитывает счетчики одним UPDATE.
+
+    Args:
+        phone_ids: ID номеров; None - все номера
+    """
+    phones = PhoneNumber.objects.all()
+    if phone_ids is not None:
+        phone_ids = set(phone_ids)
+        if not phone_ids:
+            return 0
+        phones = phones.filter(id__in=phone_ids)
+    caching.invalidate_phones(phone_ids)
+    return phones.update(
+        call_count=_count(CallRecord),
+        transcribed_count=_count(CallRecord, transcription__isnull=False),
+        explored_count=_count(DTMFSequence, explored=True),
+        queue_depth=_count(CallQueue),
+        updated_at=Now(),
+    )
+
+
+# Запоминаем состояние при загрузке, чтобы при сохранении считать только изменения.
+# Отложенные (deferred) поля не трогаем: save() их тоже не записывает.
+
+@receiver(post_init, sender=CallRecord)
+def _remember_transcription(sender, instance, **kwargs):
+    instance._counted_transcribed = instance.__dict__.get('transcription') is not None
+
+
+@receiver(post_init, sender=DTMFSequence)
+def _remember_explored(sender, instance, **kwargs):
+    instance._counted_explored = bool(instance.__dict__.get('explored'))
+
+
+@receiver(post_save, sender=CallRecord)
+def _call_record_saved(sender, instance, created, **kwargs):
+    transcribed = instance.__dict__.get('transcription') is not None
+    _increment(
+        instance.phone_number_id,
+        call_count=1 if created else 0,
+        transcribed_count=int(transcribed) - int(False if created else instance._counted_transcribed),
+    )
+    instance._counted_transcribed = transcribed
+
+
+@receiver(post_delete, sender=CallRecord)
+def _call_record_deleted(sender, instance, **kwargs):
+    if 'transcription' not in instance.__dict__:
+        # Запись загружена без транскрипции (only/defer): счетчики пересчитываются
+        refresh_counters([instance.phone_number_id])
+        return
+    _increment(
+        instance.phone_number_id,
+        call_count=-1,
+        transcribed_count=-1 if instance._counted_transcribed else 0,
+    )
+
+
+@receiver(post_save, sender=DTMFSequence)
+def _dtmf_sequence_saved(sender, instance, created, **kwargs):
+    explored = bool(instance.__dict__.get('explored'))
+    _increment(
+        instance.phone_number_id,
+        explored_count=int(explored) - int(False if created else instance._counted_explored),
+    )
+    instance._counted_explored = explored
+
+
+@receiver(post_delete, sender=DTMFSequence)
+def _dtmf_sequence_deleted(sender, instance, **kwargs):
+    if instance._counted_explored:
+        _increment(instance.phone_number_id, explored_count=-1)
+
+
+@receiver(post_save, sender=CallQueue)
+def _queue_item_saved(sender, instance, created, **kwargs):
+    if created:
+        _increment(instance.phone_number_id, queue_depth=1)
+
+
+@receiver(post_delete, sender=CallQueue)
+def _queue_item_deleted(sender, instance, **kwargs):
+    _increment(instance.phone_number_id, queue_depth=-1)
@@ -0,0 +1,173 @@
+"""
+Диспетчер, запускающий задачи сразу при появлении работы.
+
+Сигналы моделей (и массовые операции явным вызовом wake) после коммита кладут
+токен в список Redis calls:wake:<вид работы>. Диспетчер (manage.py run_dispatcher)
+ждет токены через BLPOP и сразу ставит соответствующие задачи Celery:
+
+- call_queue: один токен на элемент очереди звонков, одна задача process_call_queue на токен;
+- остальные виды объединяются: сколько бы токенов ни пришло, ставится одна задача.
+
+Новая запись будит только транскрибацию (enqueue_pending_transcriptions): пересчет
+summary и исследование DTMF из process_unprocessed_recordings остаются на расписании
+Beat, иначе каждая запись запускала бы запросы к LLM по всем затронутым номерам.
+
+Пока токенов нет, диспетчер сам проверяет базу с экспоненциально растущим
+интервалом (от DISPATCHER_MIN_IDLE до DISPATCHER_MAX_IDLE секунд) и ставит задачи,
+только если очередь Celery для них пуста. Celery Beat с редкими интервалами
+остается страховкой на случай остановки диспетчера.
+"""
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .models import PhoneNumber, CallRecord, CallQueue, SMSMessage
+
+logger = logging.getLogger('calls.dispatcher')
+
+KEY_PREFIX = 'calls:wake'
+
+# Вид работы -> задача; для call_queue задача ставится на каждый токен
+KINDS = {
+    'call_queue': 'process_call_queue',
+    'new_phones': 'process_new_phones',
+    'recordings': 'enqueue_pending_transcriptions',
+    'sms': 'process_sms_messages',
+}
+PER_ITEM_KINDS = {'call_queue'}
+
+# Сколько токенов забирается из списка за один запрос
+DRAIN_BATCH = 100
+
+
+def _key(kind):
+    return f"{KEY_PREFIX}:{kind}"
+
+
+def wake(kind, count=1):
+    """Будит диспетчер после коммита текущей транзакции."""
+    if not settings.DISPATCHER_ENABLED or count <= 0:
+        return
+
+    def push():
+        try:
+            metrics.get_redis().rpush(_key(kind), *([1] * count))
+        except redis.RedisError as e:
+            # Работу подберет периодическая проверка диспетчера или Celery Beat
+            logger.warning(f"Failed to wake dispatcher for {kind}: {str(e)}")
+
+    transaction.on_commit(push)
+
+
+def _task_queue(kind):
+    route = settings.CELERY_TASK_ROUTES.get(f"calls.tasks.{KINDS[kind]}", {})
+    return route.get('queue', settings.CELERY_TASK_DEFAULT_QUEUE)
+
+
+def _pending_work(client):
+    """
+    Проверка базы на случай потерянных токенов: сколько задач каждого вида нужно поставить.
+
+    Виды, для которых в очереди Celery уже есть задачи, пропускаются, чтобы не ставить
+    дубли работы, которая просто еще не дошла до воркера. Записи без транскрипции не
+    проверяются: неудачные транскрипции остаются в базе и будили бы диспетчер постоянно.
+    """
+    work = {
+        'call_queue': min(CallQueue.objects.filter(status='pending').count(), settings.DISPATCHER_MAX_BATCH),
+        'new_phones': int(PhoneNumber.objects.filter(status='new').exists()),
+        'sms': int(SMSMessage.objects.filter(Q(response_text__isnull=True) | Q(response_text='')).exists()),
+    }
+    return {kind: count for kind, count in work.items() if count and not client.llen(_task_queue(kind))}
+
+
+def _dispatch(work):
+    from . import tasks
+
+    for kind, count in work.items():
+        if not count:
+            continue
+        task = getattr(tasks, KINDS[kind])
+        for _ in range(count if kind in PER_ITEM_KINDS else 1):
+            task.delay()
+        metrics.inc('calls_dispatcher_wakeups_total', kind=kind)
+        logger.info(f"Dispatched {task.name} x{count if kind in PER_ITEM_KINDS else 1} for {kind}")
+
+
+def _drain(client, work):
+    """Забирает оставшиеся токены всех видов без ожидания."""
+    pipe = client.pipeline(transaction=False)
+    for kind in KINDS:
+        pipe.lpop(_key(kind), DRAIN_BATCH)
+    for kind, tokens in zip(KINDS, pipe.execute()):
+        if tokens:
+            work[kind] = work.get(kind, 0) + len(tokens)
+    work['call_queue'] = min(work.get('call_queue', 0), settings.DISPATCHER_MAX_BATCH)
+    return work
+
+
+def run(client=None, iterations=None):
+    """
+    Главный цикл диспетчера.
+
+    Args:
+        client: Клиент Redis без таймаута чтения (BLPOP ждет дольше обычного таймаута)
+        iterations: Ограничение числа итераций (для отладки)
+    """
+    client = client or redis.Redis.from_url(settings.METRICS_REDIS_URL)
+    keys = [_key(kind) for kind in KINDS]
+    idle = settings.DISPATCHER_MIN_IDLE
+
+    # При старте разбираем все, что накопилось, пока диспетчер не работал; проверка базы
+    # покрывает старые токены, поэтому они сбрасываются, чтобы не ставить задачи дважды
+    client.delete(*keys)
+    _dispatch(_pending_work(client))
+
+    while iterations is None or iterations > 0:
+        if iterations is not None:
+            iterations -= 1
+
+        result = client.blpop(keys, timeout=idle)
+        if result is None:
+            # Тишина: проверяем базу и увеличиваем интервал ожидания
+            work = _pending_work(client)
+            if work:
+                _dispatch(work)
+                idle = settings.DISPATCHER_MIN_IDLE
+            else:
+                idle = min(idle * 2, settings.DISPATCHER_MAX_IDLE)
+            continue
+
+        key = result[0].decode()
+        kind = key.rsplit(':', 1)[1]
+        _dispatch(_drain(client, {kind: 1}))
+        idle = settings.DISPATCHER_MIN_IDLE
+
+
+@receiver(post_save, sender=CallQueue)
+def _queue_item_created(sender, instance, created, **kwargs):
+    if created and instance.status == 'pending':
+        wake('call_queue')
+
+
+@receiver(post_save, sender=PhoneNumber)
+def _phone_saved(sender, instance, created, **kwargs):
+    if instance.status == 'new':
+        wake('new_phones')
+
+
+@receiver(post_save, sender=CallRecord)
+def _call_record_created(sender, instance, created, **kwargs):
+    if created and instance.transcription is None:
+        wake('recordings')
+
+
+@receiver(post_save, sender=SMSMessage)
+def _sms_created(sender, instance, created, **kwargs):
+    if created:
+        wake('sms')
@@ -0,0 +1,149 @@
+"""
+Живая лента изменений статусов для дашборда.
+
+Сигналы моделей публикуют изменения PhoneNumber, CallQueue и CallRecord в канал
+Redis pub/sub после коммита транзакции; представление events отдает их
+браузерам как server-sent events. Клиенты получают только изменения (со старым
+и новым статусом) и не опрашивают базу.
+"""
+import json
+import logging
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .models import PhoneNumber, CallRecord, CallQueue
+
+logger = logging.getLogger('calls.events')
+
+CHANNEL = 'calls:events'
+
+# Интервал keepalive-комментариев, чтобы прокси не закрывали простаивающее соединение
+HEARTBEAT_SECONDS = 15
+
+
+def publish(event_type, **payload):
+    """Публикует событие после коммита текущей транзакции."""
+    message = json.dumps({'type': event_type, **payload})
+
+    def send():
+        try:
+            metrics.get_redis().publish(CHANNEL, message)
+        except redis.RedisError as e:
+            logger.debug(f"Failed to publish {event_type} event: {str(e)}")
+
+    transaction.on_commit(send)
+
+
+def publish_bulk(status, count):
+    """
+    Одно событие на массовое изменение номеров (bulk_create, update()), которое не
+    отправляет сигналы: клиент перечитывает счетчик очереди и первую страницу списка.
+    """
+    if count:
+        publish('phones', status=status, count=count)
+
+
+def stream():
+    """Генератор потока text/event-stream для StreamingHttpResponse."""
+    # Отдельное соединение без socket_timeout: подписка простаивает дольше общего таймаута
+    client = redis.Redis.from_url(settings.METRICS_REDIS_URL)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CHANNEL)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            message = pubsub.get_message(timeout=HEARTBEAT_SECONDS)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            data = message['data'].decode()
+            event_type = json.loads(data).get('type', 'message')
+            yield f"event: {event_type}\ndata: {data}\n\n"
+    finally:
+        pubsub.close()
+        client.close()
+
+
+async def astream():
+    """Асинхронная версия stream() для ASGI: соединение не занимает поток на время подписки."""
+    client = redis.asyncio.Redis.from_url(settings.METRICS_REDIS_URL)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(CHANNEL)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            message = await pubsub.get_message(timeout=HEARTBEAT_SECONDS)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            data = message['data'].decode()
+            event_type = json.loads(data).get('type', 'message')
+            yield f"event: {event_type}\ndata: {data}\n\n"
+    finally:
+        await pubsub.close()
+        await client.close()
+
+
+@receiver(post_init, sender=PhoneNumber)
+@receiver(post_init, sender=CallQueue)
+def _remember_status(sender, instance, **kwargs):
+    instance._published_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=PhoneNumber)
+def _phone_saved(sender, instance, created, **kwargs):
+    if not created and instance.status == instance._published_status:
+        return
+    publish(
+        'phone',
+        id=instance.id,
+        number=instance.number,
+        status=instance.status,
+        previous_status=None if created else instance._published_status,
+    )
+    instance._published_status = instance.status
+
+
+@receiver(post_delete, sender=PhoneNumber)
+def _phone_deleted(sender, instance, **kwargs):
+    publish('phone', id=instance.id, number=instance.number, status=None, previous_status=instance.status)
+
+
+@receiver(post_save, sender=CallQueue)
+def _queue_item_saved(sender, instance, created, **kwargs):
+    if not created and instance.status == instance._published_status:
+        return
+    publish(
+        'queue',
+        id=instance.id,
+        phone_id=instance.phone_number_id,
+        status=instance.status,
+        previous_status=None if created else instance._published_status,
+    )
+    instance._published_status = instance.status
+
+
+@receiver(post_delete, sender=CallQueue)
+def _queue_item_deleted(sender, instance, **kwargs):
+    publish('queue', id=instance.id, phone_id=instance.phone_number_id, status=None,
+            previous_status=instance.status)
+
+
+@receiver(post_init, sender=CallRecord)
+def _remember_transcribed(sender, instance, **kwargs):
+    instance._published_transcribed = instance.__dict__.get('transcription') is not None
+
+
+@receiver(post_save, sender=CallRecord)
+def _call_record_saved(sender, instance, created, **kwargs):
+    transcribed = instance.__dict__.get('transcription') is not None
+    if created or transcribed != instance._published_transcribed:
+        publish('record', id=instance.id, phone_id=instance.phone_number_id,
+                created=created, transcribed=transcribed)
+    instance._published_transcribed = transcribed
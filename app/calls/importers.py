@@ -0,0 +1,209 @@
+"""
+Массовый импорт номеров из CSV, NDJSON или текста без обращения к LLM.
+
+Файл читается потоково, номера нормализуются локально (NANP/E.164) в тот же
+формат, что возвращает PhoneNumberExtractor: только цифры, без "+", для
+США/Канады с префиксом 1. Вставка идет пачками: на пачку один SELECT
+существующих номеров, один bulk_create и один UPDATE для повторной постановки
+уже обработанных номеров. После каждой пачки отдается прогресс.
+"""
+import codecs
+import csv
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Now
+
+from . import caching, dispatcher, events
+from .models import PhoneNumber
+
+logger = logging.getLogger('calls.import')
+
+FORMATS = ('csv', 'ndjson', 'text')
+
+# Колонки CSV и ключи NDJSON, в которых ищется номер
+NUMBER_FIELDS = ('number', 'phone', 'phone_number', 'telephone', 'tel')
+
+# Кандидат в номера внутри произвольного текста (не переходит через перевод строки)
+CANDIDATE_RE = re.compile(r'[+(]?\d[\d \t().-]{5,}\d')
+
+# Номер NANP без кода страны: код зоны и код станции не начинаются с 0 или 1
+NANP_RE = re.compile(r'^[2-9]\d{2}[2-9]\d{6}$')
+
+# Фрагмент текста, который по форме точно номер: группы 3-3-4 с разделителями или скобками
+# (с необязательным кодом страны 1) либо явный международный префикс "+"/"00". Даты, время,
+# номера заказов и счетов под эту форму не подходят
+PHONE_SHAPE_RE = re.compile(
+    r'^(?:(?:\+|00)\d[\d \t().-]*\d'
+    r'|(?:\+?1[ \t.-]?)?(?:\(\d{3}\)[ \t]?|\d{3}[ \t.-])\d{3}[ \t.-]\d{4})$'
+)
+
+
+def normalize_number(raw):
+    """
+    Приводит номер к цифрам E.164 без "+".
+
+    Десятизначные номера считаются номерами NANP и получают префикс 1.
+    Номера в международном формате ("+" или "00") принимаются длиной от 8 до 15 цифр.
+
+    Returns:
+        str: Нормализованный номер или None, если строка не похожа на номер
+    """
+    raw = str(raw).strip()
+    international = raw.startswith('+') or raw.startswith('00')
+    digits = re.sub(r'\D', '', raw)
+    if raw.startswith('00'):
+        digits = digits[2:]
+
+    if len(digits) == 10 and not international and NANP_RE.match(digits):
+        return '1' + digits
+    if len(digits) == 11 and digits.startswith('1'):
+        return digits if NANP_RE.match(digits[1:]) else None
+    if international and 8 <= len(digits) <= 15 and not digits.startswith('0'):
+        return digits
+    return None
+
+
+def is_phone_shaped(raw):
+    """Похож ли фрагмент текста на номер по форме записи (см. PHONE_SHAPE_RE)."""
+    return bool(PHONE_SHAPE_RE.match(str(raw).strip()))
+
+
+def detect_format(filename):
+    """Формат по расширению файла; по умолчанию - текст."""
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'text'
+
+
+def _lines(stream):
+    """Строки текста из бинарного или текстового потока без чтения файла целиком."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    for line in stream:
+        yield decoder.decode(line) if isinstance(line, bytes) else line
+
+
+def _csv_values(lines):
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [index for index, name in enumerate(header) if name.strip().lower() in NUMBER_FIELDS]
+    if not columns:
+        # Заголовка нет: первая строка - данные, номер ищем во всех ячейках
+        yield from header
+    for row in reader:
+        if columns:
+            yield from (row[index] for index in columns if index < len(row))
+        else:
+            yield from row
+
+
+def _ndjson_values(lines):
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed NDJSON line {line_number}")
+            continue
+        if isinstance(item, dict):
+            item = next((item[key] for key in NUMBER_FIELDS if item.get(key)), '')
+        yield item
+
+
+def _text_values(lines):
+    for line in lines:
+        candidates = CANDIDATE_RE.findall(line)
+        if len(candidates) == 1 and candidates[0] == line.strip():
+            # Строка целиком состоит из номера (список номеров по одному на строку)
+            yield candidates[0]
+            continue
+        # Внутри текста берутся только фрагменты в форме номера: LLM при импорте не используется
+        yield from (candidate for candidate in candidates if is_phone_shaped(candidate))
+
+
+def iter_raw_numbers(stream, fmt):
+    """Сырые значения-кандидаты из потока в указанном формате."""
+    lines = _lines(stream)
+    if fmt == 'csv':
+        return _csv_values(lines)
+    if fmt == 'ndjson':
+        return _ndjson_values(lines)
+    if fmt == 'text':
+        return _text_values(lines)
+    raise ValueError(f"Unknown import format: {fmt}")
+
+
+def _save_batch(numbers):
+    """
+    Сохраняет пачку уникальных номеров.
+
+    Returns:
+        tuple: (создано, поставлено в очередь повторно)
+    """
+    with transaction.atomic():
+        existing = set(PhoneNumber.objects.filter(number__in=numbers).values_list('number', flat=True))
+        created = PhoneNumber.objects.bulk_create(
+            [PhoneNumber(number=number, status='new') for number in numbers if number not in existing]
+        )
+        # Как и при извлечении из SMS: завершенные номера снова ставятся в очередь
+        requeued = PhoneNumber.objects.filter(number__in=existing).exclude(
+            status__in=['new', 'processing']
+        ).update(status='new', updated_at=Now())
+        # bulk_create и update() не отправляют сигналы
+        caching.invalidate(caching.PHONES, caching.QUEUE)
+        events.publish_bulk('new', len(created) + requeued)
+        dispatcher.wake('new_phones')
+    return len(created), requeued
+
+
+def import_numbers(stream, fmt, batch_size=None):
+    """
+    Импортирует номера из потока.
+
+    Генератор: после каждой пачки отдает словарь с накопленной статистикой
+    (read, invalid, duplicates, created, requeued), последний - с done=True.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    stats = {'read': 0, 'invalid': 0, 'duplicates': 0, 'created': 0, 'requeued': 0, 'done': False}
+    seen = set()
+    batch = []
+
+    def flush():
+        created, requeued = _save_batch(batch)
+        stats['created'] += created
+        stats['requeued'] += requeued
+        batch.clear()
+
+    for raw in iter_raw_numbers(stream, fmt):
+        stats['read'] += 1
+        number = normalize_number(raw)
+        if number is None:
+            stats['invalid'] += 1
+            continue
+        if number in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(number)
+        batch.append(number)
+        if len(batch) >= batch_size:
+            flush()
+            yield dict(stats)
+
+    if batch:
+        flush()
+    stats['done'] = True
+    logger.info(
+        f"Import finished: {stats['created']} created, {stats['requeued']} requeued, "
+        f"{stats['invalid']} invalid, {stats['duplicates']} duplicates"
+    )
+    yield dict(stats)
@@ -0,0 +1,73 @@
+"""
+Аренды (leases) для идемпотентной постановки задач.
+
+Перед постановкой задачи в очередь берется ключ в Redis через SET NX EX;
+задача снимает его по завершении. Пока ключ существует, повторная постановка
+той же работы (например, периодической задачей) блокируется. TTL страхует от
+«вечных» ключей, если воркер упал, не успев снять аренду.
+
+При недоступности Redis аренда считается полученной: лучше допустить дубль,
+чем остановить конвейер.
+"""
+import logging
+
+import redis
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger('calls.tasks')
+
+KEY_PREFIX = 'calls:lease'
+
+
+def _key(kind, name):
+    return f"{KEY_PREFIX}:{kind}:{name}"
+
+
+def acquire(kind, name, ttl=None):
+    """
+    Берет аренду на единицу работы.
+
+    Returns:
+        bool: True, если аренда получена и задачу можно ставить в очередь
+    """
+    return bool(acquire_many(kind, [name], ttl))
+
+
+def acquire_many(kind, names, ttl=None):
+    """
+    Берет аренды пачкой, за один проход по сети.
+
+    Returns:
+        list: Имена, для которых аренда получена; для остальных работа уже в полете
+    """
+    names = list(names)
+    if not names:
+        return []
+    ttl = ttl or settings.TASK_LEASE_TTL
+    try:
+        pipe = metrics.get_redis().pipeline(transaction=False)
+        for name in names:
+            pipe.set(_key(kind, name), 1, nx=True, ex=ttl)
+        results = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to acquire {kind} leases, scheduling without them: {str(e)}")
+        return names
+
+    acquired = [name for name, ok in zip(names, results) if ok]
+    blocked = len(names) - len(acquired)
+    if blocked:
+        metrics.inc('calls_duplicate_enqueues_blocked_total', blocked, kind=kind)
+        logger.info(f"Blocked {blocked} duplicate {kind} enqueues: work already in flight")
+    return acquired
+
+
+def release(kind, *names):
+    """Снимает аренды после завершения работы."""
+    if not names:
+        return
+    try:
+        metrics.get_redis().delete(*[_key(kind, name) for name in names])
+    except redis.RedisError as e:
+        logger.warning(f"Failed to release {kind} leases: {str(e)}")
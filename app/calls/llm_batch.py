@@ -0,0 +1,424 @@
+"""
+Пакетный анализ через OpenAI-совместимый Batch API.
+
+После изменения промптов (с увеличением DTMF_ANALYZER_VERSION) корпус приходится
+анализировать заново. Вместо тысяч синхронных запросов из analyze_recordings_for_dtmf
+и update_phone_summaries запросы пишутся в JSONL (LLM_BATCH_DIR), файл загружается
+в /files, и создается пакет /batches. API выполняет его в пределах completion window
+по цене и лимитам Batch API, не занимая лимиты живого анализа. Задача poll_llm_batches
+проверяет статус пакетов и сохраняет результаты пачками (bulk_update).
+
+Задачи пакетного анализа идут в отдельную очередь batch с часовыми тайм-аутами:
+запись и загрузка корпуса и применение большого файла результатов не укладываются
+в лимиты housekeeping. Пакет получает статус submitted только после создания в API,
+а номер последней примененной строки сохраняется вместе с каждой пачкой результатов,
+поэтому прерванное применение продолжается со следующей строки.
+
+Виды пакетов:
+- dtmf: анализ меню в транскрипциях без результата текущей версии анализатора
+  и в summary с устаревшим summary_analysis_hash;
+- summary: summary всех номеров с транскрипциями.
+
+Тела запросов те же, что у синхронных вызовов (services.chat_request). custom_id
+содержит хеш входных данных (analysis_input_hash): результат сохраняется, только
+если транскрипция и контекст за время выполнения пакета не изменились, поэтому
+живой анализ и пакет друг другу не мешают.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching, leases, metrics
+from .models import PhoneNumber, CallRecord, LLMBatchJob
+from .services import DTMF_ANALYZER_VERSION, LLM_MODEL, TranscriptionService, analysis_input_hash, chat_request
+
+logger = logging.getLogger('calls.llm_batch')
+
+KINDS = ('dtmf', 'summary')
+ENDPOINT = '/v1/chat/completions'
+
+# Статусы пакета в API, при которых результатов еще нет
+PENDING_STATUSES = {'validating', 'in_progress', 'finalizing', 'cancelling'}
+
+# Строк результата, сохраняемых одним bulk_update
+APPLY_CHUNK_SIZE = 500
+
+# Тайм-ауты HTTP (сек): загрузка файла до 200 МБ занимает заметно больше обычного запроса
+REQUEST_TIMEOUT = 60
+UPLOAD_TIMEOUT = 600
+
+
+class BatchError(Exception):
+    pass
+
+
+def _url(path):
+    return f"{(settings.OPENAI_BASE_URL or 'https://api.openai.com/v1').rstrip('/')}/{path}"
+
+
+def _headers():
+    return {"Authorization": f"Bearer {settings.OPENAI_API_KEY}"}
+
+
+def upload_file(path):
+    """Загружает JSONL с запросами; возвращает id файла."""
+    with open(path, 'rb') as content:
+        response = requests.post(
+            _url('files'),
+            headers=_headers(),
+            data={'purpose': 'batch'},
+            files={'file': (os.path.basename(path), content, 'application/jsonl')},
+            timeout=UPLOAD_TIMEOUT
+        )
+    response.raise_for_status()
+    return response.json()['id']
+
+
+def create_batch(input_file_id, kind):
+    response = requests.post(
+        _url('batches'),
+        headers=_headers(),
+        json={
+            'input_file_id': input_file_id,
+            'endpoint': ENDPOINT,
+            'completion_window': settings.LLM_BATCH_COMPLETION_WINDOW,
+            'metadata': {'kind': kind},
+        },
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def retrieve_batch(batch_id):
+    response = requests.get(_url(f'batches/{batch_id}'), headers=_headers(), timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def iter_file_lines(file_id):
+    """Строки JSONL файла результатов без загрузки файла в память целиком."""
+    with requests.get(_url(f'files/{file_id}/content'), headers=_headers(),
+                      stream=True, timeout=REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+
+def dtmf_requests(force=False):
+    """
+    Запросы анализа меню: (custom_id, messages).
+
+    Args:
+        force: Анализировать все транскрипции и summary, а не только устаревшие
+    """
+    records = CallRecord.objects.filter(transcription__isnull=False)
+    if not force:
+        records = records.filter(Q(analysis_version__isnull=True) | ~Q(analysis_version=DTMF_ANALYZER_VERSION))
+    records = records.only('id', 'transcription', 'dtmf_sequence').order_by('id')
+    for record in records.iterator(chunk_size=2000):
+        sequence_str = TranscriptionService.record_sequence_str(record)
+        input_hash = analysis_input_hash(record.transcription, sequence_str)
+        yield f"record:{record.id}:{input_hash}", TranscriptionService.ivr_menu_messages(record.transcription, sequence_str)
+
+    phones = PhoneNumber.objects.exclude(summary__isnull=True).exclude(summary='')
+    for phone in phones.only('id', 'summary', 'summary_analysis_hash').order_by('id').iterator(chunk_size=2000):
+        input_hash = analysis_input_hash(phone.summary)
+        if force or phone.summary_analysis_hash != input_hash:
+            yield f"summary_dtmf:{phone.id}:{input_hash}", TranscriptionService.summary_dtmf_messages(phone.summary)
+
+
+def summary_requests(force=False):
+    """Запросы summary для всех номеров с транскрипциями: (custom_id, messages); force не влияет."""
+    records = CallRecord.objects.filter(transcription__isnull=False).exclude(transcription='')
+    rows = records.order_by('phone_number_id', '-created_at').values_list(
+        'phone_number_id', 'phone_number__number', 'transcription'
+    )
+    current, number, transcriptions = None, None, []
+    for phone_id, phone_number, transcription in rows.iterator(chunk_size=2000):
+        if phone_id != current:
+            if transcriptions:
+                yield f"summary:{current}", TranscriptionService.summary_messages(number, transcriptions)
+            current, number, transcriptions = phone_id, phone_number, []
+        transcriptions.append(transcription)
+    if transcriptions:
+        yield f"summary:{current}", TranscriptionService.summary_messages(number, transcriptions)
+
+
+REQUEST_BUILDERS = {
+    'dtmf': dtmf_requests,
+    'summary': summary_requests,
+}
+
+
+def write_request_files(kind, force=False):
+    """
+    Пишет запросы в JSONL, начиная новый файл по лимитам LLM_BATCH_MAX_REQUESTS
+    и LLM_BATCH_MAX_BYTES.
+
+    Returns:
+        list: (путь к файлу, количество запросов)
+    """
+    directory = os.path.join(settings.LLM_BATCH_DIR, f"{kind}-{datetime.now():%Y%m%d-%H%M%S}")
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    output, count, size = None, 0, 0
+    for custom_id, messages in REQUEST_BUILDERS[kind](force):
+        line = json.dumps({
+            'custom_id': custom_id,
+            'method': 'POST',
+            'url': ENDPOINT,
+            'body': chat_request(messages),
+        }, ensure_ascii=False).encode() + b'\n'
+        if output is None or count >= settings.LLM_BATCH_MAX_REQUESTS or size + len(line) > settings.LLM_BATCH_MAX_BYTES:
+            if output:
+                output.close()
+                files.append((output.name, count))
+            output = open(os.path.join(directory, f"input-{len(files) + 1:03d}.jsonl"), 'wb')
+            count, size = 0, 0
+        output.write(line)
+        count += 1
+        size += len(line)
+    if output:
+        output.close()
+        files.append((output.name, count))
+    return files
+
+
+def submit(kind, force=False):
+    """
+    Формирует и отправляет пакеты указанного вида.
+
+    Returns:
+        list: Созданные LLMBatchJob (пустой, если анализировать нечего)
+    """
+    if kind not in KINDS:
+        raise BatchError(f"Unknown batch kind: {kind}")
+    # Результаты еще не применены: повторная отправка продублировала бы те же запросы
+    # Пакет, отправка которого прервалась вместе с воркером, так и остался pending
+    interrupted_before = timezone.now() - timedelta(seconds=settings.TASK_QUEUE_TIME_LIMITS['batch'][1])
+    LLMBatchJob.objects.filter(kind=kind, status='pending', created_at__lt=interrupted_before).update(
+        status='failed', error='Submission was interrupted before the batch was created'
+    )
+    if LLMBatchJob.objects.filter(kind=kind, status__in=['pending', 'submitted']).exists():
+        raise BatchError(f"A {kind} batch is already in progress")
+
+    jobs = []
+    for path, count in write_request_files(kind, force):
+        job = LLMBatchJob.objects.create(kind=kind, status='pending', input_file=path, request_count=count)
+        try:
+            job.input_file_id = upload_file(path)
+            batch = create_batch(job.input_file_id, kind)
+            job.batch_id = batch['id']
+            job.batch_status = batch.get('status', '')
+            job.status = 'submitted'
+        except requests.RequestException as e:
+            logger.error(f"Failed to submit {kind} batch from {path}: {str(e)}")
+            job.status = 'failed'
+            job.error = str(e)
+        job.save()
+        jobs.append(job)
+        logger.info(f"Submitted {kind} batch {job.batch_id or job.pk} with {count} requests")
+    return jobs
+
+
+def _parse_line(line):
+    """Содержимое ответа и usage из строки результата; None при ошибке запроса."""
+    response = line.get('response') or {}
+    if line.get('error') or response.get('status_code') != 200:
+        return None, None
+    body = response.get('body') or {}
+    try:
+        return body['choices'][0]['message']['content'], body.get('usage')
+    except (KeyError, IndexError, TypeError):
+        return None, None
+
+
+def _apply_records(results):
+    """results: {record_id: (input_hash, options)}."""
+    records = list(CallRecord.objects.filter(id__in=results).only('id', 'phone_number_id', 'transcription', 'dtmf_sequence'))
+    now = timezone.now()
+    changed = []
+    for record in records:
+        input_hash, options = results[record.id]
+        if analysis_input_hash(record.transcription, TranscriptionService.record_sequence_str(record)) != input_hash:
+            continue
+        record.dtmf_analysis = options
+        record.analysis_version = DTMF_ANALYZER_VERSION
+        record.analysis_input_hash = input_hash
+        record.analyzed_at = now
+        changed.append(record)
+    CallRecord.objects.bulk_update(changed, ['dtmf_analysis', 'analysis_version', 'analysis_input_hash', 'analyzed_at'])
+    return {record.phone_number_id for record in changed}
+
+
+def _apply_summary_analyses(results):
+    """results: {phone_id: (input_hash, options)}."""
+    phones = list(PhoneNumber.objects.filter(id__in=results).only('id', 'summary'))
+    changed = []
+    for phone in phones:
+        input_hash, options = results[phone.id]
+        if analysis_input_hash(phone.summary) != input_hash:
+            continue
+        phone.summary_analysis = options
+        phone.summary_analysis_hash = input_hash
+        changed.append(phone)
+    PhoneNumber.objects.bulk_update(changed, ['summary_analysis', 'summary_analysis_hash'])
+    return {phone.id for phone in changed}
+
+
+def _apply_summaries(results, submitted_at):
+    """results: {phone_id: summary}; summary, обновленное после отправки пакета, не перезаписывается."""
+    phones = list(PhoneNumber.objects.filter(id__in=results).only('id', 'summary_updated_at'))
+    now = timezone.now()
+    changed = []
+    for phone in phones:
+        if phone.summary_updated_at and phone.summary_updated_at > submitted_at:
+            continue
+        phone.summary = results[phone.id]
+        phone.summary_updated_at = now
+        changed.append(phone)
+    PhoneNumber.objects.bulk_update(changed, ['summary', 'summary_updated_at'])
+    return {phone.id for phone in changed}
+
+
+def _apply_chunk(job, lines):
+    records, summary_analyses, summaries = {}, {}, {}
+    usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+    failed = 0
+    for line in lines:
+        content, line_usage = _parse_line(line)
+        if content is None:
+            failed += 1
+            continue
+        for key in usage:
+            usage[key] += (line_usage or {}).get(key) or 0
+
+        kind, object_id, *rest = line['custom_id'].split(':')
+        if kind == 'record':
+            records[int(object_id)] = (rest[0], TranscriptionService.parse_ivr_menu_response(content))
+        elif kind == 'summary_dtmf':
+            summary_analyses[int(object_id)] = (rest[0], TranscriptionService.parse_summary_dtmf_response(content))
+        elif kind == 'summary':
+            summaries[int(object_id)] = content.strip()
+
+    # Один инкремент на пачку вместо двух на каждую строку
+    metrics.record_token_usage(usage, f"batch_{job.kind}", LLM_MODEL)
+
+    phone_ids = set()
+    if records:
+        phone_ids |= _apply_records(records)
+    if summary_analyses:
+        phone_ids |= _apply_summary_analyses(summary_analyses)
+    if summaries:
+        phone_ids |= _apply_summaries(summaries, job.created_at)
+    applied = len(records) + len(summary_analyses) + len(summaries)
+    return phone_ids, applied, failed
+
+
+def _save_chunk(job, lines):
+    """Сохраняет пачку результатов вместе с номером последней примененной строки."""
+    with transaction.atomic():
+        phone_ids, applied, failed = _apply_chunk(job, lines)
+        job.applied_lines += len(lines)
+        job.applied_count += applied
+        job.failed_count += failed
+        job.save(update_fields=['applied_lines', 'applied_count', 'failed_count', 'updated_at'])
+    # bulk_update не отправляет сигналы
+    caching.invalidate_phones(phone_ids)
+    if job.kind == 'dtmf' and phone_ids:
+        # Пересборка ставится сразу: если применение прервется, следующий запуск продолжит
+        # со следующей пачки и уже не узнает о номерах этой
+        from .tasks import enqueue_dtmf_rebuild
+        enqueue_dtmf_rebuild(phone_ids)
+    return phone_ids
+
+
+def apply_results(job, file_id):
+    """
+    Сохраняет результаты пакета пачками по APPLY_CHUNK_SIZE строк, начиная со строки
+    job.applied_lines (после прерванного применения).
+
+    Returns:
+        set: ID номеров, у которых изменились результаты анализа или summary
+    """
+    phone_ids = set()
+    chunk = []
+    for index, line in enumerate(iter_file_lines(file_id)):
+        if index < job.applied_lines:
+            continue
+        chunk.append(line)
+        if len(chunk) >= APPLY_CHUNK_SIZE:
+            phone_ids |= _save_chunk(job, chunk)
+            chunk = []
+    if chunk:
+        phone_ids |= _save_chunk(job, chunk)
+    return phone_ids
+
+
+def poll():
+    """
+    Проверяет отправленные пакеты и сохраняет результаты завершенных.
+    Пересборка карт DTMF ставится по мере применения (см. _save_chunk).
+
+    Returns:
+        dict: {вид пакета: множество ID номеров с новыми результатами}
+    """
+    changed = {kind: set() for kind in KINDS}
+    # Beat ставит проверку каждые 5 минут, а применение большого файла идет дольше
+    if not leases.acquire('llm_batch', 'poll', ttl=settings.TASK_QUEUE_TIME_LIMITS['batch'][1]):
+        logger.info("Another poll of LLM batches is in progress")
+        return changed
+    try:
+        _poll_jobs(changed)
+    finally:
+        leases.release('llm_batch', 'poll')
+    return changed
+
+
+def _poll_jobs(changed):
+    for job in LLMBatchJob.objects.filter(status='submitted').order_by('created_at'):
+        try:
+            batch = retrieve_batch(job.batch_id)
+        except requests.RequestException as e:
+            logger.warning(f"Failed to check batch {job.batch_id}: {str(e)}")
+            continue
+
+        job.batch_status = batch.get('status', '')
+        if job.batch_status in PENDING_STATUSES:
+            job.save(update_fields=['batch_status', 'updated_at'])
+            continue
+
+        job.output_file_id = batch.get('output_file_id') or ''
+        job.error_file_id = batch.get('error_file_id') or ''
+        try:
+            # Истекший или отмененный пакет отдает результаты выполненной части
+            if job.output_file_id:
+                changed[job.kind] |= apply_results(job, job.output_file_id)
+        except requests.RequestException as e:
+            logger.warning(f"Failed to download results of batch {job.batch_id}: {str(e)}")
+            job.save(update_fields=['batch_status', 'output_file_id', 'error_file_id', 'updated_at'])
+            continue
+
+        counts = batch.get('request_counts') or {}
+        job.failed_count = max(job.failed_count, counts.get('failed') or 0)
+        job.completed_at = timezone.now()
+        if job.batch_status == 'completed':
+            job.status = 'applied'
+        else:
+            # Необработанные запросы попадут в следующий пакет: их результаты остались устаревшими
+            job.status = 'failed'
+            job.error = json.dumps(batch.get('errors') or {'status': job.batch_status})
+        job.save()
+        logger.info(
+            f"Batch {job.batch_id} ({job.kind}) {job.batch_status}: {job.applied_count} results applied, "
+            f"{job.failed_count} failed"
+        )
@@ -0,0 +1,141 @@
+"""
+Неблокирующее структурированное логирование.
+
+Логгеры calls.* пишут в QueueHandler: в вызывающем потоке подставляются аргументы
+сообщения (изменяемые объекты иначе попали бы в лог в более позднем состоянии)
+и запись кладется в очередь в памяти, а JSON или текст собирает и выводит в stdout
+фоновый поток QueueListener. Вывод - JSON-строка на запись (LOG_FORMAT=json) или цветной текст
+для локальной разработки (LOG_FORMAT=text).
+
+Подключается через settings.LOGGING. Сообщения с большими данными (ответы
+LLM и API) пишутся на уровне DEBUG с %-аргументами, чтобы при выключенном
+уровне не тратить время даже на форматирование строки.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import weakref
+from datetime import datetime, timezone
+
+from celery.signals import worker_process_shutdown
+
+# Атрибуты LogRecord, которые не являются пользовательскими полями из extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Обработчики процесса, чьи listener нужно остановить при завершении дочернего процесса Celery
+_handlers = weakref.WeakSet()
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra= попадают в объект как есть."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _current_task_id():
+    if 'celery' not in sys.modules:
+        return None
+    from celery import current_task
+    return getattr(getattr(current_task, 'request', None), 'id', None)
+
+
+def _text_formatter():
+    import colorlog
+    return colorlog.ColoredFormatter(
+        '%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s%(reset)s',
+        log_colors={
+            'DEBUG': 'cyan',
+            'INFO': 'green',
+            'WARNING': 'yellow',
+            'ERROR': 'red',
+            'CRITICAL': 'red,bg_white',
+        },
+    )
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler со своим QueueListener, создаваемым из settings.LOGGING.
+
+    Listener запускается при первой записи в процессе и перезапускается в дочерних
+    процессах после fork (воркеры Celery prefork): поток из родителя в них не живет.
+    Дочерние процессы prefork завершаются без atexit, поэтому listener в них
+    останавливается по сигналу worker_process_shutdown.
+    """
+
+    def __init__(self, format='json', level=logging.NOTSET):
+        super().__init__(queue.SimpleQueue())
+        self.setLevel(level)
+        self.output_format = format
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        _handlers.add(self)
+
+    def _start_listener(self):
+        self.queue = queue.SimpleQueue()
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter() if self.output_format == 'json' else _text_formatter())
+        self._listener = logging.handlers.QueueListener(self.queue, stream, respect_handler_level=False)
+        self._listener.start()
+        self._pid = os.getpid()
+        atexit.register(self.stop_listener)
+
+    def stop_listener(self):
+        """Выводит оставшиеся в очереди записи и останавливает listener текущего процесса."""
+        with self._start_lock:
+            listener = self._listener
+            if listener is None or self._pid != os.getpid():
+                return
+            self._listener, self._pid = None, None
+        listener.stop()
+
+    def prepare(self, record):
+        # Аргументы подставляются сейчас, а JSON или текст собирает listener.
+        # Копия нужна, чтобы не менять запись для других обработчиков.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Traceback ссылается на кадры вызывающего потока: форматируем его здесь
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        # ID задачи Celery берется здесь, потому что в потоке listener текущей задачи нет
+        task_id = _current_task_id()
+        if task_id:
+            record.task_id = task_id
+        return record
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._start_listener()
+        super().emit(record)
+
+
+@worker_process_shutdown.connect
+def _stop_listeners(**kwargs):
+    for handler in list(_handlers):
+        handler.stop_listener()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from calls import retention
+
+
+class Command(BaseCommand):
+    help = 'Применяет политики хранения записей звонков (секции, архив, удаление)'
+
+    def handle(self, *args, **options):
+        result = retention.apply_retention()
+        for key, value in result.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calls import importers
+
+
+class Command(BaseCommand):
+    help = 'Импортирует номера из CSV, NDJSON или текстового файла без обращения к LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к файлу или '-' для stdin")
+        parser.add_argument('--format', choices=importers.FORMATS,
+                            help='Формат файла (по умолчанию определяется по расширению)')
+        parser.add_argument('--batch-size', type=int, help='Номеров в одной пачке вставки')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or importers.detect_format(path)
+        try:
+            stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        try:
+            for stats in importers.import_numbers(stream, fmt, options['batch_size']):
+                self.stdout.write(
+                    f"read {stats['read']}, created {stats['created']}, requeued {stats['requeued']}, "
+                    f"invalid {stats['invalid']}, duplicates {stats['duplicates']}"
+                )
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS('Import finished'))
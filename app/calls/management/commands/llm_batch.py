@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from calls import llm_batch
+from calls.models import LLMBatchJob
+
+
+class Command(BaseCommand):
+    help = 'Повторный анализ корпуса через Batch API: отправка пакетов, проверка и применение результатов'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+        submit = subparsers.add_parser('submit', help='Сформировать и отправить пакеты')
+        submit.add_argument('kind', choices=llm_batch.KINDS)
+        submit.add_argument('--force', action='store_true',
+                            help='dtmf: анализировать все транскрипции, а не только устаревшие')
+        subparsers.add_parser('poll', help='Проверить пакеты и применить результаты завершенных')
+        subparsers.add_parser('status', help='Показать последние пакеты')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'submit':
+            try:
+                jobs = llm_batch.submit(options['kind'], options['force'])
+            except llm_batch.BatchError as e:
+                raise CommandError(str(e))
+            if not jobs:
+                self.stdout.write('Nothing to analyze')
+            for job in jobs:
+                self.stdout.write(f"{job.batch_id or job.pk}: {job.request_count} requests, {job.status}")
+        elif action == 'poll':
+            # Пересборку карт DTMF poll() ставит сам по мере применения результатов
+            changed = llm_batch.poll()
+            self.stdout.write(
+                f"DTMF results for {len(changed['dtmf'])} phones, summaries for {len(changed['summary'])} phones"
+            )
+        self._status()
+
+    def _status(self):
+        for job in LLMBatchJob.objects.all()[:20]:
+            self.stdout.write(
+                f"{job.created_at:%Y-%m-%d %H:%M} {job.kind:<8} {job.status:<10} {job.batch_status or '-':<12} "
+                f"{job.request_count} requests, {job.applied_count} applied, {job.failed_count} failed"
+                f"{'  ' + job.batch_id if job.batch_id else ''}"
+            )
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from calls import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Запускает бенчмарки периодических задач и API на отдельной тестовой базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--numbers', type=int, default=10000, help='Количество телефонных номеров')
+        parser.add_argument('--records', type=int, default=1000000, help='Количество записей звонков')
+        parser.add_argument('--deep-numbers', type=int, default=100, help='Номеров с полным деревом DTMF')
+        parser.add_argument('--tree-depth', type=int, default=4)
+        parser.add_argument('--tree-breadth', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=3, help='Повторов каждой операции')
+        parser.add_argument('--only', nargs='*', help='Запустить только указанные операции')
+        parser.add_argument('--output', default='benchmark-results.json', help='Куда сохранить отчет')
+        parser.add_argument('--compare', help='Базовый отчет для поиска регрессий')
+        parser.add_argument('--threshold', type=float, default=1.2, help='Допустимый рост метрик')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять тестовую базу и переиспользовать уже заполненные данные')
+
+    def handle(self, *args, **options):
+        scale = {
+            'numbers': options['numbers'],
+            'records': options['records'],
+            'deep_numbers': options['deep_numbers'],
+            'tree_depth': options['tree_depth'],
+            'tree_breadth': options['tree_breadth'],
+        }
+
+        # Бенчмарки никогда не трогают рабочую базу
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb']
+        )
+        try:
+            from calls.models import PhoneNumber
+            if not PhoneNumber.objects.exists():
+                benchmarks.seed(stdout=self.stdout, **scale)
+
+            results = benchmarks.run(only=options['only'], repeat=options['repeat'])
+            report = benchmarks.build_report(results, scale)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f"{name:35} {result['wall_time_s']:>10.4f}s {result['queries']:>7} queries "
+                f"{result['peak_memory_kb']:>10.1f} KB"
+            )
+        self.stdout.write(f"Report saved to {options['output']}")
+
+        if options['compare']:
+            regressions = benchmarks.compare(report, benchmarks.load_report(options['compare']), options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f"{len(regressions)} performance regressions found")
+            self.stdout.write("No regressions against baseline")
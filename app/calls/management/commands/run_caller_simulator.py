@@ -0,0 +1,47 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from calls.simulator import CallerSimulator, build_tree, run_simulator
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальный симулятор сервера обзвона и OpenAI-совместимого API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=settings.CALLER_SERVER_PORT)
+        parser.add_argument('--spool-dir', default=settings.ASTERISK_RECORDING_PATH,
+                            help='Куда писать синтетические записи')
+        parser.add_argument('--trees', help='JSON файл с деревьями IVR: {"default": узел, "numbers": {"номер": узел}}')
+        parser.add_argument('--depth', type=int, default=2, help='Глубина синтетического дерева')
+        parser.add_argument('--breadth', type=int, default=3, help='Количество опций в каждом меню')
+        parser.add_argument('--latency', type=float, default=0.0, help='Средняя длительность звонка, сек')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Разброс длительности звонка, сек')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Доля звонков, завершающихся ошибкой')
+        parser.add_argument('--replay-dir', default=None,
+                            help='Писать фикстуры для TRANSCRIPTION_BACKEND=replay в эту директорию')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        tree = build_tree(options['depth'], options['breadth'])
+        trees = {}
+        if options['trees']:
+            with open(options['trees']) as trees_file:
+                config = json.load(trees_file)
+            tree = config.get('default', tree)
+            trees = config.get('numbers', {})
+
+        simulator = CallerSimulator(
+            spool_dir=options['spool_dir'],
+            tree=tree,
+            trees=trees,
+            latency=options['latency'],
+            jitter=options['jitter'],
+            failure_rate=options['failure_rate'],
+            replay_dir=options['replay_dir'],
+            seed=options['seed'],
+        )
+        self.stdout.write(f"Caller simulator on {options['host']}:{options['port']}, stats at /stats")
+        run_simulator(simulator, options['host'], options['port'])
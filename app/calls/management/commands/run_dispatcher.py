@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from calls import dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Запускает диспетчер, ставящий задачи Celery сразу при появлении работы'
+
+    def handle(self, *args, **options):
+        if not settings.DISPATCHER_ENABLED:
+            raise CommandError('DISPATCHER_ENABLED=false: сигналы не будят диспетчер, включите его в окружении')
+        self.stdout.write('Dispatcher started')
+        try:
+            dispatcher.run()
+        except KeyboardInterrupt:
+            self.stdout.write('Dispatcher stopped')
@@ -0,0 +1,225 @@
+"""
+Метрики задержек и пропускной способности по стадиям конвейера.
+
+Значения хранятся в Redis, поэтому агрегируются по всем процессам web и
+Celery воркеров. Эндпоинт /metrics отдает их в текстовом формате Prometheus.
+Ошибки Redis никогда не прерывают основную работу: метрика просто теряется.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+import redis
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+
+logger = logging.getLogger('calls.metrics')
+
+KEY_PREFIX = 'calls:metrics'
+
+# Границы бакетов гистограмм в секундах: от быстрых запросов к БД до долгих звонков
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Имя метрики -> (тип, описание)
+METRICS = {
+    'calls_stage_duration_seconds': ('histogram', 'Duration of pipeline stages'),
+    'calls_stage_total': ('counter', 'Pipeline stage executions by outcome'),
+    'calls_task_duration_seconds': ('histogram', 'Duration of Celery tasks'),
+    'calls_task_total': ('counter', 'Celery task executions by state'),
+    'calls_llm_tokens_total': ('counter', 'LLM token usage'),
+    'calls_queue_depth': ('gauge', 'Number of items waiting in work queues'),
+    'calls_duplicate_enqueues_blocked_total': ('counter', 'Enqueues skipped because the work was already in flight'),
+    'calls_cache_requests_total': ('counter', 'Response cache lookups by result (hit/miss)'),
+    'calls_dispatcher_wakeups_total': ('counter', 'Tasks dispatched by the wake-on-work dispatcher'),
+}
+
+_client = None
+
+
+def get_redis():
+    """Общий клиент Redis для метрик и служебных ключей (пул соединений на процесс)."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.METRICS_REDIS_URL,
+            socket_timeout=1,
+            socket_connect_timeout=1
+        )
+    return _client
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+def _key(name):
+    return f"{KEY_PREFIX}:{name}"
+
+
+def inc(name, amount=1, **labels):
+    """Увеличивает счетчик."""
+    if not settings.METRICS_ENABLED:
+        return
+    try:
+        get_redis().hincrbyfloat(_key(name), _labels(labels), amount)
+    except redis.RedisError as e:
+        logger.debug(f"Failed to record metric {name}: {str(e)}")
+
+
+def set_gauge(name, value, **labels):
+    """Устанавливает значение gauge."""
+    if not settings.METRICS_ENABLED:
+        return
+    try:
+        get_redis().hset(_key(name), _labels(labels), value)
+    except redis.RedisError as e:
+        logger.debug(f"Failed to record metric {name}: {str(e)}")
+
+
+def observe(name, value, **labels):
+    """Добавляет наблюдение в гистограмму (бакеты хранятся накопительно)."""
+    if not settings.METRICS_ENABLED:
+        return
+    label_str = _labels(labels)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        key = _key(name)
+        for bound in DEFAULT_BUCKETS:
+            if value <= bound:
+                pipe.hincrby(key, f"{label_str}|{bound}", 1)
+        pipe.hincrby(key, f"{label_str}|+Inf", 1)
+        pipe.hincrbyfloat(key, f"{label_str}|sum", value)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.debug(f"Failed to record metric {name}: {str(e)}")
+
+
+@contextmanager
+def timed(stage, **labels):
+    """
+    Замеряет длительность стадии конвейера.
+
+    Исключение внутри блока засчитывается как outcome="error" и пробрасывается дальше.
+    """
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        observe('calls_stage_duration_seconds', time.perf_counter() - started, stage=stage, **labels)
+        inc('calls_stage_total', stage=stage, outcome=outcome, **labels)
+
+
+def record_token_usage(usage, operation, model='gpt-4o-mini'):
+    """
+    Учитывает расход токенов LLM.
+
+    Args:
+        usage: Объект usage из ответа openai или словарь из JSON ответа
+        operation: Название операции (analyze_ivr_menu, create_summary, ...)
+    """
+    if not usage:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        value = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if value:
+            inc('calls_llm_tokens_total', value, model=model, operation=operation, kind=kind.split('_')[0])
+
+
+def llm_call(operation, create, **request):
+    """
+    Выполняет запрос к LLM, замеряя длительность и учитывая расход токенов.
+
+    Пример: metrics.llm_call('analyze_ivr_menu', client.chat.completions.create, model=..., messages=...)
+    """
+    with timed('llm', operation=operation):
+        response = create(**request)
+    record_token_usage(getattr(response, 'usage', None), operation, request.get('model', 'gpt-4o-mini'))
+    return response
+
+
+async def allm_call(operation, create, **request):
+    """Асинхронная версия llm_call для клиента openai.AsyncOpenAI."""
+    with timed('llm', operation=operation):
+        response = await create(**request)
+    record_token_usage(getattr(response, 'usage', None), operation, request.get('model', 'gpt-4o-mini'))
+    return response
+
+
+def collect_queue_depth():
+    """Обновляет gauge глубины очередей: очередь звонков, записи без транскрипции, брокер Celery."""
+    from django.db.models import Count
+    from .models import CallQueue, CallRecord
+
+    depth = {status: 0 for status, _ in CallQueue.STATUS_CHOICES}
+    for row in CallQueue.objects.values('status').annotate(total=Count('id')):
+        depth[row['status']] = row['total']
+    for status, total in depth.items():
+        set_gauge('calls_queue_depth', total, queue=f"call_queue_{status}")
+    set_gauge(
+        'calls_queue_depth',
+        CallRecord.objects.filter(transcription__isnull=True).count(),
+        queue='untranscribed_recordings'
+    )
+    try:
+        for queue in settings.TASK_QUEUE_TIME_LIMITS:
+            set_gauge('calls_queue_depth', get_redis().llen(queue), queue=f"celery_{queue}")
+    except redis.RedisError as e:
+        logger.debug(f"Failed to read broker queue length: {str(e)}")
+
+
+def render():
+    """Возвращает все метрики в текстовом формате Prometheus."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for name in METRICS:
+            pipe.hgetall(_key(name))
+        stored = pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Failed to read metrics: {str(e)}")
+        stored = [{} for _ in METRICS]
+
+    lines = []
+    for (name, (metric_type, help_text)), values in zip(METRICS.items(), stored):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        values = {field.decode(): float(value) for field, value in values.items()}
+
+        if metric_type != 'histogram':
+            for label_str, value in sorted(values.items()):
+                lines.append(f"{name}{{{label_str}}} {value:g}" if label_str else f"{name} {value:g}")
+            continue
+
+        series = sorted({field.rsplit('|', 1)[0] for field in values})
+        for label_str in series:
+            prefix = f"{label_str}," if label_str else ""
+            for bound in DEFAULT_BUCKETS:
+                count = values.get(f"{label_str}|{bound}", 0)
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count:g}')
+            total = values.get(f"{label_str}|+Inf", 0)
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {total:g}')
+            lines.append(f"{name}_sum{{{label_str}}} {values.get(f'{label_str}|sum', 0):g}")
+            lines.append(f"{name}_count{{{label_str}}} {total:g}")
+
+    return "\n".join(lines) + "\n"
+
+
+# Длительность всех задач Celery, включая периодические
+_task_started = {}
+
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is None or task is None:
+        return
+    observe('calls_task_duration_seconds', time.perf_counter() - started, task=task.name)
+    inc('calls_task_total', task=task.name, state=state or 'UNKNOWN')
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:47
+
+from django.db import migrations, models
+import django.db.models.functions.text
+import django.db.models.lookups
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0005_note_smsmessage_dtmfsequence_created_at_callqueue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['created_at'], name='calls_callrecord_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(condition=models.Q(('transcription__isnull', True), django.db.models.lookups.LessThan(django.db.models.functions.text.Length('transcription'), 20), _connector='OR'), fields=['created_at'], name='calls_callrecord_stalled_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0006_callrecord_stalled_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dtmfsequence',
+            index=models.Index(condition=models.Q(('explored', False)), fields=['phone_number', 'level', 'id'], name='calls_dtmf_unexplored_idx'),
+        ),
+    ]
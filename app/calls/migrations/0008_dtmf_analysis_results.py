@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0007_dtmfsequence_unexplored_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callrecord',
+            name='analysis_input_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='callrecord',
+            name='analysis_version',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='callrecord',
+            name='analyzed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='callrecord',
+            name='dtmf_analysis',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='phonenumber',
+            name='summary_analysis',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='phonenumber',
+            name='summary_analysis_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(condition=models.Q(('analysis_version__isnull', True), ('transcription__isnull', False)), fields=['phone_number'], name='calls_record_unanalyzed_idx'),
+        ),
+    ]
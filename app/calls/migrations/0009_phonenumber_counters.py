@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:53
+
+from django.db import migrations, models
+
+
+BACKFILL_COUNTERS = """
+    UPDATE calls_phonenumber p SET
+        call_count = (SELECT COUNT(*) FROM calls_callrecord r WHERE r.phone_number_id = p.id),
+        transcribed_count = (
+            SELECT COUNT(*) FROM calls_callrecord r
+            WHERE r.phone_number_id = p.id AND r.transcription IS NOT NULL
+        ),
+        explored_count = (
+            SELECT COUNT(*) FROM calls_dtmfsequence s WHERE s.phone_number_id = p.id AND s.explored
+        ),
+        queue_depth = (SELECT COUNT(*) FROM calls_callqueue q WHERE q.phone_number_id = p.id)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0008_dtmf_analysis_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='phonenumber',
+            name='call_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='phonenumber',
+            name='explored_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='phonenumber',
+            name='queue_depth',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='phonenumber',
+            name='transcribed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='phonenumber',
+            index=models.Index(fields=['-created_at', '-id'], name='calls_phone_created_id_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_COUNTERS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0009_phonenumber_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['phone_number', '-created_at', '-id'], name='calls_record_phone_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dtmfsequence',
+            index=models.Index(fields=['phone_number', 'level', 'id'], name='calls_dtmf_phone_page_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Таблица -> колонка с текстом; конфигурация совпадает с calls.models.SEARCH_CONFIG
+SEARCH_COLUMNS = [
+    ('calls_callrecord', 'transcription'),
+    ('calls_phonenumber', 'summary'),
+    ('calls_dtmfsequence', 'description'),
+]
+
+# Вектор пересчитывается в базе только при изменении текста, в том числе при
+# bulk_create/update(), которые обходят save()
+CREATE_TRIGGERS = ''.join(f"""
+    UPDATE {table} SET search_vector = to_tsvector('pg_catalog.english', coalesce({column}, ''));
+    CREATE TRIGGER {table}_search_trg
+        BEFORE INSERT OR UPDATE OF {column} ON {table}
+        FOR EACH ROW EXECUTE FUNCTION
+        tsvector_update_trigger(search_vector, 'pg_catalog.english', {column});
+""" for table, column in SEARCH_COLUMNS)
+
+DROP_TRIGGERS = ''.join(f"""
+    DROP TRIGGER IF EXISTS {table}_search_trg ON {table};
+""" for table, _ in SEARCH_COLUMNS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0010_detail_page_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callrecord',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dtmfsequence',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='phonenumber',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='calls_record_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dtmfsequence',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='calls_dtmf_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phonenumber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='calls_phone_search_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:20
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0011_full_text_search'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='dtmfsequence',
+            index=models.Index(fields=['level', 'id'], name='calls_dtmf_level_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phonenumber',
+            index=models.Index(fields=['number'], name='calls_phone_number_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='smsmessage',
+            index=models.Index(fields=['-received_at'], name='calls_sms_received_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smsmessage',
+            index=models.Index(fields=['sender_number'], name='calls_sms_sender_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='smsmessage',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('message_text'), name='gin_trgm_ops'), name='calls_sms_text_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smsmessage',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('response_text'), name='gin_trgm_ops'), name='calls_sms_response_trgm_idx'),
+        ),
+    ]
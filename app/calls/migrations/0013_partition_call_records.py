@@ -0,0 +1,97 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:25
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+
+# Сколько месяцев вперед создаются секции; дальше их создает calls.retention.ensure_partitions
+PARTITION_MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_call_records(apps, schema_editor):
+    """
+    Переносит calls_callrecord в таблицу, секционированную по месяцам created_at.
+
+    Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+    поэтому в базе он (id, created_at); для Django первичным ключом остается id.
+    Identity-колонки в секционированных таблицах Postgres 13 не поддерживаются,
+    поэтому id берется из обычной последовательности с прежним именем.
+    """
+    CallRecord = apps.get_model('calls', 'CallRecord')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence('calls_callrecord', 'id')")
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT last_value FROM {sequence}")
+        last_value = cursor.fetchone()[0]
+        cursor.execute("SELECT max(id), min(created_at) FROM calls_callrecord")
+        max_id, first_created = cursor.fetchone()
+
+        cursor.execute(f"""
+            ALTER TABLE calls_callrecord RENAME TO calls_callrecord_legacy;
+            ALTER TABLE calls_callrecord_legacy ALTER COLUMN id DROP IDENTITY IF EXISTS;
+            ALTER TABLE calls_callrecord_legacy ALTER COLUMN id DROP DEFAULT;
+            DROP SEQUENCE IF EXISTS {sequence};
+            CREATE TABLE calls_callrecord (LIKE calls_callrecord_legacy INCLUDING DEFAULTS)
+                PARTITION BY RANGE (created_at);
+            CREATE SEQUENCE calls_callrecord_id_seq OWNED BY calls_callrecord.id;
+            ALTER TABLE calls_callrecord ALTER COLUMN id SET DEFAULT nextval('calls_callrecord_id_seq');
+            CREATE TABLE calls_callrecord_default PARTITION OF calls_callrecord DEFAULT;
+        """)
+        cursor.execute("SELECT setval('calls_callrecord_id_seq', %s, false)", [max(last_value, max_id or 0) + 1])
+
+        now = datetime.now(timezone.utc)
+        month = (first_created or now).astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last_month = _add_months(now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), PARTITION_MONTHS_AHEAD)
+        while month <= last_month:
+            cursor.execute(
+                f"CREATE TABLE calls_callrecord_p{month:%Y%m} PARTITION OF calls_callrecord "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month, _add_months(month, 1)]
+            )
+            month = _add_months(month, 1)
+
+        cursor.execute("""
+            INSERT INTO calls_callrecord SELECT * FROM calls_callrecord_legacy;
+            DROP TABLE calls_callrecord_legacy;
+            ALTER TABLE calls_callrecord ADD CONSTRAINT calls_callrecord_pkey PRIMARY KEY (id, created_at);
+            ALTER TABLE calls_callrecord ADD CONSTRAINT calls_callrecord_phone_number_id_fk
+                FOREIGN KEY (phone_number_id) REFERENCES calls_phonenumber (id) DEFERRABLE INITIALLY DEFERRED;
+            CREATE TRIGGER calls_callrecord_search_trg
+                BEFORE INSERT OR UPDATE OF transcription ON calls_callrecord
+                FOR EACH ROW EXECUTE FUNCTION
+                tsvector_update_trigger(search_vector, 'pg_catalog.english', transcription);
+        """)
+
+    # Индекс по phone_number_id не нужен: его покрывает calls_record_phone_page_idx
+    for index in CallRecord._meta.indexes:
+        schema_editor.add_index(CallRecord, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0012_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callrecord',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(condition=models.Q(('archived_at__isnull', True), models.Q(('recording_file', ''), _negated=True)), fields=['created_at'], name='calls_record_archive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(condition=models.Q(('archived_at__isnull', False), models.Q(('recording_file', ''), _negated=True)), fields=['created_at'], name='calls_record_archived_idx'),
+        ),
+        migrations.RunPython(partition_call_records),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0013_partition_call_records'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMBatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('dtmf', 'DTMF analysis'), ('summary', 'Summaries')], max_length=20)),
+                ('status', models.CharField(choices=[('submitted', 'Submitted'), ('applied', 'Applied'), ('failed', 'Failed')], default='submitted', max_length=20)),
+                ('batch_id', models.CharField(blank=True, max_length=100)),
+                ('batch_status', models.CharField(blank=True, max_length=20)),
+                ('input_file', models.CharField(max_length=255)),
+                ('input_file_id', models.CharField(blank=True, max_length=100)),
+                ('output_file_id', models.CharField(blank=True, max_length=100)),
+                ('error_file_id', models.CharField(blank=True, max_length=100)),
+                ('request_count', models.IntegerField(default=0)),
+                ('applied_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'kind'], name='calls_batch_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0014_llm_batch_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='llmbatchjob',
+            name='applied_lines',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='llmbatchjob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('submitted', 'Submitted'), ('applied', 'Applied'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calls', '0015_llm_batch_resume'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['recording_file'], name='calls_record_file_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -1,11 +1,21 @@
 from django.db import models
+from django.db.models.functions import Length, Upper
+from django.db.models.lookups import LessThan
 from django.utils import timezone
 import os
 import logging
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 
 logger = logging.getLogger(__name__)
 
+# Конфигурация полнотекстового поиска; та же используется в триггерах миграции 0011
+SEARCH_CONFIG = 'english'
+
+# Запись без транскрипции или с транскрипцией короче 20 символов (звонок не удался)
+STALLED_RECORDING = models.Q(transcription__isnull=True) | models.Q(LessThan(Length('transcription'), 20))
+
 class PhoneNumber(models.Model):
     STATUS_CHOICES = [
         ('new', 'New'),
@@ -21,13 +31,43 @@ class PhoneNumber(models.Model):
     dtmf_map = models.JSONField(null=True, blank=True)  # Карта нажатий
     summary = models.TextField(null=True, blank=True)  # Сводка от GPT
     summary_updated_at = models.DateTimeField(null=True, blank=True)
+    summary_analysis = models.JSONField(null=True, blank=True)  # Опции меню, найденные в summary
+    summary_analysis_hash = models.CharField(max_length=64, null=True, blank=True)  # Хеш summary и версии анализатора
+    # Денормализованные счетчики, обновляются в calls.counters
+    call_count = models.IntegerField(default=0)  # Записей звонков
+    transcribed_count = models.IntegerField(default=0)  # Записей с транскрипцией
+    explored_count = models.IntegerField(default=0)  # Исследованных последовательностей DTMF
+    queue_depth = models.IntegerField(default=0)  # Элементов в очереди звонков
+    # tsvector по summary, поддерживается триггером в базе
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    COUNTER_FIELDS = ('call_count', 'transcribed_count', 'explored_count', 'queue_depth')
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset-пагинация списка номеров
+            models.Index(fields=['-created_at', '-id'], name='calls_phone_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='calls_phone_search_idx'),
+            # Поиск по началу номера (LIKE '...%') в админке и выборки по номеру при импорте
+            models.Index(fields=['number'], name='calls_phone_number_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return f"{self.number} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        """
+        Счетчики меняются только атомарными UPDATE, поэтому обычное сохранение
+        существующего номера не перезаписывает их устаревшими значениями из памяти.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class CallRecord(models.Model):
     phone_number = models.ForeignKey(PhoneNumber, on_delete=models.CASCADE, related_name='call_records')
@@ -36,9 +76,50 @@ class CallRecord(models.Model):
     transcription = models.TextField(null=True, blank=True)  # Транскрипция разговора
     duration = models.IntegerField(default=0)  # Длительность звонка в секундах
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    # Результат анализа меню LLM: транскрипция анализируется один раз
+    dtmf_analysis = models.JSONField(null=True, blank=True)  # Опции меню из ответа LLM
+    analysis_version = models.IntegerField(null=True, blank=True)  # DTMF_ANALYZER_VERSION на момент анализа
+    analysis_input_hash = models.CharField(max_length=64, null=True, blank=True)  # Хеш транскрипции и контекста
+    analyzed_at = models.DateTimeField(null=True, blank=True)
+    # tsvector по транскрипции, поддерживается триггером в базе
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Файл записи сжат в архивный уровень (calls.retention); пустой recording_file - файл удален
+    archived_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
+        # Таблица секционирована по месяцам created_at (миграция 0013), первичный ключ в базе - (id, created_at)
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='calls_callrecord_created_idx'),
+            # Частичный индекс только по зависшим записям для check_stalled_recordings
+            models.Index(
+                fields=['created_at'],
+                name='calls_callrecord_stalled_idx',
+                condition=STALLED_RECORDING,
+            ),
+            # Страницы записей на странице номера
+            models.Index(fields=['phone_number', '-created_at', '-id'], name='calls_record_phone_page_idx'),
+            # Транскрибированные, но еще не проанализированные записи для analyze_recordings_for_dtmf
+            models.Index(
+                fields=['phone_number'],
+                name='calls_record_unanalyzed_idx',
+                condition=models.Q(transcription__isnull=False, analysis_version__isnull=True),
+            ),
+            GinIndex(fields=['search_vector'], name='calls_record_search_idx'),
+            # Поиск записи по началу имени файла в админке
+            models.Index(fields=['recording_file'], name='calls_record_file_idx', opclasses=['varchar_pattern_ops']),
+            # Файлы, которые еще предстоит сжать и удалить по политикам хранения
+            models.Index(
+                fields=['created_at'],
+                name='calls_record_archive_idx',
+                condition=models.Q(archived_at__isnull=True) & ~models.Q(recording_file=''),
+            ),
+            models.Index(
+                fields=['created_at'],
+                name='calls_record_archived_idx',
+                condition=models.Q(archived_at__isnull=False) & ~models.Q(recording_file=''),
+            ),
+        ]
 
     def __str__(self):
         return f"Call to {self.phone_number.number} at {self.created_at}"
@@ -53,10 +134,25 @@ class DTMFSequence(models.Model):
     is_submenu = models.BooleanField(default=False)  # Указывает, ведет ли эта последовательность к подменю
     created_at = models.DateTimeField(auto_now_add=True)  # Добавляем поле created_at
     explored = models.BooleanField(default=False)
+    # tsvector по описанию, поддерживается триггером в базе
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         unique_together = ['phone_number', 'sequence']
         ordering = ['level', 'id']  # Используем id вместо created_at
+        indexes = [
+            # Страницы последовательностей на странице номера
+            models.Index(fields=['phone_number', 'level', 'id'], name='calls_dtmf_phone_page_idx'),
+            # Неисследованные ветки для check_unexplored_dtmf
+            models.Index(
+                fields=['phone_number', 'level', 'id'],
+                name='calls_dtmf_unexplored_idx',
+                condition=models.Q(explored=False),
+            ),
+            GinIndex(fields=['search_vector'], name='calls_dtmf_search_idx'),
+            # Сортировка списка в админке без фильтра по номеру
+            models.Index(fields=['level', 'id'], name='calls_dtmf_level_id_idx'),
+        ]
     
     def __str__(self):
         if isinstance(self.sequence, list):
@@ -184,6 +280,53 @@ class SMSMessage(models.Model):
 
     class Meta:
         ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['-received_at'], name='calls_sms_received_idx'),
+            models.Index(fields=['sender_number'], name='calls_sms_sender_idx', opclasses=['varchar_pattern_ops']),
+            # Триграммы для icontains в поиске админки (UPPER(...) LIKE '%...%')
+            GinIndex(OpClass(Upper('message_text'), name='gin_trgm_ops'), name='calls_sms_text_trgm_idx'),
+            GinIndex(OpClass(Upper('response_text'), name='gin_trgm_ops'), name='calls_sms_response_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"Message from {self.sender_number} at {self.received_at}"
+
+
+class LLMBatchJob(models.Model):
+    """Пакет запросов к LLM, отправленный через Batch API (см. calls.llm_batch)."""
+    KIND_CHOICES = [
+        ('dtmf', 'DTMF analysis'),  # Анализ меню в транскрипциях и summary
+        ('summary', 'Summaries'),  # Summary номеров по транскрипциям
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),  # Файл формируется или загружается, пакет в API еще не создан
+        ('submitted', 'Submitted'),  # Отправлен, ждет завершения на стороне API
+        ('applied', 'Applied'),  # Результаты сохранены
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    batch_id = models.CharField(max_length=100, blank=True)
+    batch_status = models.CharField(max_length=20, blank=True)  # Статус пакета в API
+    input_file = models.CharField(max_length=255)  # Локальный JSONL с запросами
+    input_file_id = models.CharField(max_length=100, blank=True)
+    output_file_id = models.CharField(max_length=100, blank=True)
+    error_file_id = models.CharField(max_length=100, blank=True)
+    request_count = models.IntegerField(default=0)
+    applied_lines = models.IntegerField(default=0)  # Строк файла результатов, уже примененных
+    applied_count = models.IntegerField(default=0)  # Результатов, сохраненных в базу
+    failed_count = models.IntegerField(default=0)  # Запросов с ошибкой в API
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'kind'], name='calls_batch_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} batch {self.batch_id or self.pk} ({self.status})"
@@ -0,0 +1,159 @@
+"""
+Keyset-пагинация по (created_at, id) от новых к старым.
+
+В отличие от OFFSET, стоимость страницы не зависит от ее номера: запрос
+продолжается с последней показанной строки по индексу (created_at, id).
+Курсор - непрозрачная строка вида "<created_at в микросекундах UTC>-<id>".
+Последовательности DTMF листаются так же, но по (level, id) в порядке обхода дерева.
+
+Для админки, где нужна обычная постраничная навигация, есть EstimatedCountPaginator:
+он не считает COUNT(*) по большим таблицам, а берет оценку планировщика Postgres.
+"""
+import json
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import OperationalError, connections, transaction
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+logger = logging.getLogger('calls.pagination')
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def encode_cursor(obj):
+    """Курсор для объекта модели или словаря из values()."""
+    if isinstance(obj, dict):
+        created_at, pk = obj['created_at'], obj['id']
+    else:
+        created_at, pk = obj.created_at, obj.pk
+    return f"{created_at.astimezone(dt_timezone.utc).strftime(CURSOR_FORMAT)}-{pk}"
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (created_at, id) или None для пустого или некорректного курсора
+    """
+    try:
+        timestamp, pk = cursor.split('-', 1)
+        return datetime.strptime(timestamp, CURSOR_FORMAT).replace(tzinfo=dt_timezone.utc), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_queryset(queryset, cursor=None, limit=20):
+    """Запрос страницы: limit + 1 строка, чтобы узнать о наличии следующей страницы без COUNT(*)."""
+    queryset = queryset.order_by('-created_at', '-id')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    return queryset[:limit + 1]
+
+
+def _split_page(items, limit):
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
+
+
+def keyset_page(queryset, cursor=None, limit=20):
+    """
+    Возвращает страницу и курсор следующей страницы.
+
+    Returns:
+        tuple: (список объектов, курсор следующей страницы или None)
+    """
+    return _split_page(list(keyset_queryset(queryset, cursor, limit)), limit)
+
+
+async def akeyset_page(queryset, cursor=None, limit=20):
+    """Асинхронная версия keyset_page для async-представлений."""
+    return _split_page([item async for item in keyset_queryset(queryset, cursor, limit)], limit)
+
+
+def level_keyset_page(queryset, cursor=None, limit=50):
+    """
+    Страница последовательностей DTMF по (level, id) по возрастанию, курсор "<level>-<id>".
+
+    Returns:
+        tuple: (список объектов или словарей, курсор следующей страницы или None)
+    """
+    queryset = queryset.order_by('level', 'id')
+    try:
+        level, pk = (int(part) for part in cursor.split('-', 1)) if cursor else (None, None)
+    except ValueError:
+        level = pk = None
+    if pk is not None:
+        queryset = queryset.filter(Q(level__gt=level) | Q(level=level, id__gt=pk))
+
+    items = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        last = items[limit - 1]
+        last_level, last_pk = (last['level'], last['id']) if isinstance(last, dict) else (last.level, last.pk)
+        next_cursor = f"{last_level}-{last_pk}"
+    return items[:limit], next_cursor
+
+
+def table_estimate(model, using='default'):
+    """
+    Оценка числа строк таблицы из pg_class (обновляется VACUUM/ANALYZE).
+
+    У секционированной таблицы (relkind 'p') собственный reltuples равен 0 или -1,
+    поэтому оценка суммируется по секциям из pg_inherits.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT CASE WHEN c.relkind = 'p' THEN (
+                       SELECT coalesce(sum(greatest(part.reltuples, 0)), 0)
+                       FROM pg_inherits i JOIN pg_class part ON part.oid = i.inhrelid
+                       WHERE i.inhparent = c.oid
+                   ) ELSE greatest(c.reltuples, 0) END::bigint
+            FROM pg_class c WHERE c.oid = %s::regclass
+            """,
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def plan_estimate(queryset):
+    """Оценка числа строк запроса из EXPLAIN без его выполнения."""
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для больших таблиц Postgres.
+
+    - Без фильтров: число строк из pg_class, если таблица больше ADMIN_EXACT_COUNT_LIMIT.
+    - С фильтрами: точный COUNT(*), ограниченный ADMIN_COUNT_TIMEOUT_MS; если он не
+      успевает, используется оценка из EXPLAIN.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or connections[queryset.db].vendor != 'postgresql':
+            return super().count
+
+        if not queryset.query.where:
+            estimate = table_estimate(queryset.model, queryset.db)
+            if estimate >= settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+
+        try:
+            with transaction.atomic(using=queryset.db):
+                with connections[queryset.db].cursor() as cursor:
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)",
+                                   [str(settings.ADMIN_COUNT_TIMEOUT_MS)])
+                return queryset.count()
+        except OperationalError as e:
+            logger.info(f"Exact count of {queryset.model.__name__} timed out, using estimate: {str(e).strip()}")
+            return plan_estimate(queryset)
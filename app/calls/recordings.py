@@ -0,0 +1,200 @@
+"""
+Отдача файлов записей: Range-запросы (206), условные GET (304) и кэширование.
+
+Записи после создания не меняются, поэтому отдаются с долгим immutable-кэшем.
+В режиме RECORDINGS_SENDFILE сами байты отдает фронт-прокси (nginx через
+X-Accel-Redirect или Apache/lighttpd через X-Sendfile), а воркер Django только
+проверяет путь и формирует заголовки.
+
+Записи архивного уровня (calls.retention) лежат в RECORDINGS_ARCHIVE_PATH как
+<имя>.gz и отдаются по тому же URL с Content-Encoding: gzip: распаковывает браузер.
+Range для них не поддерживается, и они всегда отдаются Django, а не прокси.
+
+Функции без ввода-вывода вынесены отдельно, чтобы их могли использовать и
+асинхронные представления.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+# Суффикс сжатых файлов архивного уровня
+ARCHIVE_SUFFIX = '.gz'
+
+
+def _resolve_in(root, filepath):
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, filepath.lstrip('/')))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def resolve_recording_path(filepath):
+    """
+    Абсолютный путь к записи внутри RECORDINGS_PATH или к ее сжатой копии в архиве.
+
+    Returns:
+        str: Путь к существующему файлу или None, если файла нет или путь выходит за пределы директории
+    """
+    return (
+        _resolve_in(settings.RECORDINGS_PATH, filepath)
+        or _resolve_in(settings.RECORDINGS_ARCHIVE_PATH, filepath + ARCHIVE_SUFFIX)
+    )
+
+
+def is_archived(path):
+    return path.startswith(os.path.realpath(settings.RECORDINGS_ARCHIVE_PATH) + os.sep) and path.endswith(ARCHIVE_SUFFIX)
+
+
+def recording_etag(stat):
+    return quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+
+
+def content_type_for(path):
+    if path.endswith('.wav'):
+        return 'audio/wav'
+    content_type, _ = mimetypes.guess_type(path)
+    return content_type or 'application/octet-stream'
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном байт.
+
+    Returns:
+        tuple: (start, end) включительно; None, если заголовка нет или он не поддерживается
+            (тогда отдается весь файл); 'unsatisfiable', если диапазон вне файла
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Суффиксный диапазон: последние N байт
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def requested_range(request, stat, etag):
+    """Диапазон для ответа с учетом If-Range: устаревший валидатор означает отдачу всего файла."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range.strip() not in (etag, http_date(int(stat.st_mtime))):
+        return None
+    return parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+
+
+def cache_headers(response, stat, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(int(stat.st_mtime))
+    response['Cache-Control'] = f"public, max-age={settings.RECORDINGS_CACHE_MAX_AGE}, immutable"
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def file_range_iterator(path, start, length):
+    with open(path, 'rb') as recording:
+        recording.seek(start)
+        while length > 0:
+            chunk = recording.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def afile_range_iterator(path, start, length):
+    """Асинхронное чтение диапазона: блокирующие вызовы выполняются в пуле потоков."""
+    recording = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(recording.seek, start)
+        while length > 0:
+            chunk = await asyncio.to_thread(recording.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(recording.close)
+
+
+def sendfile_response(path, content_type):
+    """Ответ, тело которого отдаст фронт-прокси; None, если режим не включен."""
+    mode = settings.RECORDINGS_SENDFILE
+    if not mode:
+        return None
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        relative = os.path.relpath(path, os.path.realpath(settings.RECORDINGS_PATH))
+        response['X-Accel-Redirect'] = settings.RECORDINGS_ACCEL_PREFIX.rstrip('/') + '/' + relative
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def recording_response(request, path, iterator=file_range_iterator):
+    """
+    Полный ответ для записи: 304, 416, 206 или 200.
+
+    Args:
+        path: Результат resolve_recording_path
+        iterator: file_range_iterator или afile_range_iterator для ASGI
+    """
+    stat = os.stat(path)
+    etag = recording_etag(stat)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified:
+        return cache_headers(not_modified, stat, etag)
+
+    if is_archived(path):
+        # Сжатый файл целиком: диапазоны байт распакованной записи из него не получить
+        response = StreamingHttpResponse(
+            iterator(path, 0, stat.st_size), content_type=content_type_for(path[:-len(ARCHIVE_SUFFIX)])
+        )
+        response['Content-Length'] = str(stat.st_size)
+        response['Content-Encoding'] = 'gzip'
+        cache_headers(response, stat, etag)
+        response['Accept-Ranges'] = 'none'
+        return response
+
+    content_type = content_type_for(path)
+    # Прокси сам обрабатывает Range и отдает байты
+    response = sendfile_response(path, content_type)
+    if response is not None:
+        return cache_headers(response, stat, etag)
+
+    byte_range = requested_range(request, stat, etag)
+    if byte_range == 'unsatisfiable':
+        # Ошибка не кэшируется и не получает валидаторов файла
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{stat.st_size}"
+        response['Cache-Control'] = 'no-store'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    start, end = byte_range or (0, stat.st_size - 1)
+    length = end - start + 1 if stat.st_size else 0
+    response = StreamingHttpResponse(iterator(path, start, length), content_type=content_type)
+    response['Content-Length'] = str(length)
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+    return cache_headers(response, stat, etag)
@@ -0,0 +1,267 @@
+"""
+Политики хранения записей звонков.
+
+- Через RECORDING_ARCHIVE_DAYS дней WAV-файл сжимается gzip в архивный уровень
+  RECORDINGS_ARCHIVE_PATH. Строка CallRecord и транскрипция остаются, файл отдается
+  по тому же URL (см. calls.recordings).
+- Через RECORDING_RETENTION_DAYS дней файл удаляется, recording_file становится пустым.
+- calls_callrecord секционирована по месяцам created_at (миграция 0013). Секции старше
+  CALL_RECORD_RETENTION_MONTHS отсоединяются и удаляются целиком вместо DELETE по строкам;
+  секции на PARTITION_MONTHS_AHEAD месяцев вперед создаются заранее.
+
+Файлы обрабатываются пачками по RETENTION_BATCH_SIZE строк: каждая пачка - отдельный
+короткий UPDATE, который по условию на created_at затрагивает только старые секции
+и не блокирует текущую. Запуск ограничен RETENTION_TIME_BUDGET секундами, остаток
+дорабатывает следующий запуск. Значение 0 в настройке политики отключает ее.
+"""
+import gzip
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from . import caching
+from .counters import refresh_counters
+from .models import CallRecord
+from .recordings import ARCHIVE_SUFFIX
+
+logger = logging.getLogger('calls.retention')
+
+TABLE = CallRecord._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+
+# Сколько ждать блокировку родительской таблицы при отсоединении секции
+DETACH_LOCK_TIMEOUT = '5s'
+
+
+def month_start(value):
+    return value.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def list_partitions():
+    """
+    Returns:
+        list: (имя секции, начало месяца) по возрастанию; секция по умолчанию не входит
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass",
+            [TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _create_partition(cursor, month):
+    """
+    Создает секцию месяца через ATTACH PARTITION: родительская таблица блокируется
+    только SHARE UPDATE EXCLUSIVE, вставки в нее не ждут. Строки, попавшие за это
+    время в секцию по умолчанию, переносятся в новую секцию.
+    """
+    name, start, end = partition_name(month), month, add_months(month, 1)
+    cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved",
+        [start, end]
+    )
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end])
+
+
+def ensure_partitions(months_ahead=None):
+    """Создает недостающие секции от текущего месяца на months_ahead месяцев вперед."""
+    months_ahead = settings.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    existing = {month for _, month in list_partitions()}
+    current = month_start(timezone.now())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            _create_partition(cursor, month)
+        created.append(partition_name(month))
+        logger.info(f"Created partition {partition_name(month)}")
+    return created
+
+
+def archive_path(recording_file):
+    return os.path.join(settings.RECORDINGS_ARCHIVE_PATH, recording_file.lstrip('/') + ARCHIVE_SUFFIX)
+
+
+def hot_path(recording_file):
+    return os.path.join(settings.RECORDINGS_PATH, recording_file.lstrip('/'))
+
+
+def _compress(recording_file):
+    """Сжимает файл в архивный уровень и удаляет исходный; повторный вызов безопасен."""
+    source, target = hot_path(recording_file), archive_path(recording_file)
+    if not os.path.isfile(source):
+        return os.path.isfile(target)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial = target + '.partial'
+    with open(source, 'rb') as src, gzip.open(partial, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+    shutil.copystat(source, partial)
+    os.replace(partial, target)
+    os.remove(source)
+    return True
+
+
+def _remove_files(recording_file):
+    for path in (hot_path(recording_file), archive_path(recording_file)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _deadline():
+    return time.monotonic() + settings.RETENTION_TIME_BUDGET
+
+
+def _batches(queryset, deadline):
+    while time.monotonic() < deadline:
+        batch = list(queryset.values_list('id', 'phone_number_id', 'recording_file')[:settings.RETENTION_BATCH_SIZE])
+        if not batch:
+            return
+        yield batch
+
+
+def archive_recordings(deadline=None):
+    """
+    Сжимает файлы записей старше RECORDING_ARCHIVE_DAYS.
+
+    Returns:
+        int: Количество обработанных записей
+    """
+    if not settings.RECORDING_ARCHIVE_DAYS:
+        return 0
+    cutoff = timezone.now() - timedelta(days=settings.RECORDING_ARCHIVE_DAYS)
+    candidates = CallRecord.objects.filter(
+        created_at__lt=cutoff, archived_at__isnull=True
+    ).exclude(recording_file='').order_by('created_at')
+
+    total = 0
+    for batch in _batches(candidates, deadline or _deadline()):
+        missing = 0
+        for _, _, recording_file in batch:
+            try:
+                if not _compress(recording_file):
+                    missing += 1
+            except OSError as e:
+                # Запись все равно помечается, чтобы не пытаться сжать ее в каждом запуске
+                logger.warning(f"Failed to archive {recording_file}: {str(e)}")
+        # Условие на created_at ограничивает UPDATE старыми секциями
+        CallRecord.objects.filter(
+            id__in=[record_id for record_id, _, _ in batch], created_at__lt=cutoff
+        ).update(archived_at=timezone.now())
+        total += len(batch)
+        logger.info(f"Archived batch of {len(batch)} recordings ({missing} files missing)")
+    return total
+
+
+def delete_expired_recordings(deadline=None):
+    """
+    Удаляет файлы записей старше RECORDING_RETENTION_DAYS, транскрипции остаются.
+
+    Returns:
+        int: Количество записей, у которых удален файл
+    """
+    if not settings.RECORDING_RETENTION_DAYS:
+        return 0
+    cutoff = timezone.now() - timedelta(days=settings.RECORDING_RETENTION_DAYS)
+    deadline = deadline or _deadline()
+
+    total = 0
+    # Два прохода, чтобы каждый шел по своему частичному индексу
+    for archived in (True, False):
+        candidates = CallRecord.objects.filter(
+            created_at__lt=cutoff, archived_at__isnull=not archived
+        ).exclude(recording_file='').order_by('created_at')
+        for batch in _batches(candidates, deadline):
+            for _, _, recording_file in batch:
+                _remove_files(recording_file)
+            CallRecord.objects.filter(
+                id__in=[record_id for record_id, _, _ in batch], created_at__lt=cutoff
+            ).update(recording_file='')
+            # update() не отправляет сигналы: в списках записей пропадают ссылки на файлы
+            caching.invalidate_phones({phone_id for _, phone_id, _ in batch})
+            total += len(batch)
+            logger.info(f"Deleted {len(batch)} expired recording files")
+    return total
+
+
+def drop_expired_partitions():
+    """
+    Удаляет секции, целиком старше CALL_RECORD_RETENTION_MONTHS, вместе с файлами записей.
+
+    Returns:
+        list: Имена удаленных секций
+    """
+    if not settings.CALL_RECORD_RETENTION_MONTHS:
+        return []
+    cutoff = add_months(month_start(timezone.now()), -settings.CALL_RECORD_RETENTION_MONTHS)
+
+    dropped = []
+    for name, month in list_partitions():
+        if add_months(month, 1) > cutoff:
+            break
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                # DETACH в Postgres 13 берет эксклюзивную блокировку родителя: не ждем ее
+                # дольше DETACH_LOCK_TIMEOUT, секция будет удалена при следующем запуске
+                cursor.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+                cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+        except OperationalError as e:
+            logger.warning(f"Failed to detach partition {name}, will retry: {str(e).strip()}")
+            continue
+
+        # Файлы удаляются только после удаления секции: пока DETACH не прошел,
+        # строки видны в списках и должны ссылаться на существующие файлы
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT DISTINCT phone_number_id FROM {name}")
+            phone_ids = {row[0] for row in cursor.fetchall()}
+            cursor.execute(f"SELECT recording_file FROM {name} WHERE recording_file <> ''")
+            recording_files = [row[0] for row in cursor.fetchall()]
+            cursor.execute(f"DROP TABLE {name}")
+        for recording_file in recording_files:
+            _remove_files(recording_file)
+
+        # Строки удалены без сигналов: пересчитываем счетчики номеров
+        refresh_counters(phone_ids)
+        dropped.append(name)
+        logger.info(f"Dropped partition {name} ({len(phone_ids)} phone numbers affected)")
+    return dropped
+
+
+def apply_retention():
+    """Все политики хранения в общем бюджете времени; результат для журнала задачи."""
+    deadline = _deadline()
+    return {
+        'created_partitions': ensure_partitions(),
+        'dropped_partitions': drop_expired_partitions(),
+        'deleted_files': delete_expired_recordings(deadline),
+        'archived': archive_recordings(deadline),
+    }
@@ -0,0 +1,106 @@
+"""
+Полнотекстовый поиск по транскрипциям, описаниям номеров и пунктам меню DTMF.
+
+Колонки search_vector (tsvector) поддерживаются триггерами в базе (миграция 0011)
+и индексированы GIN, поэтому поиск не сканирует тексты. Запрос разбирается как
+websearch ("фраза в кавычках", OR, -исключение). Из каждого источника берутся
+лучшие совпадения по рангу, затем они объединяются в общий список.
+
+Каждый результат содержит номер и точный путь DTMF, которым до найденного
+места можно дойти: для записи - нажатия, с которыми был сделан звонок, для
+последовательности - сама последовательность, для описания номера - пустой путь.
+"""
+import json
+import logging
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F
+
+from .models import SEARCH_CONFIG, PhoneNumber, CallRecord, DTMFSequence
+
+logger = logging.getLogger('calls.search')
+
+# Параметры фрагмента с подсветкой совпадений
+HEADLINE_OPTIONS = {'start_sel': '<b>', 'stop_sel': '</b>', 'max_words': 30, 'min_words': 10}
+
+
+def dtmf_path(value):
+    """
+    Путь нажатий из поля dtmf_sequence записи.
+
+    В записях путь хранится JSON-строкой или списком, элементы - цифры или словари
+    {'digit': '1', 'delay': 2}.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return []
+    if not isinstance(value, list):
+        return []
+    return [str(item.get('digit', '')) if isinstance(item, dict) else str(item) for item in value]
+
+
+def _ranked(queryset, query, column, limit):
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(
+            rank=SearchRank(F('search_vector'), query),
+            snippet=SearchHeadline(column, query, config=SEARCH_CONFIG, **HEADLINE_OPTIONS),
+        )
+        .order_by('-rank', '-id')[:limit]
+    )
+
+
+def search(text, limit=20):
+    """
+    Ищет текст во всех источниках.
+
+    Returns:
+        list: Словари source, id, phone_id, number, path, rank, snippet по убыванию ранга
+    """
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    results = []
+
+    records = _ranked(
+        CallRecord.objects.values('id', 'phone_number_id', 'phone_number__number', 'dtmf_sequence'),
+        query, 'transcription', limit
+    )
+    results.extend({
+        'source': 'transcription',
+        'id': record['id'],
+        'phone_id': record['phone_number_id'],
+        'number': record['phone_number__number'],
+        'path': dtmf_path(record['dtmf_sequence']),
+        'rank': record['rank'],
+        'snippet': record['snippet'],
+    } for record in records)
+
+    sequences = _ranked(
+        DTMFSequence.objects.values('id', 'phone_number_id', 'phone_number__number', 'sequence'),
+        query, 'description', limit
+    )
+    results.extend({
+        'source': 'dtmf',
+        'id': sequence['id'],
+        'phone_id': sequence['phone_number_id'],
+        'number': sequence['phone_number__number'],
+        'path': [str(digit) for digit in sequence['sequence'] or []],
+        'rank': sequence['rank'],
+        'snippet': sequence['snippet'],
+    } for sequence in sequences)
+
+    phones = _ranked(PhoneNumber.objects.values('id', 'number'), query, 'summary', limit)
+    results.extend({
+        'source': 'summary',
+        'id': phone['id'],
+        'phone_id': phone['id'],
+        'number': phone['number'],
+        'path': [],
+        'rank': phone['rank'],
+        'snippet': phone['snippet'],
+    } for phone in phones)
+
+    results.sort(key=lambda result: result['rank'], reverse=True)
+    logger.debug("Search %r: %d results", text, len(results))
+    return results[:limit]
@@ -1,4 +1,3 @@
-import colorlog
 import logging
 import asyncio
 import websockets
@@ -13,55 +12,50 @@ import base64
 import traceback
 import os
 import json
+import hashlib
 from django.db.models import Q
+from django.utils import timezone
 from typing import List
 from .models import PhoneNumber, CallRecord, DTMFSequence, CallQueue
+from .transcription_backends import get_transcription_backend
+from .importers import CANDIDATE_RE, is_phone_shaped, normalize_number
+from .search import dtmf_path
+from . import metrics
 import re
 
-# Настройка цветного логирования
-handler = colorlog.StreamHandler()
-handler.setFormatter(colorlog.ColoredFormatter(
-    '%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s%(reset)s',
-    log_colors={
-        'DEBUG':    'cyan',
-        'INFO':     'green',
-        'WARNING':  'yellow',
-        'ERROR':    'red',
-        'CRITICAL': 'red,bg_white',
-    },
-    secondary_log_colors={},
-    style='%'
-))
-
-logger = colorlog.getLogger('calls.services')
-logger.handlers = []  # Очищаем существующие обработчики
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+# Обработчики и уровень задаются в settings.LOGGING (calls.log)
+logger = logging.getLogger('calls.services')
+
+# Версия анализатора DTMF: увеличивается при изменении промптов или разбора ответа,
+# чтобы сохраненные результаты анализа считались устаревшими
+DTMF_ANALYZER_VERSION = 1
+
+
+# Модель для анализа меню и summary
+LLM_MODEL = "gpt-4o-mini"
+
+
+def chat_request(messages: list) -> dict:
+    """Параметры chat-запроса; то же тело уходит в строки пакетного JSONL."""
+    return {"model": LLM_MODEL, "messages": messages, "temperature": 0}
+
+
+def analysis_input_hash(text: str, context: str = "") -> str:
+    """Хеш входных данных анализа: при его совпадении повторный запрос к LLM не нужен."""
+    return hashlib.sha256(f"{DTMF_ANALYZER_VERSION}\n{context}\n{text}".encode()).hexdigest()
+
 
 class PhoneNumberExtractor:
-    @staticmethod
-    def extract_numbers(text: str) -> List[str]:
-        """Извлекает телефонные номера из текста с помощью gpt-4o-minio-mini"""
-        http_client = None
-        try:
-            logger.info(f"Starting phone number extraction from text: {text[:100]}...")
-            
-            # Инициализируем клиент OpenAI с API ключом
-            logger.debug(f"Initializing OpenAI client with API key: {settings.OPENAI_API_KEY[:5]}...")
-            http_client = httpx.Client(timeout=30.0)
-            client = openai.OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                http_client=http_client
-            )
-            
-            # Отправляем запрос к API
-            logger.info("Sending request to OpenAI API")
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a phone number extraction assistant. Your task is to find and format phone numbers from text.
+    """
+    Извлечение номеров из текста.
+
+    Текст делится на куски по строкам (с перекрытием, если строка длиннее куска).
+    Номера, которые однозначно разбирает локальный нормализатор, берутся без LLM;
+    в gpt-4o-mini параллельно уходят только куски с неоднозначными фрагментами
+    (частичные номера, буквенные номера вида 1-800-FLOWERS и т.п.).
+    """
+
+    SYSTEM_PROMPT = """You are a phone number extraction assistant. Your task is to find and format phone numbers from text.
 
 Rules:
 1. Extract ALL phone numbers from the input text
@@ -73,58 +67,158 @@ Rules:
 4. If you see a number that looks like a phone number, include it
 
 Example output: ["18007267864", "19991234567"]"""
-                    },
-                    {
-                        "role": "user",
-                        "content": text
-                    }
-                ],
-                temperature=0
-            )
-            logger.info("Received response from OpenAI API")
-            
-            # Извлекаем и парсим результат
-            content = response.choices[0].message.content
-            logger.info(f"Raw response from GPT: {content}")
-            
+
+    # Буквенные номера (1-800-FLOWERS), которые регулярное выражение не разбирает
+    VANITY_RE = re.compile(r'\b(?:1[ .-]?)?\(?\d{3}\)?[ .-]?[A-Z0-9]{0,3}[ .-]?[A-Z]{4,}\b')
+
+    @staticmethod
+    def chunk_bounds(text: str, size: int, overlap: int) -> List[tuple]:
+        """
+        Границы кусков текста.
+
+        Куски заканчиваются на границе строки; если строка длиннее куска, она режется
+        с перекрытием overlap символов, чтобы номер на стыке целиком попал в один кусок.
+        """
+        bounds = []
+        start = 0
+        while start < len(text):
+            end = min(start + size, len(text))
+            aligned = end == len(text)
+            if not aligned:
+                newline = text.rfind('\n', start, end)
+                if newline != -1:
+                    end, aligned = newline + 1, True
+            bounds.append((start, end))
+            start = end if aligned else max(end - overlap, start + 1)
+        return bounds
+
+    @classmethod
+    def find_local(cls, text: str):
+        """
+        Returns:
+            tuple: (номера, разобранные локально; позиции неоднозначных фрагментов)
+        """
+        numbers, ambiguous = [], []
+        for match in CANDIDATE_RE.finditer(text):
+            # Локально принимаются только фрагменты в форме номера, остальные (даты, время,
+            # номера заказов) решает LLM
+            number = normalize_number(match.group()) if is_phone_shaped(match.group()) else None
+            if number:
+                numbers.append(number)
+            else:
+                ambiguous.append(match.span())
+        ambiguous.extend(match.span() for match in cls.VANITY_RE.finditer(text))
+        return numbers, ambiguous
+
+    @staticmethod
+    def parse_response(content: str) -> List[str]:
+        """Разбирает JSON-массив номеров из ответа модели."""
+        content = (content or '').strip()
+        if content.startswith('```'):
+            content = content.strip('`').removeprefix('json').strip()
+        try:
+            numbers = json.loads(content)
+        except json.JSONDecodeError:
+            logger.error(f"Failed to parse GPT response as JSON: {content[:500]}")
+            return []
+        if not isinstance(numbers, list):
+            logger.error(f"GPT response is not a list: {content[:500]}")
+            return []
+        return [re.sub(r'\D', '', str(number)) for number in numbers if number]
+
+    @classmethod
+    async def _extract_with_llm(cls, chunks: List[str]) -> List[str]:
+        """Отправляет неоднозначные куски в LLM параллельно, не более EXTRACTION_CONCURRENCY одновременно."""
+        semaphore = asyncio.Semaphore(settings.EXTRACTION_CONCURRENCY)
+        http_client = httpx.AsyncClient(timeout=30.0)
+        client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=http_client
+        )
+
+        async def extract_chunk(chunk):
+            async with semaphore:
+                try:
+                    response = await metrics.allm_call(
+                        'extract_numbers',
+                        client.chat.completions.create,
+                        model="gpt-4o-mini",
+                        messages=[
+                            {"role": "system", "content": cls.SYSTEM_PROMPT},
+                            {"role": "user", "content": chunk}
+                        ],
+                        temperature=0
+                    )
+                except Exception as e:
+                    logger.error(f"Error extracting numbers from chunk: {str(e)}")
+                    return []
+            return cls.parse_response(response.choices[0].message.content)
+
+        try:
+            results = await asyncio.gather(*(extract_chunk(chunk) for chunk in chunks))
+        finally:
+            await http_client.aclose()
+        return [number for numbers in results for number in numbers]
+
+    @staticmethod
+    def save_numbers(numbers: List[str]):
+        """Добавляет номера в базу; уже обработанные номера снова ставятся в очередь."""
+        for number in numbers:
+            if len(number) > 20:
+                logger.warning(f"Skipping number {number} - too long")
+                continue
+
             try:
-                numbers = json.loads(content)
-                logger.info(f"Successfully parsed numbers: {numbers}")
-                
-                # Добавляем номера в базу данных
-                for number in numbers:
-                    if len(number) > 20:
-                        logger.warning(f"Skipping number {number} - too long")
-                        continue
-                        
-                    try:
-                        phone, created = PhoneNumber.objects.get_or_create(
-                            number=number,
-                            defaults={"status": "new"}
-                        )
-                        
-                        if not created and phone.status not in ['new', 'processing']:
-                            phone.status = 'new'
-                            phone.save(update_fields=['status'])
-                            
-                        if created:
-                            logger.info(f"Created new phone number: {number} (ID: {phone.id})")
-                    except Exception as e:
-                        logger.error(f"Error processing number {number}: {str(e)}")
-                        continue
-                        
-                return numbers
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse GPT response as JSON: {content}")
-                logger.error(f"JSON parse error: {str(e)}")
-                return []
-                
+                phone, created = PhoneNumber.objects.get_or_create(
+                    number=number,
+                    defaults={"status": "new"}
+                )
+
+                if not created and phone.status not in ['new', 'processing']:
+                    phone.status = 'new'
+                    phone.save(update_fields=['status'])
+
+                if created:
+                    logger.debug("Created new phone number: %s (ID: %s)", number, phone.id)
+            except Exception as e:
+                logger.error(f"Error processing number {number}: {str(e)}")
+                continue
+
+    @classmethod
+    def extract_numbers(cls, text: str) -> List[str]:
+        """Извлекает телефонные номера из текста: локально и, для неоднозначных кусков, с помощью gpt-4o-mini"""
+        try:
+            logger.info(f"Starting phone number extraction from {len(text)} characters")
+            logger.debug("Extraction input: %.100s...", text)
+            numbers, ambiguous = cls.find_local(text)
+
+            # Каждый неоднозначный фрагмент отправляется в составе первого куска, который содержит его целиком
+            bounds = cls.chunk_bounds(text, settings.EXTRACTION_CHUNK_SIZE, settings.EXTRACTION_CHUNK_OVERLAP)
+            selected = set()
+            for span_start, span_end in ambiguous:
+                selected.add(next(
+                    (index for index, (start, end) in enumerate(bounds) if start <= span_start and span_end <= end),
+                    next(index for index, (start, end) in enumerate(bounds) if start <= span_start < end)
+                ))
+            chunks = [text[start:end] for index, (start, end) in enumerate(bounds) if index in selected]
+            logger.info(
+                f"Found {len(numbers)} numbers locally, sending {len(chunks)} of {len(bounds)} chunks to OpenAI API"
+            )
+
+            if chunks:
+                numbers.extend(asyncio.run(cls._extract_with_llm(chunks)))
+
+            # Куски перекрываются, а номер может встретиться в тексте несколько раз
+            numbers = list(dict.fromkeys(number for number in numbers if number))
+            logger.info(f"Successfully extracted {len(numbers)} numbers")
+            logger.debug("Extracted numbers: %s", numbers)
+            cls.save_numbers(numbers)
+            return numbers
+
         except Exception as e:
             logger.error(f"Error extracting numbers: {str(e)}", exc_info=True)
             return []
-        finally:
-            if http_client:
-                http_client.close()
 
 class TranscriptionService:
     """Сервис для транскрибации аудио файлов и анализа IVR меню."""
@@ -136,140 +230,299 @@ class TranscriptionService:
         
         self.client = openai.OpenAI(
             api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
             http_client=http_client
         )
 
+    @property
+    def backend(self):
+        """Бэкенд транскрибации создается только при первом обращении."""
+        return get_transcription_backend()
+
     def transcribe_audio(self, file_path: str) -> str:
         """
-        Транскрибирует аудиофайл в текст
+        Транскрибирует аудиофайл в текст бэкендом из TRANSCRIPTION_BACKEND
         """
         try:
             if not os.path.exists(file_path):
                 logger.error(f"Audio file not found at path: {file_path}")
                 return None
                 
-            with open(file_path, "rb") as audio_file:
-                response = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="text"
-                )
-                return response
+            with metrics.timed('transcribe', backend=self.backend.name):
+                return self.backend.transcribe(file_path)
 
         except Exception as e:
             logger.error(f"Error transcribing audio:\n{str(e)}\n")
             logger.error(traceback.format_exc())
             return None
 
-    def analyze_ivr_menu(self, transcription: str, sequence: str = "no previous keys pressed") -> list:
+    @staticmethod
+    def ivr_menu_messages(transcription: str, sequence: str = "no previous keys pressed") -> list:
+        """Сообщения запроса анализа меню IVR (общие для обычного и пакетного режима)."""
+        prompt = (
+            "You are an IVR menu analyzer. Your task is to identify DTMF options in the transcription.\n\n"
+            f"Context: Previous key sequence: {sequence}\n\n"
+            "Rules:\n"
+            "1. Return ONLY a JSON array of objects with structure:\n"
+            "   {\n"
+            '     "digit": "string (the button to press)",\n'
+            '     "action": "string (what happens when pressed)",\n'
+            '     "submenu": boolean (true if this leads to another menu)\n'
+            "   }\n"
+            "2. Include only explicitly mentioned number options\n"
+            "3. Return [] if no options found\n"
+            "4. DO NOT include any explanatory text, only the JSON array\n\n"
+            f"Transcription:\n{transcription}\n"
+        )
+        return [
+            {
+                "role": "system",
+                "content": "You are a JSON-only responder. Only output valid JSON arrays containing DTMF menu options. No explanatory text."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+    @staticmethod
+    def parse_ivr_menu_response(content: str) -> list:
+        """Опции меню из ответа LLM; при невалидном JSON - из текста ответа."""
+        content = content.strip()
+        try:
+            # Удаляем markdown обёртку, если она есть
+            content = content.replace('```json', '').replace('```', '').strip()
+
+            # Пытаемся распарсить ответ как JSON
+            options = json.loads(content)
+            if isinstance(options, list):
+                return options
+            logger.warning(f"GPT returned non-list JSON: {content}")
+            return []
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse GPT response as JSON: {content}")
+            logger.error(f"JSON parse error: {str(e)}")
+
+            # Пробуем извлечь JSON из текста
+            match = re.search(r'\[(.*)\]', content, re.DOTALL)
+            if match:
+                try:
+                    options = json.loads(f"[{match.group(1)}]")
+                    if isinstance(options, list):
+                        return options
+                except:
+                    pass
+
+            # Если не удалось распарсить JSON, пробуем извлечь опции из текста
+            options = []
+            for line in content.split('\n'):
+                if 'press' in line.lower() and any(str(i) in line for i in range(10)):
+                    # Извлекаем цифру
+                    for i in range(10):
+                        if str(i) in line:
+                            options.append({
+                                'digit': str(i),
+                                'action': line.split('press')[1].strip(),
+                                'submenu': 'submenu' in line.lower() or 'menu' in line.lower()
+                            })
+                            break
+            return options
+
+    @staticmethod
+    def sibling_menus_messages(menus: dict) -> list:
         """
-        Анализирует текст на наличие опций меню IVR.
+        Сообщения запроса анализа нескольких меню одного номера (соседних узлов дерева).
+
+        Args:
+            menus: {путь нажатий "1-2": транскрипция}
         """
+        prompt = (
+            "You are an IVR menu analyzer. Below are transcriptions of several IVR menus of the same phone line, "
+            "each reached by pressing a different key sequence. Identify DTMF options in each transcription.\n\n"
+            "Rules:\n"
+            "1. Return ONLY a JSON object. Its keys are the key sequences exactly as given in the "
+            "'=== Keys: ... ===' headers, its values are arrays of objects with structure:\n"
+            "   {\n"
+            '     "digit": "string (the button to press)",\n'
+            '     "action": "string (what happens when pressed)",\n'
+            '     "submenu": boolean (true if this leads to another menu)\n'
+            "   }\n"
+            "2. Include only explicitly mentioned number options\n"
+            "3. Use [] for a transcription without options\n"
+            "4. DO NOT include any explanatory text, only the JSON object\n\n"
+        )
+        prompt += "".join(f"=== Keys: {path} ===\n{transcription}\n\n" for path, transcription in menus.items())
+        return [
+            {
+                "role": "system",
+                "content": "You are a JSON-only responder. Only output a valid JSON object mapping key sequences "
+                           "to arrays of DTMF menu options. No explanatory text."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+    @staticmethod
+    def parse_sibling_menus_response(content: str) -> dict:
+        """Опции меню по путям из ответа LLM; пути без корректного массива не попадают в результат."""
+        content = content.replace('```json', '').replace('```', '').strip()
         try:
-            prompt = (
-                "You are an IVR menu analyzer. Your task is to identify DTMF options in the transcription.\n\n"
-                f"Context: Previous key sequence: {sequence}\n\n"
-                "Rules:\n"
-                "1. Return ONLY a JSON array of objects with structure:\n"
-                "   {\n"
-                '     "digit": "string (the button to press)",\n'
-                '     "action": "string (what happens when pressed)",\n'
-                '     "submenu": boolean (true if this leads to another menu)\n'
-                "   }\n"
-                "2. Include only explicitly mentioned number options\n"
-                "3. Return [] if no options found\n"
-                "4. DO NOT include any explanatory text, only the JSON array\n\n"
-                f"Transcription:\n{transcription}\n"
-            )
+            menus = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse GPT response as JSON: {content}")
+            logger.error(f"JSON parse error: {str(e)}")
+            return {}
+        if not isinstance(menus, dict):
+            logger.warning(f"GPT returned non-object JSON: {content}")
+            return {}
+        return {str(path): options for path, options in menus.items() if isinstance(options, list)}
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a JSON-only responder. Only output valid JSON arrays containing DTMF menu options. No explanatory text."
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                temperature=0
+    def analyze_ivr_menu(self, transcription: str, sequence: str = "no previous keys pressed",
+                         raise_errors: bool = False) -> list:
+        """
+        Анализирует текст на наличие опций меню IVR.
+
+        При raise_errors=True ошибки запроса пробрасываются, чтобы отличить сбой от пустого меню.
+        """
+        try:
+            response = metrics.llm_call(
+                'analyze_ivr_menu',
+                self.client.chat.completions.create,
+                **chat_request(self.ivr_menu_messages(transcription, sequence))
             )
             
             content = response.choices[0].message.content.strip()
-            logger.info(f"GPT response for IVR menu: {content}")
-            
-            try:
-                # Удаляем markdown обёртку, если она есть
-                content = content.replace('```json', '').replace('```', '').strip()
-                
-                # Пытаемся распарсить ответ как JSON
-                options = json.loads(content)
-                if isinstance(options, list):
-                    return options
-                logger.warning(f"GPT returned non-list JSON: {content}")
-                return []
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse GPT response as JSON: {content}")
-                logger.error(f"JSON parse error: {str(e)}")
-                
-                # Пробуем извлечь JSON из текста
-                match = re.search(r'\[(.*)\]', content, re.DOTALL)
-                if match:
-                    try:
-                        options = json.loads(f"[{match.group(1)}]")
-                        if isinstance(options, list):
-                            return options
-                    except:
-                        pass
-                
-                # Если не удалось распарсить JSON, пробуем извлечь опции из текста
-                options = []
-                for line in content.split('\n'):
-                    if 'press' in line.lower() and any(str(i) in line for i in range(10)):
-                        # Извлекаем цифру
-                        for i in range(10):
-                            if str(i) in line:
-                                options.append({
-                                    'digit': str(i),
-                                    'action': line.split('press')[1].strip(),
-                                    'submenu': 'submenu' in line.lower() or 'menu' in line.lower()
-                                })
-                                break
-                return options
+            logger.debug("GPT response for IVR menu: %s", content)
+            return self.parse_ivr_menu_response(content)
                 
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error(f"Error analyzing IVR menu: {str(e)}")
             logger.error(traceback.format_exc())
             return []
 
-    def analyze_transcription_for_dtmf(self, transcription, phone_number_id):
+    @staticmethod
+    def record_sequence_str(record) -> str:
+        """Контекст для промпта: последовательность нажатий, которая привела к записи."""
+        if record.dtmf_sequence:
+            return "->".join(str(x) for x in record.dtmf_sequence)
+        return "no previous keys pressed"
+
+    def analyze_record(self, record, cached_only: bool = False) -> list:
+        """
+        Возвращает опции меню для записи звонка, обращаясь к LLM не более одного раза.
+
+        Результат сохраняется в CallRecord.dtmf_analysis вместе с версией анализатора
+        и хешем входных данных; пока они совпадают, используется сохраненный результат.
+        При ошибке запроса ничего не сохраняется, и запись будет проанализирована повторно.
+        С cached_only=True LLM не вызывается: возвращается сохраненный результат,
+        даже устаревший (карты пересобираются после пакетного анализа).
+        """
+        sequence_str = self.record_sequence_str(record)
+        input_hash = analysis_input_hash(record.transcription, sequence_str)
+        if (record.dtmf_analysis is not None
+                and record.analysis_version == DTMF_ANALYZER_VERSION
+                and record.analysis_input_hash == input_hash):
+            return [dict(option) for option in record.dtmf_analysis]
+        if cached_only:
+            return [dict(option) for option in record.dtmf_analysis or []]
+
+        try:
+            options = self.analyze_ivr_menu(record.transcription, sequence_str, raise_errors=True)
+        except Exception as e:
+            logger.error(f"Error analyzing recording {record.id}: {str(e)}")
+            logger.error(traceback.format_exc())
+            return []
+
+        record.dtmf_analysis = options
+        record.analysis_version = DTMF_ANALYZER_VERSION
+        record.analysis_input_hash = input_hash
+        record.analyzed_at = timezone.now()
+        CallRecord.objects.filter(pk=record.pk).update(
+            dtmf_analysis=options,
+            analysis_version=DTMF_ANALYZER_VERSION,
+            analysis_input_hash=input_hash,
+            analyzed_at=record.analyzed_at
+        )
+        return [dict(option) for option in options]
+
+    def analyze_sibling_records(self, records) -> int:
+        """
+        Анализирует записи соседних узлов меню одним запросом и сохраняет результаты
+        так же, как analyze_record (с тем же хешем входных данных).
+
+        Записи с повторяющимся путем и пути, которых нет в ответе, не сохраняются:
+        для них analyze_record выполнит обычный запрос.
+
+        Returns:
+            int: Количество сохраненных результатов
+        """
+        by_path = {}
+        for record in records:
+            by_path.setdefault("-".join(dtmf_path(record.dtmf_sequence)), record)
+        if len(by_path) < 2:
+            return 0
+
+        try:
+            response = metrics.llm_call(
+                'analyze_sibling_menus',
+                self.client.chat.completions.create,
+                **chat_request(self.sibling_menus_messages(
+                    {path: record.transcription for path, record in by_path.items()}
+                ))
+            )
+            content = response.choices[0].message.content
+            logger.debug("GPT response for sibling menus: %s", content)
+            menus = self.parse_sibling_menus_response(content)
+        except Exception as e:
+            logger.error(f"Error analyzing sibling menus: {str(e)}")
+            logger.error(traceback.format_exc())
+            return 0
+
+        now = timezone.now()
+        analyzed = []
+        for path, record in by_path.items():
+            if path not in menus:
+                continue
+            record.dtmf_analysis = menus[path]
+            record.analysis_version = DTMF_ANALYZER_VERSION
+            record.analysis_input_hash = analysis_input_hash(record.transcription, self.record_sequence_str(record))
+            record.analyzed_at = now
+            analyzed.append(record)
+        CallRecord.objects.bulk_update(
+            analyzed, ['dtmf_analysis', 'analysis_version', 'analysis_input_hash', 'analyzed_at']
+        )
+        return len(analyzed)
+
+    def analyze_transcription_for_dtmf(self, transcription, phone_number_id, record=None):
         """
         Анализирует транскрипцию для определения необходимых DTMF последовательностей.
         Проверяет схожесть с предыдущими транскрипциями, чтобы избежать дублирования меню.
+        Если запись известна (или найдена по тексту), используется сохраненный результат анализа.
         """
         try:
             # Получаем последние транскрипции для этого номера
             from .models import CallRecord, DTMFSequence
             
             # Получаем текущую запись и её DTMF последовательность
-            current_record = CallRecord.objects.filter(
+            current_record = record or CallRecord.objects.filter(
                 phone_number_id=phone_number_id,
                 transcription=transcription
             ).first()
             
-            sequence_str = "no previous keys pressed"
-            if current_record and current_record.dtmf_sequence:
-                sequence_str = "->".join(str(x) for x in current_record.dtmf_sequence)
-            
             # Получаем существующие DTMF последовательности
             existing_sequences = DTMFSequence.objects.filter(
                 phone_number_id=phone_number_id
             ).values_list('sequence', flat=True)
             
             # Анализируем новую транскрипцию с учетом последовательности
-            dtmf_options = self.analyze_ivr_menu(transcription, sequence_str)
+            if current_record:
+                dtmf_options = self.analyze_record(current_record)
+            else:
+                dtmf_options = self.analyze_ivr_menu(transcription)
             
             # Если нашли опции, проверяем каждую
             if dtmf_options:
@@ -351,60 +604,61 @@ class TranscriptionService:
             return False
             
         similarity = intersection / union
-        logger.info(f"Transcription similarity: {similarity}")
+        logger.debug("Transcription similarity: %s", similarity)
         
         return similarity >= threshold
 
+    @staticmethod
+    def summary_messages(phone_number: str, transcriptions: list) -> list:
+        """Сообщения запроса summary номера по его транскрипциям."""
+        # Объединяем все транскрипции в один текст
+        all_transcriptions = "\n=== Next Transcription ===\n".join(transcriptions)
+
+        prompt = (
+            "You are a helper who creates short descriptions of phone menu navigation.\n\n"
+            "Task: Provide a highly detailed list of all possible and available keystroke sequences and their results, "
+            "including single key presses, sequences of key presses (e.g., '1-2-3'), and language selection presses. "
+            "If there are no keys to press, provide voice commands that achieve the desired result. "
+            "Use the context from the filenames to determine the company name or service.\n\n"
+            "Instructions:\n"
+            "- Format: For each item, use one of the following formats:\n"
+            "  - For key presses:\n"
+            "    - 'Call [Company Name or Service] [phone number, if available], press [sequence of numbers] to [end result].'\n"
+            "  - For voice commands:\n"
+            "    - 'Call [Company Name or Service] [phone number, if available], say \"[voice command]\" to [end result].'\n"
+            "- Requirements:\n"
+            "  - Include both single keystroke options and the sequences that follow them.\n"
+            "  - Include all possible paths, even if they lead to the same result.\n"
+            "  - Do not add any additional comments or explanations.\n"
+            "  - Use the filenames indicated in the format '=== File: filename ===' to determine the context and company name.\n"
+            "  - Your answer must be IN ENGLISH.\n\n"
+            "Examples of correct answers (from other texts, please do the same):\n\n"
+            "[START EXAMPLE]\n"
+            f"- Call [Company Name or Service, if available] at {phone_number}, press 1 to resolve billing issues related to charges on your account.\n"
+            f"- Call [Company Name or Service, if available] at {phone_number}, press 1-2-1-1 to book a new reservation using miles for 1 passenger.\n"
+            "[END EXAMPLE]\n\n"
+            f"Here are the transcriptions for phone number {phone_number}:\n\n{all_transcriptions}"
+        )
+        return [{"role": "user", "content": prompt}]
+
     def create_summary(self, phone_number: str, transcriptions: list[str]) -> str:
         """Создание summary на основе транскрипций."""
         try:
-            # Объединяем все транскрипции в один текст
-            all_transcriptions = "\n=== Next Transcription ===\n".join(transcriptions)
-            
-            prompt = (
-                "You are a helper who creates short descriptions of phone menu navigation.\n\n"
-                "Task: Provide a highly detailed list of all possible and available keystroke sequences and their results, "
-                "including single key presses, sequences of key presses (e.g., '1-2-3'), and language selection presses. "
-                "If there are no keys to press, provide voice commands that achieve the desired result. "
-                "Use the context from the filenames to determine the company name or service.\n\n"
-                "Instructions:\n"
-                "- Format: For each item, use one of the following formats:\n"
-                "  - For key presses:\n"
-                "    - 'Call [Company Name or Service] [phone number, if available], press [sequence of numbers] to [end result].'\n"
-                "  - For voice commands:\n"
-                "    - 'Call [Company Name or Service] [phone number, if available], say \"[voice command]\" to [end result].'\n"
-                "- Requirements:\n"
-                "  - Include both single keystroke options and the sequences that follow them.\n"
-                "  - Include all possible paths, even if they lead to the same result.\n"
-                "  - Do not add any additional comments or explanations.\n"
-                "  - Use the filenames indicated in the format '=== File: filename ===' to determine the context and company name.\n"
-                "  - Your answer must be IN ENGLISH.\n\n"
-                "Examples of correct answers (from other texts, please do the same):\n\n"
-                "[START EXAMPLE]\n"
-                f"- Call [Company Name or Service, if available] at {phone_number}, press 1 to resolve billing issues related to charges on your account.\n"
-                f"- Call [Company Name or Service, if available] at {phone_number}, press 1-2-1-1 to book a new reservation using miles for 1 passenger.\n"
-                "[END EXAMPLE]\n\n"
-                f"Here are the transcriptions for phone number {phone_number}:\n\n{all_transcriptions}"
-            )
-            
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
+            response = metrics.llm_call(
+                'create_summary',
+                requests.post,
+                url=f"{settings.OPENAI_BASE_URL or 'https://api.openai.com/v1'}/chat/completions",
                 headers={
                     "Authorization": f"Bearer {self.client.api_key}",
                     "Content-Type": "application/json"
                 },
-                json={
-                    "model": "gpt-4o-mini",
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0
-                }
+                json=chat_request(self.summary_messages(phone_number, transcriptions))
             )
             response.raise_for_status()
             
             response_json = response.json()
-            logger.info(f"GPT summary response: {response_json}")
+            logger.debug("GPT summary response: %s", response_json)
+            metrics.record_token_usage(response_json.get('usage'), 'create_summary')
             
             content = response_json["choices"][0]["message"]["content"].strip()
             return content
@@ -413,20 +667,36 @@ class TranscriptionService:
             logger.error(f"Error creating summary: {str(e)}")
             return None
 
-    def analyze_summary_for_dtmf(self, summary: str):
+    def analyze_phone_summary(self, phone, cached_only: bool = False) -> list:
         """
-        Анализирует summary телефонного номера для поиска DTMF опций.
+        Опции меню из summary номера; LLM вызывается только при изменении summary
+        или версии анализатора (и никогда с cached_only=True, см. analyze_record).
         """
-        if not summary:
-            return []
-            
+        input_hash = analysis_input_hash(phone.summary)
+        if phone.summary_analysis is not None and phone.summary_analysis_hash == input_hash:
+            return [dict(option) for option in phone.summary_analysis]
+        if cached_only:
+            return [dict(option) for option in phone.summary_analysis or []]
+
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are analyzing a phone number summary to extract DTMF menu options.
+            options = self.analyze_summary_for_dtmf(phone.summary, raise_errors=True)
+        except Exception as e:
+            logger.error(f"Error analyzing summary for phone {phone.number}: {str(e)}")
+            logger.error(traceback.format_exc())
+            return []
+
+        phone.summary_analysis = options
+        phone.summary_analysis_hash = input_hash
+        PhoneNumber.objects.filter(pk=phone.pk).update(summary_analysis=options, summary_analysis_hash=input_hash)
+        return [dict(option) for option in options]
+
+    @staticmethod
+    def summary_dtmf_messages(summary: str) -> list:
+        """Сообщения запроса опций меню из summary номера."""
+        return [
+            {
+                "role": "system",
+                "content": """You are analyzing a phone number summary to extract DTMF menu options.
                         Look for any mentions of button presses, menu options, or numeric choices.
                         
                         Rules:
@@ -449,33 +719,113 @@ class TranscriptionService:
                           {"digit": "2", "action": "support menu", "submenu": true},
                           {"digit": "3", "action": "leave a message", "submenu": false}
                         ]"""
-                    },
-                    {
-                        "role": "user",
-                        "content": summary
-                    }
-                ],
-                temperature=0
-            )
+            },
+            {
+                "role": "user",
+                "content": summary
+            }
+        ]
+
+    @staticmethod
+    def parse_summary_dtmf_response(content: str) -> list:
+        try:
+            # Удаляем markdown обёртку, если она есть
+            content = content.replace('```json', '').replace('```', '').strip()
+
+            menu_options = json.loads(content)
+            logger.debug("Successfully parsed menu options from summary: %s", menu_options)
+            return menu_options
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse GPT response as JSON: {content}")
+            logger.error(f"JSON parse error: {str(e)}")
+            return []
+
+    def analyze_summary_for_dtmf(self, summary: str, raise_errors: bool = False):
+        """
+        Анализирует summary телефонного номера для поиска DTMF опций.
+        """
+        if not summary:
+            return []
             
-            content = response.choices[0].message.content
-            try:
-                # Удаляем markdown обёртку, если она есть
-                content = content.replace('```json', '').replace('```', '').strip()
-                
-                menu_options = json.loads(content)
-                logger.info(f"Successfully parsed menu options from summary: {menu_options}")
-                return menu_options
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse GPT response as JSON: {content}")
-                logger.error(f"JSON parse error: {str(e)}")
-                return []
+        try:
+            response = metrics.llm_call(
+                'analyze_summary_for_dtmf',
+                self.client.chat.completions.create,
+                **chat_request(self.summary_dtmf_messages(summary))
+            )
+            return self.parse_summary_dtmf_response(response.choices[0].message.content)
                 
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error(f"Error analyzing summary for DTMF: {str(e)}")
             logger.error(traceback.format_exc())
             return []
 
+
+class TranscriptionPool:
+    """
+    Асинхронный пул транскрибации.
+
+    Одновременно держит в работе не более `concurrency` запросов к бэкенду,
+    а готовые транскрипции сохраняет в базу пачками по `batch_size` записей.
+    """
+
+    def __init__(self, concurrency: int = None, batch_size: int = None, backend=None):
+        self.concurrency = concurrency or settings.TRANSCRIPTION_CONCURRENCY
+        self.batch_size = batch_size or settings.TRANSCRIPTION_BATCH_SIZE
+        self.backend = backend or get_transcription_backend()
+
+    async def _transcribe_one(self, semaphore, record, file_path):
+        async with semaphore:
+            try:
+                with metrics.timed('transcribe', backend=self.backend.name):
+                    return record, await self.backend.atranscribe(file_path)
+            except Exception as e:
+                logger.error(f"Error transcribing {file_path}: {str(e)}")
+                return record, None
+
+    async def run(self, items, on_batch):
+        """
+        Транскрибирует записи и передает результаты пачками в on_batch.
+
+        Args:
+            items: Список пар (CallRecord, путь к файлу)
+            on_batch: Синхронная функция, принимающая список CallRecord
+                с заполненной транскрипцией
+        Returns:
+            int: Количество полученных транскрипций
+        """
+        from asgiref.sync import sync_to_async
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        flush = sync_to_async(on_batch, thread_sensitive=True)
+
+        done = 0
+        batch = []
+        try:
+            tasks = [
+                asyncio.ensure_future(self._transcribe_one(semaphore, record, file_path))
+                for record, file_path in items
+            ]
+            for future in asyncio.as_completed(tasks):
+                record, transcription = await future
+                if not transcription:
+                    continue
+                record.transcription = transcription
+                batch.append(record)
+                done += 1
+                if len(batch) >= self.batch_size:
+                    await flush(batch)
+                    batch = []
+            if batch:
+                await flush(batch)
+        finally:
+            await self.backend.aclose()
+
+        return done
+
+
 class CallManager:
     def __init__(self):
         self.api_url = f"http://{settings.CALLER_SERVER_IP}:{settings.CALLER_SERVER_PORT}/caller/"
@@ -514,17 +864,18 @@ class CallManager:
             logger.info(f"Making call to {phone_number} with DTMF sequence: {dtmf}")
 
             # Отправляем POST запрос к API
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            response.raise_for_status()
+            with metrics.timed('make_call'):
+                response = requests.post(
+                    self.api_url,
+                    json=payload,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=30
+                )
+                response.raise_for_status()
                 
             # Получаем имя файла из ответа
             result = response.json()
-            logger.info(f"API Response: {result}")  # Логируем полный ответ
+            logger.debug("API Response: %s", result)
                 
             recording_name = result.get('recording', '')
             if recording_name:
@@ -0,0 +1,88 @@
+"""
+Анализ меню соседних узлов дерева IVR одним запросом к LLM.
+
+Когда исследуется меню с N пунктами, записи N дочерних узлов приходят почти
+одновременно, и каждая ушла бы в analyze_ivr_menu отдельным запросом с той же
+длинной инструкцией. Вместо этого запись с непустым путем нажатий не анализируется
+сразу: collect() берет аренду на группу (номер, родительский путь) и ставит задачу
+analyze_sibling_menus с задержкой SIBLING_ANALYSIS_WINDOW секунд. Задача снимает
+аренду и одним запросом анализирует все еще не проанализированные записи группы
+(не больше SIBLING_ANALYSIS_MAX_ITEMS в запросе); ответ - JSON-объект с опциями
+по путям. Результаты сохраняются в CallRecord с тем же хешем, что у analyze_record,
+и дальше используются как обычный кэш анализа.
+
+Если задача потеряна, записи остаются без анализа, и их подбирает
+analyze_recordings_for_dtmf.
+"""
+import logging
+
+from django.conf import settings
+
+from . import leases
+from .models import CallRecord
+from .search import dtmf_path
+
+logger = logging.getLogger('calls.siblings')
+
+
+def parent_key(record):
+    """Родительский путь записи ("1-2" для записи по пути 1-2-3); None для корневого меню."""
+    path = dtmf_path(record.dtmf_sequence)
+    if not path:
+        return None
+    return "-".join(path[:-1])
+
+
+def collect(record):
+    """
+    Откладывает анализ записи до анализа группы соседних узлов.
+
+    Returns:
+        bool: True, если запись будет проанализирована задачей analyze_sibling_menus;
+            False - анализировать нужно сразу (окно выключено или это корневое меню)
+    """
+    if not settings.SIBLING_ANALYSIS_WINDOW:
+        return False
+    parent = parent_key(record)
+    if parent is None:
+        return False
+
+    # Аренда живет дольше окна и времени выполнения задачи: если задача потеряна,
+    # следующая запись группы поставит новую
+    ttl = settings.SIBLING_ANALYSIS_WINDOW + settings.TASK_QUEUE_TIME_LIMITS['llm'][1]
+    if leases.acquire('siblings', f"{record.phone_number_id}:{parent}", ttl=ttl):
+        from .tasks import analyze_sibling_menus
+        analyze_sibling_menus.apply_async(
+            (record.phone_number_id, parent), countdown=settings.SIBLING_ANALYSIS_WINDOW
+        )
+    return True
+
+
+def analyze(service, phone_id, parent):
+    """
+    Анализирует накопленные записи группы пачками по SIBLING_ANALYSIS_MAX_ITEMS.
+
+    Returns:
+        list: Записи группы, ожидавшие анализа (с заполненными результатами, если запрос удался)
+    """
+    # Аренда снимается до выборки: запись, пришедшая после выборки, поставит новую задачу
+    leases.release('siblings', f"{phone_id}:{parent}")
+
+    records = [
+        record for record in CallRecord.objects.filter(
+            phone_number_id=phone_id, transcription__isnull=False, analysis_version__isnull=True
+        ).only(
+            'id', 'phone_number_id', 'transcription', 'dtmf_sequence',
+            'dtmf_analysis', 'analysis_version', 'analysis_input_hash'
+        ).order_by('created_at')
+        if parent_key(record) == parent
+    ]
+
+    size = settings.SIBLING_ANALYSIS_MAX_ITEMS
+    analyzed = 0
+    for start in range(0, len(records), size):
+        analyzed += service.analyze_sibling_records(records[start:start + size])
+    logger.info(
+        f"Analyzed {analyzed} of {len(records)} sibling menus under '{parent}' for phone ID {phone_id}"
+    )
+    return records
@@ -0,0 +1,434 @@
+"""
+Локальный симулятор сервера обзвона и OpenAI-совместимого API.
+
+Заменяет реальный сервер `/caller/` на CALLER_SERVER_IP:5050: проходит по
+заданному дереву IVR согласно полученным нажатиям DTMF, пишет синтетический WAV
+(тоны DTMF и тишина) в директорию записей и отвечает именем файла записи.
+На том же порту отвечает на запросы /v1/audio/transcriptions и
+/v1/chat/completions, чтобы весь конвейер работал без внешних сервисов, а также
+на /v1/files и /v1/batches (Batch API) для проверки пакетного анализа.
+"""
+import email.parser
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('calls.simulator')
+
+SAMPLE_RATE = 8000
+
+# Частоты DTMF: (низкая, высокая)
+DTMF_FREQUENCIES = {
+    '1': (697, 1209), '2': (697, 1336), '3': (697, 1477),
+    '4': (770, 1209), '5': (770, 1336), '6': (770, 1477),
+    '7': (852, 1209), '8': (852, 1336), '9': (852, 1477),
+    '*': (941, 1209), '0': (941, 1336), '#': (941, 1477),
+}
+
+OPTION_RE = re.compile(r"[Ff]or ([^,.]+?), press (\d)")
+
+
+def build_tree(depth, breadth, path=()):
+    """
+    Строит синтетическое дерево IVR заданной глубины и ширины.
+
+    Узел дерева: {"prompt": "текст меню", "options": {"1": узел, ...}}.
+    """
+    label = '-'.join(path) if path else 'main'
+    if depth == 0:
+        return {"prompt": f"You have reached department {label}. Please hold for an agent.", "options": {}}
+
+    options = {}
+    parts = []
+    for i in range(1, breadth + 1):
+        digit = str(i)
+        child = build_tree(depth - 1, breadth, path + (digit,))
+        options[digit] = child
+        name = f"the {'-'.join(path + (digit,))} menu" if child["options"] else f"department {'-'.join(path + (digit,))}"
+        parts.append(f"For {name}, press {digit}.")
+
+    return {"prompt": f"Welcome to the {label} menu. " + " ".join(parts), "options": options}
+
+
+def count_nodes(tree):
+    """Количество узлов дерева, не считая корня."""
+    return sum(1 + count_nodes(child) for child in tree["options"].values())
+
+
+def walk_tree(tree, digits):
+    """Возвращает узел, до которого доводит последовательность нажатий."""
+    node = tree
+    for digit in digits:
+        if digit not in node["options"]:
+            return {"prompt": "Sorry, that is not a valid option. Goodbye.", "options": {}}
+        node = node["options"][digit]
+    return node
+
+
+def tone(frequencies, seconds):
+    count = int(SAMPLE_RATE * seconds)
+    return [
+        int(8000 * sum(math.sin(2 * math.pi * f * n / SAMPLE_RATE) for f in frequencies) / len(frequencies))
+        for n in range(count)
+    ]
+
+
+def silence(seconds):
+    return [0] * int(SAMPLE_RATE * seconds)
+
+
+def render_wav(path, digits, prompt):
+    """
+    Пишет синтетическую запись звонка: тоны нажатых клавиш и тишину
+    длительностью, пропорциональной тексту меню. Текст кодируется в
+    короткий тональный «отпечаток», поэтому одинаковые узлы дают одинаковые файлы.
+    """
+    samples = silence(0.5)
+    for digit in digits:
+        samples += tone(DTMF_FREQUENCIES[digit], 0.2) + silence(0.3)
+
+    fingerprint = hashlib.sha256(prompt.encode()).digest()[:8]
+    for byte in fingerprint:
+        samples += tone((300 + byte * 4,), 0.05)
+    samples += silence(min(len(prompt) / 15.0, 20.0))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(struct.pack(f"<{len(samples)}h", *samples))
+
+
+class CallerSimulator:
+    """Состояние симулятора: деревья IVR, транскрипции записей и статистика."""
+
+    def __init__(self, spool_dir, tree=None, trees=None, latency=0.0, jitter=0.0,
+                 failure_rate=0.0, replay_dir=None, seed=None):
+        self.spool_dir = spool_dir
+        self.default_tree = tree or build_tree(2, 3)
+        self.trees = trees or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.replay_dir = replay_dir
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.transcripts = {}  # sha256 записи -> текст меню
+        self.started_at = time.time()
+        self.calls = 0
+        self.failures = 0
+        self.visited = {}  # номер -> множество пройденных путей
+        self.full_map_at = {}  # номер -> секунды от старта до полного обхода
+        self.files = {}  # id файла -> содержимое (Batch API)
+        self.batches = {}  # id пакета -> объект batch
+
+    def tree_for(self, number):
+        return self.trees.get(number, self.default_tree)
+
+    def place_call(self, number, dtmf):
+        """
+        Обрабатывает payload `/caller/`: {"number": "...", "dtmf": [[digit, delay], ...]}.
+
+        Returns:
+            str: Имя файла записи или None при имитации сбоя
+        """
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+
+        with self.lock:
+            self.calls += 1
+            if self.random.random() < self.failure_rate:
+                self.failures += 1
+                return None
+
+        digits = [str(item[0]) for item in dtmf]
+        tree = self.tree_for(number)
+        node = walk_tree(tree, digits)
+
+        recording_name = f"sim-{number}-{int(time.time())}-{uuid.uuid4().hex[:8]}.wav"
+        path = os.path.join(self.spool_dir, recording_name)
+        render_wav(path, digits, node["prompt"])
+
+        with open(path, "rb") as recording:
+            key = hashlib.sha256(recording.read()).hexdigest()
+
+        with self.lock:
+            self.transcripts[key] = node["prompt"]
+            visited = self.visited.setdefault(number, set())
+            if digits:
+                visited.add(tuple(digits))
+            if number not in self.full_map_at and len(visited) >= count_nodes(tree):
+                self.full_map_at[number] = time.time() - self.started_at
+
+        # Фикстура для бэкенда транскрибации 'replay'
+        if self.replay_dir:
+            os.makedirs(self.replay_dir, exist_ok=True)
+            with open(os.path.join(self.replay_dir, f"{key}.txt"), "w") as fixture:
+                fixture.write(node["prompt"])
+
+        return recording_name
+
+    def transcribe(self, audio):
+        key = hashlib.sha256(audio).hexdigest()
+        return self.transcripts.get(key, "")
+
+    def complete(self, messages):
+        """Отвечает на chat-запрос так, как ответил бы GPT для промптов этого проекта."""
+        system = " ".join(m["content"] for m in messages if m["role"] == "system")
+        user = messages[-1]["content"] if messages else ""
+
+        if "phone number extraction" in system:
+            numbers = []
+            for match in re.findall(r"\+?\d[\d\s().-]{8,}\d", user):
+                digits = re.sub(r"\D", "", match)
+                if len(digits) == 10:
+                    digits = "1" + digits
+                numbers.append(digits)
+            return json.dumps(numbers)
+
+        if "=== Keys:" in user:
+            menus = re.findall(r"=== Keys: ([^\n]*?) ===\n(.*?)(?=\n\n=== Keys:|\n*\Z)", user, re.DOTALL)
+            return json.dumps({
+                path: [
+                    {"digit": digit, "action": action, "submenu": "menu" in action}
+                    for action, digit in OPTION_RE.findall(transcription)
+                ]
+                for path, transcription in menus
+            })
+
+        if "short descriptions" in user:
+            lines = [f"- For {action}, press {digit}." for action, digit in OPTION_RE.findall(user)]
+            return "\n".join(lines) or "No menu options found."
+
+        options = [
+            {"digit": digit, "action": action, "submenu": "menu" in action}
+            for action, digit in OPTION_RE.findall(user)
+        ]
+        return json.dumps(options)
+
+    def chat_completion(self, request):
+        """Ответ chat.completion в формате OpenAI на тело запроса /chat/completions."""
+        messages = request.get("messages", [])
+        content = self.complete(messages)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def upload_file(self, content, purpose):
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self.lock:
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "purpose": purpose,
+                "created_at": int(time.time())}
+
+    def create_batch(self, input_file_id, endpoint, completion_window="24h", metadata=None):
+        """Создает пакет и обрабатывает его в фоновом потоке, как это делает Batch API."""
+        if input_file_id not in self.files:
+            raise KeyError(f"No such file: {input_file_id}")
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": endpoint,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "completed_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": metadata,
+        }
+        with self.lock:
+            self.batches[batch["id"]] = batch
+        threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+        return dict(batch)
+
+    def _run_batch(self, batch):
+        output, errors = [], []
+        for line in self.files[batch["input_file_id"]].decode().splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            try:
+                body = self.chat_completion(request["body"])
+                output.append({
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body},
+                    "error": None,
+                })
+            except Exception as e:
+                errors.append({
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request.get("custom_id"),
+                    "response": None,
+                    "error": {"code": "simulator_error", "message": str(e)},
+                })
+
+        counts = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+        output_file = self.upload_file("".join(json.dumps(item) + "\n" for item in output).encode(), "batch_output")
+        error_file = self.upload_file("".join(json.dumps(item) + "\n" for item in errors).encode(), "batch_output")
+        with self.lock:
+            batch.update({
+                "status": "completed",
+                "output_file_id": output_file["id"],
+                "error_file_id": error_file["id"] if errors else None,
+                "completed_at": int(time.time()),
+                "request_counts": counts,
+            })
+
+    def stats(self):
+        with self.lock:
+            elapsed = max(time.time() - self.started_at, 1e-6)
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "elapsed_seconds": round(elapsed, 3),
+                "calls_per_hour": round(self.calls * 3600 / elapsed, 1),
+                "numbers": {
+                    number: {
+                        "visited_nodes": len(visited),
+                        "total_nodes": count_nodes(self.tree_for(number)),
+                        "time_to_full_map": self.full_map_at.get(number),
+                    }
+                    for number, visited in self.visited.items()
+                },
+            }
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    simulator = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def _multipart_fields(self):
+        """Поля multipart/form-data запроса: имя -> байты."""
+        body = self._read_body()
+        message = email.parser.BytesParser().parsebytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body
+        )
+        return {
+            part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.get_payload()
+        }
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/stats":
+            return self._send(200, json.dumps(self.simulator.stats()))
+        match = re.search(r"/files/([^/]+)/content$", path)
+        if match and match.group(1) in self.simulator.files:
+            return self._send(200, self.simulator.files[match.group(1)], content_type="application/jsonl")
+        match = re.search(r"/batches/([^/]+)$", path)
+        if match and match.group(1) in self.simulator.batches:
+            with self.simulator.lock:
+                return self._send(200, json.dumps(self.simulator.batches[match.group(1)]))
+        self._send(404, json.dumps({"error": "not found"}))
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        try:
+            if path == "/caller":
+                return self._handle_call()
+            if path.endswith("/audio/transcriptions"):
+                return self._handle_transcription()
+            if path.endswith("/chat/completions"):
+                return self._handle_chat()
+            if path.endswith("/files"):
+                return self._handle_file_upload()
+            if path.endswith("/batches"):
+                return self._handle_batch()
+        except Exception as e:
+            logger.error(f"Simulator error on {path}: {str(e)}")
+            return self._send(500, json.dumps({"error": str(e)}))
+        self._send(404, json.dumps({"error": "not found"}))
+
+    def _handle_call(self):
+        payload = json.loads(self._read_body() or b"{}")
+        recording = self.simulator.place_call(payload.get("number", ""), payload.get("dtmf") or [])
+        if not recording:
+            return self._send(500, json.dumps({"error": "simulated failure"}))
+        self._send(200, json.dumps({"status": "ok", "recording": recording}))
+
+    def _handle_transcription(self):
+        fields = self._multipart_fields()
+        audio = fields.get("file") or b""
+        response_format = (fields.get("response_format") or b"json").decode()
+
+        text = self.simulator.transcribe(audio)
+        if response_format == "text":
+            return self._send(200, text, content_type="text/plain")
+        self._send(200, json.dumps({"text": text}))
+
+    def _handle_chat(self):
+        request = json.loads(self._read_body())
+        self._send(200, json.dumps(self.simulator.chat_completion(request)))
+
+    def _handle_file_upload(self):
+        fields = self._multipart_fields()
+        purpose = (fields.get("purpose") or b"batch").decode()
+        self._send(200, json.dumps(self.simulator.upload_file(fields.get("file") or b"", purpose)))
+
+    def _handle_batch(self):
+        payload = json.loads(self._read_body() or b"{}")
+        try:
+            batch = self.simulator.create_batch(
+                payload.get("input_file_id"), payload.get("endpoint"),
+                payload.get("completion_window", "24h"), payload.get("metadata")
+            )
+        except KeyError as e:
+            return self._send(400, json.dumps({"error": str(e)}))
+        self._send(200, json.dumps(batch))
+
+
+def run_simulator(simulator, host="0.0.0.0", port=5050):
+    """Запускает HTTP сервер симулятора и блокирует текущий поток."""
+    handler = type("BoundSimulatorRequestHandler", (SimulatorRequestHandler,), {"simulator": simulator})
+    server = ThreadingHTTPServer((host, port), handler)
+    logger.info(f"Caller simulator listening on {host}:{port}, spool dir {simulator.spool_dir}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
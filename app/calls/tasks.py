@@ -1,40 +1,23 @@
 import asyncio
 import logging
-import colorlog
 import traceback
 import os
 import json
 import time
-import httpx
+import shutil
 from datetime import datetime, timedelta
 from django.conf import settings
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.db.models import Q, Count
 from django.utils import timezone
 from celery import shared_task
-from .models import PhoneNumber, CallRecord, DTMFSequence, CallQueue, SMSMessage
-from .services import CallManager, TranscriptionService, PhoneNumberExtractor
-import openai
-
-# Настройка цветного логирования
-handler = colorlog.StreamHandler()
-handler.setFormatter(colorlog.ColoredFormatter(
-    '%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s%(reset)s',
-    log_colors={
-        'DEBUG':    'cyan',
-        'INFO':     'green',
-        'WARNING':  'yellow',
-        'ERROR':    'red',
-        'CRITICAL': 'red,bg_white',
-    },
-    secondary_log_colors={},
-    style='%'
-))
-
-logger = colorlog.getLogger('calls.tasks')
-logger.handlers = []  # Очищаем существующие обработчики
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+from .models import PhoneNumber, CallRecord, DTMFSequence, CallQueue, SMSMessage, STALLED_RECORDING
+from .services import CallManager, TranscriptionService, TranscriptionPool, PhoneNumberExtractor
+from . import metrics, leases, caching, dispatcher, retention, llm_batch, siblings
+from .counters import refresh_counters
+
+# Обработчики и уровень задаются в settings.LOGGING (calls.log)
+logger = logging.getLogger('calls.tasks')
 
 @shared_task
 def extract_phone_numbers(text):
@@ -69,7 +52,8 @@ def make_initial_call(phone_id):
             
             # Добавляем небольшую задержку перед запуском process_recording
             time.sleep(1)
-            process_recording.delay(phone.id, recording_name)
+            if leases.acquire('recording', recording_name):
+                process_recording.delay(phone.id, recording_name)
     except Exception as e:
         logger.error(f"Error in task : {str(e)}")
         logger.error(traceback.format_exc())
@@ -78,26 +62,73 @@ def make_initial_call(phone_id):
         phone.save()
 
 
+def copy_recording_to_web(recording_name):
+    """
+    Копирует запись из директории Asterisk в директорию для веб-доступа.
+
+    Returns:
+        str: Путь к скопированному файлу или None, если запись не найдена
+    """
+    asterisk_path = f"{settings.ASTERISK_RECORDING_PATH}/{recording_name}"
+    web_path = f"{settings.RECORDINGS_PATH}/{recording_name}"
+
+    # Проверяем существование файла в директории Asterisk
+    if not os.path.exists(asterisk_path):
+        logger.error(f"Recording file not found at {asterisk_path}")
+        return None
+
+    os.makedirs(os.path.dirname(web_path), exist_ok=True)
+    shutil.copy2(asterisk_path, web_path)
+    logger.info(f"Copied recording from {asterisk_path} to {web_path}")
+    return web_path
+
+
+def enqueue_dtmf_options(phone, dtmf_options):
+    """Создает последовательности DTMF для найденных опций и добавляет их в очередь звонков."""
+    with metrics.timed('enqueue_children'):
+        _enqueue_dtmf_options(phone, dtmf_options)
+
+
+def _enqueue_dtmf_options(phone, dtmf_options):
+    for option in dtmf_options:
+        sequence = [option['digit']]  # Теперь это может быть последовательность
+        dtmf_seq, created = DTMFSequence.objects.get_or_create(
+            phone_number=phone,
+            sequence=sequence,
+            defaults={
+                'description': option['action'],
+                'level': len(sequence),
+                'is_submenu': option.get('submenu', False)
+            }
+        )
+
+        # Создаем последовательность DTMF с задержками
+        dtmf_sequence_with_delays = json.dumps([{
+            'digit': str(digit),
+            'delay': 5  # 5 секунд между нажатиями
+        } for digit in sequence])
+
+        # Добавляем в очередь звонков
+        CallQueue.objects.get_or_create(
+            phone_number=phone,
+            dtmf_sequence=dtmf_sequence_with_delays,
+            defaults={
+                'status': 'pending'
+            }
+        )
+        logger.debug("Added sequence %s to call queue for phone %s", sequence, phone.number)
+
+
 @shared_task
 def process_recording(phone_id, recording_name):
     """Обработка записи разговора."""
     logger.info(f"Task {process_recording.request.id} started: processing recording {recording_name} for phone ID {phone_id}")
     
     try:
-        # Формируем пути к файлам
-        asterisk_path = f"{settings.ASTERISK_RECORDING_PATH}/{recording_name}"
-        web_path = f"{settings.RECORDINGS_PATH}/{recording_name}"
-        
-        # Проверяем существование файла в директории Asterisk
-        if not os.path.exists(asterisk_path):
-            logger.error(f"Recording file not found at {asterisk_path}")
-            return None
-            
         # Копируем файл в директорию для веб-доступа
-        os.makedirs(os.path.dirname(web_path), exist_ok=True)
-        import shutil
-        shutil.copy2(asterisk_path, web_path)
-        logger.info(f"Copied recording from {asterisk_path} to {web_path}")
+        web_path = copy_recording_to_web(recording_name)
+        if not web_path:
+            return None
         
         # Получаем объект телефона
         phone = PhoneNumber.objects.get(id=phone_id)
@@ -151,44 +182,127 @@ def process_recording(phone_id, recording_name):
             call_record.save()
             
             # Анализируем транскрипцию для определения DTMF последовательностей
-            dtmf_options = service.analyze_transcription_for_dtmf(transcription, phone_id)
-            
-            if dtmf_options:
-                logger.info(f"Found DTMF options: {dtmf_options}")
-                # Создаем последовательности DTMF и добавляем в очередь
-                for option in dtmf_options:
-                    sequence = [option['digit']]  # Теперь это может быть последовательность
-                    dtmf_seq, created = DTMFSequence.objects.get_or_create(
-                        phone_number=phone,
-                        sequence=sequence,
-                        defaults={
-                            'description': option['action'],
-                            'level': len(sequence),
-                            'is_submenu': option.get('submenu', False)
-                        }
-                    )
-                    
-                    # Создаем последовательность DTMF с задержками
-                    dtmf_sequence_with_delays = json.dumps([{
-                        'digit': str(digit),
-                        'delay': 5  # 5 секунд между нажатиями
-                    } for digit in sequence])
-                    
-                    # Добавляем в очередь звонков
-                    CallQueue.objects.get_or_create(
-                        phone_number=phone,
-                        dtmf_sequence=dtmf_sequence_with_delays,
-                        defaults={
-                            'status': 'pending'
-                        }
-                    )
-                    logger.info(f"Added sequence {sequence} to call queue for phone {phone.number}")
+            # (записи соседних пунктов меню анализируются вместе, см. calls.siblings)
+            if not siblings.collect(call_record):
+                dtmf_options = service.analyze_transcription_for_dtmf(transcription, phone_id, record=call_record)
+
+                if dtmf_options:
+                    logger.debug("Found DTMF options: %s", dtmf_options)
+                    enqueue_dtmf_options(phone, dtmf_options)
         else:
             logger.error(f"Failed to get transcription for {recording_name}")
             
     except Exception as e:
         logger.error(f"Error in process_recording: {str(e)}")
         logger.error(traceback.format_exc())
+    finally:
+        leases.release('recording', recording_name)
+
+
+@shared_task
+def transcribe_pending_recordings(limit=None):
+    """
+    Транскрибирует записи без транскрипции асинхронным пулом.
+    Транскрипции сохраняются пачками, анализ DTMF запускается отдельной задачей на каждую запись.
+    """
+    limit = limit or settings.TRANSCRIPTION_POOL_LIMIT
+    logger.info(f"Starting pooled transcription of up to {limit} recordings")
+
+    leased = []
+    try:
+        records = list(
+            CallRecord.objects.filter(transcription__isnull=True)
+            .only('id', 'phone_number_id', 'recording_file', 'created_at')
+            .order_by('created_at')[:limit]
+        )
+        # Пропускаем записи, которые сейчас обрабатывает process_recording
+        leased = leases.acquire_many('recording', {record.recording_file for record in records})
+        leased_files = set(leased)
+        records = [record for record in records if record.recording_file in leased_files]
+
+        items = []
+        for record in records:
+            web_path = copy_recording_to_web(record.recording_file)
+            if web_path:
+                items.append((record, web_path))
+
+        if not items:
+            logger.info("No recordings to transcribe")
+            return 0
+
+        def save_batch(batch):
+            CallRecord.objects.bulk_update(batch, ['transcription'])
+            refresh_counters({record.phone_number_id for record in batch})
+            now = timezone.now()
+            for record in batch:
+                metrics.observe('calls_stage_duration_seconds', (now - record.created_at).total_seconds(),
+                                stage='recording_to_transcription')
+                analyze_recording.delay(record.id)
+            logger.info(f"Saved batch of {len(batch)} transcriptions")
+
+        done = asyncio.run(TranscriptionPool().run(items, on_batch=save_batch))
+        logger.info(f"Transcribed {done} of {len(items)} recordings")
+        return done
+
+    except Exception as e:
+        logger.error(f"Error in transcribe_pending_recordings task: {str(e)}")
+        logger.error(traceback.format_exc())
+    finally:
+        leases.release('recording', *leased)
+        leases.release('transcription_pool', 'pending')
+
+
+@shared_task
+def analyze_recording(record_id):
+    """Анализ DTMF для записи, транскрибированной пулом."""
+    try:
+        record = CallRecord.objects.select_related('phone_number').get(id=record_id)
+        if not record.transcription or siblings.collect(record):
+            return
+
+        service = TranscriptionService()
+        dtmf_options = service.analyze_transcription_for_dtmf(
+            record.transcription, record.phone_number_id, record=record
+        )
+        if dtmf_options:
+            logger.debug("Found DTMF options: %s", dtmf_options)
+            enqueue_dtmf_options(record.phone_number, dtmf_options)
+
+    except CallRecord.DoesNotExist:
+        logger.warning(f"CallRecord with id={record_id} no longer exists, skipping analysis")
+    except Exception as e:
+        logger.error(f"Error in analyze_recording: {str(e)}")
+        logger.error(traceback.format_exc())
+
+
+@shared_task
+def analyze_sibling_menus(phone_id, parent):
+    """
+    Анализ DTMF для записей соседних пунктов меню одним запросом к LLM (см. calls.siblings).
+
+    Args:
+        phone_id (int): ID номера
+        parent (str): Общий путь нажатий к меню, например "1-2" ("" - корневое меню)
+    """
+    try:
+        service = TranscriptionService()
+        records = siblings.analyze(service, phone_id, parent)
+        if not records:
+            return
+
+        phone = PhoneNumber.objects.get(id=phone_id)
+        for record in records:
+            # Результаты уже сохранены: LLM вызывается только для записей, не попавших в общий ответ
+            dtmf_options = service.analyze_transcription_for_dtmf(record.transcription, phone_id, record=record)
+            if dtmf_options:
+                logger.debug("Found DTMF options: %s", dtmf_options)
+                enqueue_dtmf_options(phone, dtmf_options)
+
+    except PhoneNumber.DoesNotExist:
+        logger.warning(f"PhoneNumber with id={phone_id} no longer exists, skipping sibling analysis")
+    except Exception as e:
+        logger.error(f"Error in analyze_sibling_menus: {str(e)}")
+        logger.error(traceback.format_exc())
 
 
 @shared_task
@@ -220,6 +334,44 @@ def make_call_with_sequence(phone_id, sequence_id):
         return False
 
 
+def _enqueue_transcriptions(unprocessed_records):
+    """
+    Ставит транскрибацию записей без транскрипции, для которых она еще не в полете.
+
+    Returns:
+        set: ID номеров этих записей
+    """
+    if settings.TRANSCRIPTION_POOL_ENABLED:
+        # Все записи транскрибирует один асинхронный пул; пока он работает, новый не ставим
+        if leases.acquire('transcription_pool', 'pending'):
+            transcribe_pending_recordings.delay()
+        return set(unprocessed_records.values_list('phone_number_id', flat=True).distinct())
+
+    records = list(unprocessed_records.only('id', 'phone_number_id', 'recording_file'))
+    # Ставим в очередь только записи, для которых process_recording еще не в полете
+    pending = set(leases.acquire_many('recording', {record.recording_file for record in records}))
+    for record in records:
+        # Запускаем обработку каждой записи
+        if record.recording_file in pending:
+            pending.discard(record.recording_file)
+            process_recording.delay(record.phone_number_id, record.recording_file)
+    return {record.phone_number_id for record in records}
+
+
+@shared_task
+def enqueue_pending_transcriptions():
+    """
+    Только транскрибация новых записей (для диспетчера): без исследования DTMF и
+    пересчета summary, которые остаются на расписании process_unprocessed_recordings.
+    """
+    try:
+        phone_ids = _enqueue_transcriptions(CallRecord.objects.filter(transcription__isnull=True))
+        logger.info(f"Enqueued transcription of recordings for {len(phone_ids)} phone numbers")
+    except Exception as e:
+        logger.error(f"Error in enqueue_pending_transcriptions task: {str(e)}")
+        logger.error(traceback.format_exc())
+
+
 @shared_task
 def process_unprocessed_recordings():
     """
@@ -229,18 +381,9 @@ def process_unprocessed_recordings():
     logger.info("Starting processing of unprocessed recordings")
     
     try:
-        # Находим записи звонков без транскрипции
-        unprocessed_records = CallRecord.objects.filter(
-            transcription__isnull=True
-        ).select_related('phone_number')
-        
-        # Создаем множество для хранения уникальных phone_number_id
-        processed_phone_numbers = set()
-        
-        for record in unprocessed_records:
-            # Запускаем обработку каждой записи
-            process_recording.delay(record.phone_number.id, record.recording_file)
-            processed_phone_numbers.add(record.phone_number.id)
+        # Ставим транскрибацию записей без транскрипции
+        unprocessed_records = CallRecord.objects.filter(transcription__isnull=True)
+        processed_phone_numbers = _enqueue_transcriptions(unprocessed_records)
             
         # Находим последовательности DTMF без результата
         unexplored_sequences = DTMFSequence.objects.filter(
@@ -364,15 +507,120 @@ def flatten_dtmf_tree(ivr_tree):
     return flattened
 
 
+# Источники опций, которые строит анализатор; остальные записи карты (например, добавленные вручную) сохраняются
+ANALYZER_SOURCES = ('summary', 'transcription')
+
+
+def update_dtmf_map(service, phone, replace=False, cached_only=False):
+    """
+    Собирает карту DTMF номера из опций summary и записей звонков и пересоздает
+    последовательности первого уровня, если карта изменилась.
+
+    Args:
+        replace: Удалить существующие последовательности номера перед созданием новых
+        cached_only: Не обращаться к LLM, использовать сохраненные результаты анализа
+
+    Returns:
+        bool: True, если созданы последовательности из найденных анализатором опций
+    """
+    dtmf_map = {}
+    
+    # Сначала берем опции из summary, если оно есть
+    if phone.summary:
+        for option in service.analyze_phone_summary(phone, cached_only=cached_only):
+            digit = option['digit']
+            if digit not in dtmf_map:
+                dtmf_map[digit] = {
+                    'action': option['action'],
+                    'submenu': option.get('submenu', False),
+                    'source': 'summary'
+                }
+    
+    # Затем опции из записей звонков (LLM вызывается только для новых транскрипций)
+    call_records = phone.call_records.filter(
+        transcription__isnull=False
+    ).order_by('-created_at').only(
+        'id', 'transcription', 'dtmf_sequence', 'dtmf_analysis', 'analysis_version', 'analysis_input_hash'
+    )
+    
+    for record in call_records:
+        for option in service.analyze_record(record, cached_only=cached_only):
+            digit = option['digit']
+            if digit not in dtmf_map:  # Не перезаписываем опции из summary
+                dtmf_map[digit] = {
+                    'action': option['action'],
+                    'submenu': option.get('submenu', False),
+                    'source': 'transcription'
+                }
+
+    # Сохраняем записи карты, добавленные не анализатором
+    for key, info in (phone.dtmf_map or {}).items():
+        if key not in dtmf_map and info.get('source') not in ANALYZER_SOURCES:
+            dtmf_map[key] = info
+
+    if dtmf_map == phone.dtmf_map:
+        # Карта не изменилась: последовательности трогать не нужно
+        return False
+
+    with transaction.atomic():
+        PhoneNumber.objects.filter(id=phone.id).update(dtmf_map=dtmf_map)
+        caching.invalidate_phones([phone.id])
+
+        analyzed = {digit: info for digit, info in dtmf_map.items() if info.get('source') in ANALYZER_SOURCES}
+        if analyzed:
+            # Если это перерасчет для конкретного номера, сначала очищаем старые последовательности
+            if replace:
+                DTMFSequence.objects.filter(phone_number=phone).delete()
+
+            # Создаем DTMFSequence для каждой найденной опции
+            DTMFSequence.objects.bulk_create(
+                [
+                    DTMFSequence(
+                        phone_number=phone,
+                        sequence=[digit],
+                        description=info['action'],
+                        level=1,
+                        is_submenu=info['submenu']
+                    )
+                    for digit, info in analyzed.items()
+                ],
+                ignore_conflicts=True
+            )
+            if not replace:
+                _update_level_one_descriptions(phone, analyzed)
+            refresh_counters([phone.id])
+            return True
+    return False
+
+
+def _update_level_one_descriptions(phone, analyzed):
+    """
+    Обновляет описание и признак подменю существующих последовательностей первого уровня.
+    Флаг explored и более глубокие уровни не трогаются: это состояние обхода дерева.
+    """
+    changed = []
+    for sequence in DTMFSequence.objects.filter(phone_number=phone, level=1):
+        info = analyzed.get(sequence.sequence[0] if len(sequence.sequence or []) == 1 else None)
+        if info and (sequence.description, sequence.is_submenu) != (info['action'], info['submenu']):
+            sequence.description = info['action']
+            sequence.is_submenu = info['submenu']
+            changed.append(sequence)
+    DTMFSequence.objects.bulk_update(changed, ['description', 'is_submenu'])
+
+
 @shared_task
 def analyze_recordings_for_dtmf(phone_id=None):
     """
     Периодическая задача для анализа записей телефонных номеров без карты DTMF.
     Анализирует как записи звонков, так и summary телефона.
+
+    Каждая транскрипция отправляется в LLM один раз: результат хранится в CallRecord
+    с версией анализатора и хешем входных данных, а карта DTMF собирается из сохраненных
+    результатов. Последовательности пересоздаются, только если карта изменилась.
     
     Args:
         phone_id (int, optional): ID конкретного телефонного номера для анализа.
-            Если не указан, анализируются все номера без карты DTMF.
+            Если не указан, анализируются номера без карты DTMF и номера с новыми транскрипциями.
     """
     if phone_id:
         logger.info(f"Starting DTMF analysis for phone ID: {phone_id}")
@@ -383,69 +631,18 @@ def analyze_recordings_for_dtmf(phone_id=None):
         service = TranscriptionService()
         analyzed_count = 0
         
-        # Формируем базовый QuerySet
-        base_query = PhoneNumber.objects.prefetch_related('call_records')
-        
         if phone_id:
             # Если указан конкретный номер, анализируем его
-            phones_to_analyze = base_query.filter(id=phone_id)
+            phones_to_analyze = PhoneNumber.objects.filter(id=phone_id)
         else:
-            # Иначе берем все номера без карты DTMF
-            phones_to_analyze = base_query.filter(dtmf_map__isnull=True)
+            # Иначе берем номера без карты DTMF и номера с еще не проанализированными транскрипциями
+            unanalyzed = CallRecord.objects.filter(transcription__isnull=False, analysis_version__isnull=True)
+            phones_to_analyze = PhoneNumber.objects.filter(
+                Q(dtmf_map__isnull=True) | Q(id__in=unanalyzed.values('phone_number_id'))
+            )
         
         for phone in phones_to_analyze:
-            dtmf_map = {}
-            
-            # Сначала анализируем summary, если оно есть
-            if phone.summary:
-                summary_options = service.analyze_summary_for_dtmf(phone.summary)
-                if summary_options:
-                    logger.info(f"Found DTMF options in summary for phone {phone.number}: {summary_options}")
-                    for option in summary_options:
-                        digit = option['digit']
-                        if digit not in dtmf_map:
-                            dtmf_map[digit] = {
-                                'action': option['action'],
-                                'submenu': option.get('submenu', False),
-                                'source': 'summary'
-                            }
-            
-            # Затем анализируем записи звонков
-            call_records = phone.call_records.filter(
-                transcription__isnull=False
-            ).order_by('-created_at')
-            
-            for record in call_records:
-                dtmf_options = service.analyze_transcription_for_dtmf(record.transcription, phone.id)
-                
-                if dtmf_options:
-                    logger.info(f"Found DTMF options in recording {record.recording_file}: {dtmf_options}")
-                    for option in dtmf_options:
-                        digit = option['digit']
-                        if digit not in dtmf_map:  # Не перезаписываем опции из summary
-                            dtmf_map[digit] = {
-                                'action': option['action'],
-                                'submenu': option.get('submenu', False),
-                                'source': 'transcription'
-                            }
-            
-            if dtmf_map:
-                # Если это перерасчет для конкретного номера, сначала очищаем старые последовательности
-                if phone_id:
-                    DTMFSequence.objects.filter(phone_number=phone).delete()
-                    
-                # Создаем DTMFSequence для каждой найденной опции
-                for digit, info in dtmf_map.items():
-                    sequence = [digit]
-                    DTMFSequence.objects.get_or_create(
-                        phone_number=phone,
-                        sequence=sequence,
-                        defaults={
-                            'description': info['action'],
-                            'level': len(sequence),
-                            'is_submenu': info['submenu']
-                        }
-                    )
+            if update_dtmf_map(service, phone, replace=bool(phone_id)):
                 analyzed_count += 1
                 
         if phone_id:
@@ -458,33 +655,62 @@ def analyze_recordings_for_dtmf(phone_id=None):
         logger.error(traceback.format_exc())
 
 
+# Переносит неисследованные последовательности в очередь звонков одним запросом.
+# dtmf_sequence собирается в точности как json.dumps([{'digit': d, 'delay': 2}, ...]):
+# очередь хранит JSON-строку, и уникальность (phone_number_id, dtmf_sequence)
+# работает только при побайтовом совпадении с ранее поставленными элементами.
+ENQUEUE_UNEXPLORED_SQL = """
+    WITH candidates AS (
+        SELECT s.phone_number_id,
+               seq.value AS dtmf_sequence,
+               ROW_NUMBER() OVER (PARTITION BY s.phone_number_id ORDER BY s.level, s.id) AS position
+        FROM calls_dtmfsequence s
+        CROSS JOIN LATERAL (
+            SELECT to_jsonb(COALESCE(
+                '[' || string_agg(
+                    '{"digit": ' || to_jsonb(d.digit)::text || ', "delay": 2}', ', ' ORDER BY d.ord
+                ) || ']',
+                '[]'
+            )) AS value
+            FROM jsonb_array_elements_text(
+                CASE WHEN jsonb_typeof(s.sequence) = 'array' THEN s.sequence ELSE '[]'::jsonb END
+            ) WITH ORDINALITY AS d(digit, ord)
+        ) seq
+        WHERE NOT s.explored
+          AND NOT EXISTS (
+              SELECT 1 FROM calls_callqueue q
+              WHERE q.phone_number_id = s.phone_number_id AND q.dtmf_sequence = seq.value
+          )
+    )
+    INSERT INTO calls_callqueue (phone_number_id, dtmf_sequence, status, attempts, created_at, updated_at)
+    SELECT phone_number_id, dtmf_sequence, 'pending', 0, NOW(), NOW()
+    FROM candidates
+    WHERE %(limit)s = 0 OR position <= %(limit)s
+    ON CONFLICT (phone_number_id, dtmf_sequence) DO NOTHING
+    RETURNING phone_number_id
+"""
+
+
 @shared_task
-def check_unexplored_dtmf():
+def check_unexplored_dtmf(per_number_limit=None):
     """
     Периодическая задача для поиска DTMF последовательностей без звонков.
     Добавляет их в очередь звонков с низким приоритетом.
+
+    Args:
+        per_number_limit: Сколько последовательностей одного номера ставить за запуск (0 - без ограничения)
     """
+    if per_number_limit is None:
+        per_number_limit = settings.UNEXPLORED_DTMF_PER_NUMBER
+
     try:
-        # Получаем все DTMF последовательности, которые не помечены как explored
-        unexplored_sequences = DTMFSequence.objects.filter(
-            explored=False
-        ).select_related('phone_number')
-        
-        added_to_queue = 0
-        for sequence in unexplored_sequences:
-            # Преобразуем последовательность в формат для очереди звонков
-            dtmf_sequence = json.dumps([{'digit': str(digit), 'delay': 2} for digit in sequence.sequence])
-            
-            # Добавляем в очередь с низким приоритетом
-            CallQueue.objects.get_or_create(
-                phone_number=sequence.phone_number,
-                dtmf_sequence=dtmf_sequence,
-                defaults={
-                    'status': 'pending'
-                }
-            )
-            added_to_queue += 1
-            
+        with connection.cursor() as cursor:
+            cursor.execute(ENQUEUE_UNEXPLORED_SQL, {'limit': per_number_limit})
+            phone_ids = [row[0] for row in cursor.fetchall()]
+        added_to_queue = len(phone_ids)
+        refresh_counters(phone_ids)
+        dispatcher.wake('call_queue', added_to_queue)
+
         if added_to_queue:
             logger.info(f"Added {added_to_queue} unexplored DTMF sequences to call queue")
             
@@ -499,8 +725,9 @@ def process_call_queue():
     try:
         # Получаем один звонок из очереди со статусом pending
         with transaction.atomic():
+            # skip_locked: параллельные воркеры берут разные элементы, а не ждут один и тот же
             queue_item = (CallQueue.objects
-                .select_for_update()
+                .select_for_update(skip_locked=True)
                 .filter(status='pending')
                 .order_by('created_at')
                 .first())
@@ -593,7 +820,7 @@ def process_new_phones():
                 phone.save(update_fields=['status'])
                 
                 processed_count += 1
-                logger.info(f"Added phone {phone.number} to call queue")
+                logger.debug("Added phone %s to call queue", phone.number)
                 
             except Exception as e:
                 logger.error(f"Error processing new phone {phone.number}: {str(e)}")
@@ -607,53 +834,64 @@ def process_new_phones():
         logger.error(traceback.format_exc())
 
 
+# Сколько зависших записей удаляется и перезапускается за одну транзакцию
+STALLED_BATCH_SIZE = 500
+
+
 @shared_task
 def check_stalled_recordings():
     """
     Проверяет записи звонков, у которых нет транскрипции или транскрипция короче 20 символов более 20 минут.
     Удаляет такие записи и перезапускает звонок с той же последовательностью DTMF.
+
+    Отбор выполняется одним SQL-условием по частичному индексу calls_callrecord_stalled_idx,
+    поэтому время работы зависит от числа зависших записей, а не от размера таблицы.
     """
     logger.info("Starting check for stalled recordings")
     
     try:
-        # Находим записи старше 20 минут
         time_threshold = timezone.now() - timedelta(minutes=20)
-        records = CallRecord.objects.filter(
+        stalled = CallRecord.objects.filter(
+            STALLED_RECORDING,
             created_at__lt=time_threshold
-        ).select_related('phone_number')
-        
-        stalled_records = []
-        for record in records:
-            # Проверяем транскрипцию
-            if not record.transcription or len(record.transcription) < 20:
-                stalled_records.append(record)
-        
-        for record in stalled_records:
-            try:
-                logger.info(f"Processing stalled record {record.id} for phone {record.phone_number.number}")
-                
-                # Получаем последовательность DTMF из записи
-                dtmf_sequence = record.dtmf_sequence
-                phone = record.phone_number
-                
-                # Удаляем запись из базы
-                record.delete()
-                logger.info(f"Deleted stalled record {record.id}")
-                
-                # Добавляем новый звонок в очередь с той же последовательностью DTMF
-                CallQueue.objects.create(
-                    phone_number=phone,
-                    dtmf_sequence=dtmf_sequence,
-                    status='pending'
+        ).order_by('created_at')
+
+        total = 0
+        while True:
+            with transaction.atomic():
+                # Блокируем пачку, пропуская строки, которые обрабатывает параллельный запуск
+                batch = list(
+                    stalled.select_for_update(skip_locked=True)
+                    .values_list('id', 'phone_number_id', 'dtmf_sequence')[:STALLED_BATCH_SIZE]
                 )
-                logger.info(f"Created new call task for phone {phone.number} with DTMF sequence {dtmf_sequence}")
-                
-            except Exception as e:
-                logger.error(f"Error processing stalled record {record.id}: {str(e)}")
-                logger.error(traceback.format_exc())
-                continue
-                
-        logger.info(f"Finished processing {len(stalled_records)} stalled records")
+                if not batch:
+                    break
+
+                # Обычный delete() из-за обработчиков post_delete загрузил бы каждую строку
+                # и отправил сигнал на каждую; на CallRecord никто не ссылается, поэтому
+                # удаляем одним DELETE, а счетчики и кэш обновляет refresh_counters ниже.
+                # Условие на created_at ограничивает DELETE старыми секциями
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"DELETE FROM {CallRecord._meta.db_table} WHERE id = ANY(%s) AND created_at < %s",
+                        [[record_id for record_id, _, _ in batch], time_threshold]
+                    )
+                # Добавляем новые звонки в очередь с теми же последовательностями DTMF;
+                # уже стоящие в очереди пропускаются уникальным ограничением
+                CallQueue.objects.bulk_create(
+                    [
+                        CallQueue(phone_number_id=phone_id, dtmf_sequence=dtmf_sequence, status='pending')
+                        for _, phone_id, dtmf_sequence in batch
+                    ],
+                    ignore_conflicts=True
+                )
+                refresh_counters({phone_id for _, phone_id, _ in batch})
+                # Часть строк могла быть пропущена как дубли: лишние задачи просто не найдут работы
+                dispatcher.wake('call_queue', len(batch))
+            total += len(batch)
+            logger.info(f"Requeued batch of {len(batch)} stalled records")
+
+        logger.info(f"Finished processing {total} stalled records")
         
     except Exception as e:
         logger.error(f"Error in check_stalled_recordings task: {str(e)}")
@@ -663,21 +901,23 @@ def check_stalled_recordings():
 @shared_task
 def process_sms_messages():
     """
-    Обработка SMS сообщений и извлечение телефонных номеров с помощью GPT.
+    Обработка SMS сообщений и извлечение телефонных номеров.
     Запускается каждую минуту через Celery Beat.
+
+    Текст разбирается PhoneNumberExtractor по кускам: однозначные номера берутся локально,
+    в gpt-4o-mini уходят только куски с неоднозначными фрагментами, поэтому большие
+    вставки не упираются в лимит токенов одного запроса.
     """
-    http_client = None
     logger.info("Starting process_sms_messages task")
-    
+    messages = None
+
     try:
         # Проверяем API ключ
         if not settings.OPENAI_API_KEY:
             error_msg = "OpenAI API key is not set in settings"
             logger.error(error_msg)
             return {'status': 'error', 'message': error_msg}
-            
-        logger.info("OpenAI API key is configured")
-        
+
         # Получаем сообщения с пустым response_text
         messages = SMSMessage.objects.filter(
             Q(response_text__isnull=True) | Q(response_text='')
@@ -685,120 +925,24 @@ def process_sms_messages():
         messages_count = messages.count()
         logger.info(f"Found {messages_count} messages to process")
 
-        if not messages.exists():
+        if not messages_count:
             logger.info("No messages to process")
             return {'status': 'success', 'message': 'No messages to process'}
 
-        try:
-            # Инициализируем клиент OpenAI
-            logger.info("Initializing OpenAI client...")
-            http_client = httpx.Client(timeout=30.0)
-            client = openai.OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                http_client=http_client
-            )
-            logger.info("OpenAI client initialized successfully")
-        except Exception as e:
-            error_msg = f"Failed to initialize OpenAI client: {str(e)}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
-            messages.update(
-                status=SMSMessage.STATUS_FAILED,
-                response_text=error_msg
-            )
-            return {'status': 'error', 'message': error_msg}
-
         processed_count = 0
         failed_count = 0
 
         for message in messages:
             try:
-                logger.info(f"Processing message {message.id} with text: {message.message_text[:100]}...")
-                
-                # Вызов API
-                logger.info(f"Sending request to GPT for message {message.id}")
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": """You are a phone number extraction assistant. Your task is to find and format phone numbers from text.
-
-                            Rules:
-                            1. Extract ALL phone numbers from the input text
-                            2. Format rules:
-                               - For US numbers: Add 1 prefix if not present (e.g. "8007267864" -> "18007267864")
-                               - Keep all digits, remove any separators or special characters
-                               - Do NOT include + sign in the output
-                            3. Return ONLY a JSON array of formatted numbers, nothing else
-                            4. If you see a number that looks like a phone number, include it
-                            """
-                        },
-                        {
-                            "role": "user",
-                            "content": message.message_text
-                        }
-                    ],
-                    temperature=0
-                )
+                logger.debug("Processing message %s with text: %.100s...", message.id, message.message_text)
+                # extract_numbers сам сохраняет номера и снова ставит в очередь обработанные
+                numbers = PhoneNumberExtractor.extract_numbers(message.message_text)
 
-                if not response or not hasattr(response, 'choices') or not response.choices:
-                    error_msg = "Invalid response format from GPT"
-                    logger.error(error_msg)
-                    message.response_text = error_msg
-                    message.status = SMSMessage.STATUS_FAILED
-                    message.save()
-                    failed_count += 1
-                    continue
-
-                content = response.choices[0].message.content
-                logger.info(f"Raw response from GPT for message {message.id}: {content}")
-                
-                try:
-                    numbers = json.loads(content)
-                    if not isinstance(numbers, list):
-                        raise ValueError("Response is not a list")
-
-                    message.response_text = json.dumps(numbers)
-                    message.status = SMSMessage.STATUS_PROCESSED
-                    message.save()
-                    processed_count += 1
-
-                    # Обработка каждого номера
-                    numbers_processed = 0
-                    for number in numbers:
-                        if len(number) > 20:
-                            logger.warning(f"Skipping number {number} - too long")
-                            continue
-                            
-                        try:
-                            phone, created = PhoneNumber.objects.get_or_create(
-                                number=number,
-                                defaults={"status": "new"}
-                            )
-                            
-                            if not created and phone.status not in ['new', 'processing']:
-                                phone.status = 'new'
-                                phone.save(update_fields=['status'])
-                                
-                            numbers_processed += 1
-                            logger.info(f"{'Created' if created else 'Updated'} phone number: {number}")
-                        except Exception as e:
-                            error_msg = f"Error saving phone number {number}: {str(e)}"
-                            logger.error(error_msg)
-                            logger.error(traceback.format_exc())
-                            continue
-
-                    logger.info(f"Processed {numbers_processed} numbers for message {message.id}")
-
-                except (json.JSONDecodeError, ValueError) as e:
-                    error_msg = f"Error processing GPT response for message {message.id}: {str(e)}"
-                    logger.error(error_msg)
-                    logger.error(traceback.format_exc())
-                    message.response_text = error_msg
-                    message.status = SMSMessage.STATUS_FAILED
-                    message.save()
-                    failed_count += 1
+                message.response_text = json.dumps(numbers)
+                message.status = SMSMessage.STATUS_PROCESSED
+                message.save()
+                processed_count += 1
+                logger.info(f"Processed {len(numbers)} numbers for message {message.id}")
 
             except Exception as e:
                 error_msg = f"Error processing message {message.id}: {str(e)}"
@@ -818,7 +962,7 @@ def process_sms_messages():
         error_msg = f"Fatal error in process_sms_messages task: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
-        if messages:
+        if messages is not None:
             failed_update_count = messages.update(
                 status=SMSMessage.STATUS_FAILED,
                 response_text=error_msg
@@ -826,7 +970,85 @@ def process_sms_messages():
             logger.info(f"Marked {failed_update_count} messages as failed")
         return {'status': 'error', 'message': error_msg}
 
-    finally:
-        if http_client:
-            http_client.close()
-            logger.info("HTTP client closed")
\ No newline at end of file
+
+@shared_task
+def apply_retention_policies():
+    """
+    Политики хранения: секции calls_callrecord на будущие месяцы, удаление старых
+    секций, сжатие и удаление старых файлов записей (см. calls.retention).
+    """
+    logger.info("Applying retention policies")
+    try:
+        result = retention.apply_retention()
+        logger.info(
+            f"Retention finished: {len(result['created_partitions'])} partitions created, "
+            f"{len(result['dropped_partitions'])} dropped, {result['archived']} recordings archived, "
+            f"{result['deleted_files']} recording files deleted"
+        )
+        return result
+    except Exception as e:
+        logger.error(f"Error in apply_retention_policies task: {str(e)}")
+        logger.error(traceback.format_exc())
+
+
+# Номеров в одной задаче пересборки карт после пакетного анализа
+REBUILD_CHUNK_SIZE = 200
+
+
+@shared_task
+def submit_llm_batch(kind, force=False):
+    """
+    Отправляет повторный анализ в Batch API (см. calls.llm_batch).
+
+    Args:
+        kind (str): 'dtmf' или 'summary'
+        force (bool): Для dtmf - анализировать все транскрипции, а не только устаревшие
+    """
+    logger.info(f"Submitting {kind} LLM batch")
+    try:
+        jobs = llm_batch.submit(kind, force)
+        logger.info(f"Submitted {len(jobs)} {kind} batches with {sum(job.request_count for job in jobs)} requests")
+        return [job.id for job in jobs]
+    except Exception as e:
+        logger.error(f"Error in submit_llm_batch task: {str(e)}")
+        logger.error(traceback.format_exc())
+
+
+@shared_task
+def poll_llm_batches():
+    """Сохраняет результаты завершенных пакетов; пересборку карт DTMF затронутых номеров ставит llm_batch."""
+    try:
+        changed = llm_batch.poll()
+        if changed['dtmf']:
+            logger.info(f"Updated DTMF analyses for {len(changed['dtmf'])} phone numbers")
+        if changed['summary']:
+            # Опции меню из новых summary ищет следующий пакет dtmf
+            logger.info(f"Updated summaries for {len(changed['summary'])} phone numbers")
+    except Exception as e:
+        logger.error(f"Error in poll_llm_batches task: {str(e)}")
+        logger.error(traceback.format_exc())
+
+
+def enqueue_dtmf_rebuild(phone_ids):
+    phone_ids = sorted(phone_ids)
+    for start in range(0, len(phone_ids), REBUILD_CHUNK_SIZE):
+        rebuild_dtmf_maps.delay(phone_ids[start:start + REBUILD_CHUNK_SIZE])
+
+
+@shared_task
+def rebuild_dtmf_maps(phone_ids):
+    """
+    Пересобирает карты DTMF из сохраненных результатов анализа без запросов к LLM
+    (после применения пакета). Существующие последовательности не удаляются: флаги
+    explored и более глубокие уровни сохраняются, добавляются только новые опции.
+    """
+    try:
+        service = TranscriptionService()
+        rebuilt = 0
+        for phone in PhoneNumber.objects.filter(id__in=phone_ids):
+            if update_dtmf_map(service, phone, cached_only=True):
+                rebuilt += 1
+        logger.info(f"Rebuilt DTMF maps for {rebuilt} of {len(phone_ids)} phone numbers")
+    except Exception as e:
+        logger.error(f"Error in rebuild_dtmf_maps task: {str(e)}")
+        logger.error(traceback.format_exc())
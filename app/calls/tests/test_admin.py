@@ -0,0 +1,64 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+
+from calls import pagination
+from calls.models import PhoneNumber, CallRecord
+from calls.pagination import EstimatedCountPaginator
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False, ADMIN_EXACT_COUNT_LIMIT=1000)
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        for n in range(3):
+            PhoneNumber.objects.create(number=f'121255501{n:02d}', status='new' if n else 'completed')
+
+    def count(self, queryset):
+        return EstimatedCountPaginator(queryset.order_by('id'), 2).count
+
+    def test_unfiltered_large_table_uses_estimate(self):
+        with mock.patch.object(pagination, 'table_estimate', return_value=50000):
+            self.assertEqual(self.count(PhoneNumber.objects.all()), 50000)
+
+    def test_small_table_and_filters_count_exactly(self):
+        with mock.patch.object(pagination, 'table_estimate', return_value=10):
+            self.assertEqual(self.count(PhoneNumber.objects.all()), 3)
+        with mock.patch.object(pagination, 'table_estimate', return_value=50000) as estimate:
+            self.assertEqual(self.count(PhoneNumber.objects.filter(status='new')), 2)
+        estimate.assert_not_called()
+
+    def test_count_timeout_falls_back_to_plan_estimate(self):
+        with mock.patch.object(QuerySet, 'count', side_effect=OperationalError('canceling statement')), \
+                mock.patch.object(pagination, 'plan_estimate', return_value=7) as plan_estimate:
+            self.assertEqual(self.count(PhoneNumber.objects.filter(status='new')), 7)
+        plan_estimate.assert_called_once()
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class ChangelistTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        self.phone = PhoneNumber.objects.create(number='15550100146')
+        PhoneNumber.objects.create(number='12125550100')
+        self.record = CallRecord.objects.create(phone_number=self.phone, recording_file='sim-15550100146-1.wav')
+
+    def test_formatted_number_search_matches_prefix(self):
+        response = self.client.get('/admin/calls/phonenumber/', {'q': '+1 (555) 010'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.phone])
+
+    def test_call_record_search_by_number_or_file_name(self):
+        for term in ('+1 (555) 010', 'sim-155501'):
+            with self.subTest(term=term):
+                response = self.client.get('/admin/calls/callrecord/', {'q': term})
+                self.assertEqual(list(response.context['cl'].result_list), [self.record])
+        response = self.client.get('/admin/calls/callrecord/', {'q': 'other.wav'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_call_record_changelist_with_phone_filter(self):
+        response = self.client.get('/admin/calls/callrecord/', {'phone_number__id__exact': self.phone.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from calls.models import PhoneNumber, CallRecord
+from calls.services import DTMF_ANALYZER_VERSION, TranscriptionService
+
+OPTIONS = [{'digit': '1', 'action': 'Sales', 'submenu': False}]
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False, OPENAI_API_KEY='test')
+class AnalyzeOnceTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+        self.service = TranscriptionService()
+        self.record = CallRecord.objects.create(
+            phone_number=self.phone, recording_file='a.wav', transcription='For sales, press 1.'
+        )
+
+    def analyze(self):
+        return self.service.analyze_record(CallRecord.objects.get(id=self.record.id))
+
+    def test_transcription_is_analyzed_once(self):
+        with mock.patch.object(TranscriptionService, 'analyze_ivr_menu', return_value=OPTIONS) as llm:
+            self.assertEqual(self.analyze(), OPTIONS)
+            self.assertEqual(self.analyze(), OPTIONS)
+        llm.assert_called_once_with('For sales, press 1.', 'no previous keys pressed', raise_errors=True)
+        record = CallRecord.objects.get(id=self.record.id)
+        self.assertEqual(record.dtmf_analysis, OPTIONS)
+        self.assertEqual(record.analysis_version, DTMF_ANALYZER_VERSION)
+
+    def test_changed_transcription_is_analyzed_again(self):
+        with mock.patch.object(TranscriptionService, 'analyze_ivr_menu', return_value=OPTIONS) as llm:
+            self.analyze()
+            CallRecord.objects.filter(id=self.record.id).update(transcription='For support, press 2.')
+            self.analyze()
+        self.assertEqual(llm.call_count, 2)
+
+    def test_failed_request_is_not_stored(self):
+        with mock.patch.object(TranscriptionService, 'analyze_ivr_menu', side_effect=RuntimeError('timeout')):
+            self.assertEqual(self.analyze(), [])
+        self.assertIsNone(CallRecord.objects.get(id=self.record.id).analysis_version)
+
+    def test_cached_only_never_calls_llm(self):
+        CallRecord.objects.filter(id=self.record.id).update(dtmf_analysis=OPTIONS, analysis_version=0)
+        with mock.patch.object(TranscriptionService, 'analyze_ivr_menu') as llm:
+            record = CallRecord.objects.get(id=self.record.id)
+            self.assertEqual(self.service.analyze_record(record, cached_only=True), OPTIONS)
+        llm.assert_not_called()
+
+    def test_summary_is_analyzed_once(self):
+        PhoneNumber.objects.filter(id=self.phone.id).update(summary='For sales, press 1.')
+        with mock.patch.object(TranscriptionService, 'analyze_summary_for_dtmf', return_value=OPTIONS) as llm:
+            self.assertEqual(self.service.analyze_phone_summary(PhoneNumber.objects.get(id=self.phone.id)), OPTIONS)
+            self.assertEqual(self.service.analyze_phone_summary(PhoneNumber.objects.get(id=self.phone.id)), OPTIONS)
+        llm.assert_called_once()
@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.test import RequestFactory, TestCase, override_settings
+
+from calls import async_views, views
+from calls.models import PhoneNumber
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    async def test_phone_list_matches_sync_view(self):
+        for n in range(3):
+            await PhoneNumber.objects.acreate(number=f'121255501{n:02d}')
+        request = self.factory.get('/api/phone-list/', {'limit': 2})
+
+        response = await async_views.phone_list(request)
+        expected = await sync_to_async(views.phone_list)(request)
+
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], expected['ETag'])
+        self.assertEqual(len(json.loads(response.content)['phones']), 2)
+
+    async def test_serve_recording_streams_range(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'a.wav'), 'wb') as f:
+                f.write(b'0123456789')
+            with self.settings(RECORDINGS_PATH=tmp, RECORDINGS_ARCHIVE_PATH=os.path.join(tmp, 'archive'),
+                               RECORDINGS_SENDFILE=''):
+                response = await async_views.serve_recording(
+                    self.factory.get('/recordings/a.wav', HTTP_RANGE='bytes=2-5'), 'a.wav'
+                )
+                body = b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'2345')
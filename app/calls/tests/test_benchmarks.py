@@ -0,0 +1,32 @@
+from django.test import SimpleTestCase, TestCase
+
+from calls import benchmarks
+from calls.models import PhoneNumber, CallRecord, DTMFSequence, CallQueue
+
+
+class CompareTests(SimpleTestCase):
+    def test_reports_regressions_above_threshold(self):
+        baseline = {'results': {'phone_list': {'wall_time_s': 0.1, 'queries': 2, 'peak_memory_kb': 100}}}
+        report = {'results': {
+            'phone_list': {'wall_time_s': 0.11, 'queries': 5, 'peak_memory_kb': 100},
+            'new_operation': {'wall_time_s': 1.0, 'queries': 1, 'peak_memory_kb': 1},
+        }}
+        self.assertEqual(benchmarks.compare(report, baseline), ['phone_list: queries 2 -> 5 (x2.50)'])
+
+
+class RunTests(TestCase):
+    def test_small_run(self):
+        benchmarks.seed(numbers=4, records=40, deep_numbers=2, tree_depth=2, tree_breadth=2)
+        self.assertEqual(PhoneNumber.objects.count(), 4)
+        self.assertEqual(CallRecord.objects.count(), 40)
+        self.assertEqual(DTMFSequence.objects.count(), 12)
+        self.assertEqual(PhoneNumber.objects.get(number='18000000000').call_count, 10)
+
+        results = benchmarks.run(only=['phone_list', 'check_unexplored_dtmf'], repeat=1)
+
+        self.assertEqual(set(results), {'phone_list', 'check_unexplored_dtmf'})
+        for result in results.values():
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['peak_memory_kb'], 0)
+        # Каждый замер откатывается: поставленные в очередь звонки не остаются
+        self.assertFalse(CallQueue.objects.exists())
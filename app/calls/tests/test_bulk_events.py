@@ -0,0 +1,42 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.admin.sites import AdminSite
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from calls import importers
+from calls.admin import PhoneNumberAdmin
+from calls.models import PhoneNumber
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class BulkStatusEventTests(TestCase):
+    def setUp(self):
+        long_ago = timezone.now() - timedelta(days=1)
+        self.completed = PhoneNumber.objects.create(number='12125550100', status='completed')
+        self.pending = PhoneNumber.objects.create(number='12125550111', status='new')
+        PhoneNumber.objects.filter(id__in=[self.completed.id, self.pending.id]).update(updated_at=long_ago)
+        self.long_ago = long_ago
+
+    def test_import_publishes_one_event_per_batch(self):
+        stream = io.BytesIO(b'2125550100\n2125550111\n2125550122\n2125550133\n')
+        with mock.patch('calls.events.publish') as publish, mock.patch.object(importers.dispatcher, 'wake'):
+            stats = list(importers.import_numbers(stream, 'text', batch_size=10))[-1]
+
+        self.assertEqual((stats['created'], stats['requeued']), (2, 1))
+        publish.assert_called_once_with('phones', status='new', count=3)
+        self.completed.refresh_from_db()
+        self.assertEqual(self.completed.status, 'new')
+        self.assertGreater(self.completed.updated_at, self.long_ago)
+
+    def test_admin_mark_as_completed(self):
+        model_admin = PhoneNumberAdmin(PhoneNumber, AdminSite())
+        with mock.patch('calls.events.publish') as publish, mock.patch.object(model_admin, 'message_user'):
+            model_admin.mark_as_completed(RequestFactory().post('/'), PhoneNumber.objects.filter(id=self.pending.id))
+
+        publish.assert_called_once_with('phones', status='completed', count=1)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'completed')
+        self.assertGreater(self.pending.updated_at, self.long_ago)
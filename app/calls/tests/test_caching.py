@@ -0,0 +1,64 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from calls import caching
+from calls.models import PhoneNumber, CallRecord
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=True, CACHES=LOCMEM_CACHE)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+        self.compute = mock.Mock(side_effect=lambda: self.compute.call_count)
+
+    def cached(self, *scopes):
+        return caching.cached('test', scopes or [caching.phone_scope(self.phone.id)], self.compute)
+
+    def test_value_is_cached_until_scope_changes(self):
+        self.assertEqual(self.cached(), 1)
+        self.assertEqual(self.cached(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav')
+
+        self.assertEqual(self.cached(), 2)
+
+    def test_other_phone_changes_do_not_invalidate(self):
+        other = PhoneNumber.objects.create(number='12125550111')
+        self.assertEqual(self.cached(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            CallRecord.objects.create(phone_number=other, recording_file='a.wav')
+        self.assertEqual(self.cached(), 1)
+
+    def test_invalidation_waits_for_commit(self):
+        self.assertEqual(self.cached(), 1)
+        with self.captureOnCommitCallbacks(execute=False):
+            caching.invalidate_phones([self.phone.id])
+        self.assertEqual(self.cached(), 1)
+
+    def test_queue_count_is_invalidated_by_status_change(self):
+        self.assertEqual(self.cached(caching.QUEUE), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.status = 'completed'
+            self.phone.save()
+        self.assertEqual(self.cached(caching.QUEUE), 2)
+
+    def test_hit_and_miss_metrics(self):
+        with mock.patch.object(caching.metrics, 'inc') as inc:
+            self.cached()
+            self.cached()
+        self.assertEqual(inc.call_args_list, [
+            mock.call('calls_cache_requests_total', cache='test', result='miss'),
+            mock.call('calls_cache_requests_total', cache='test', result='hit'),
+        ])
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.cached()
+        self.cached()
+        self.assertEqual(self.compute.call_count, 2)
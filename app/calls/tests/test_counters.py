@@ -0,0 +1,54 @@
+from django.test import TestCase, override_settings
+
+from calls.counters import refresh_counters
+from calls.models import PhoneNumber, CallRecord, DTMFSequence, CallQueue
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class CounterSignalTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+
+    def counters(self):
+        self.phone.refresh_from_db()
+        return self.phone.call_count, self.phone.transcribed_count, self.phone.explored_count, self.phone.queue_depth
+
+    def test_call_record_create_and_transcribe(self):
+        record = CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav')
+        self.assertEqual(self.counters(), (1, 0, 0, 0))
+        record.transcription = 'For sales, press 1.'
+        record.save()
+        self.assertEqual(self.counters(), (1, 1, 0, 0))
+
+    def test_call_record_delete(self):
+        transcribed = CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav', transcription='menu')
+        plain = CallRecord.objects.create(phone_number=self.phone, recording_file='b.wav')
+        self.assertEqual(self.counters(), (2, 1, 0, 0))
+
+        plain.delete()
+        self.assertEqual(self.counters(), (1, 1, 0, 0))
+        transcribed.delete()
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+
+    def test_call_record_delete_with_deferred_transcription(self):
+        CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav', transcription='menu')
+        CallRecord.objects.create(phone_number=self.phone, recording_file='b.wav', transcription='menu')
+        CallRecord.objects.only('id', 'phone_number_id').filter(recording_file='a.wav').get().delete()
+        self.assertEqual(self.counters(), (1, 1, 0, 0))
+
+    def test_dtmf_sequence_and_queue(self):
+        sequence = DTMFSequence.objects.create(phone_number=self.phone, sequence=['1'], explored=True)
+        item = CallQueue.objects.create(phone_number=self.phone, dtmf_sequence='[]')
+        self.assertEqual(self.counters(), (0, 0, 1, 1))
+        sequence.delete()
+        item.delete()
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+
+    def test_refresh_counters_after_bulk_operations(self):
+        CallRecord.objects.bulk_create([
+            CallRecord(phone_number=self.phone, recording_file=f'{n}.wav', transcription='menu' if n % 2 else None)
+            for n in range(4)
+        ])
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+        refresh_counters([self.phone.id])
+        self.assertEqual(self.counters(), (4, 2, 0, 0))
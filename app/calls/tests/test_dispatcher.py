@@ -0,0 +1,34 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from calls import dispatcher, tasks
+from calls.models import PhoneNumber, CallRecord
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False, TRANSCRIPTION_POOL_ENABLED=False)
+class RecordingWakeupTests(TestCase):
+    def setUp(self):
+        phone = PhoneNumber.objects.create(number='12125550100', status='completed')
+        CallRecord.objects.create(phone_number=phone, recording_file='a.wav')
+        CallRecord.objects.create(phone_number=phone, recording_file='b.wav')
+
+    def test_recordings_kind_maps_to_transcription_only_task(self):
+        self.assertEqual(dispatcher.KINDS['recordings'], 'enqueue_pending_transcriptions')
+
+    def test_wakeup_does_not_fan_out_summaries(self):
+        with mock.patch('calls.leases.acquire_many', side_effect=lambda kind, names, ttl=None: list(names)), \
+                mock.patch.object(tasks.process_recording, 'delay') as process_recording, \
+                mock.patch.object(tasks.update_phone_summaries, 'delay') as update_summaries:
+            tasks.enqueue_pending_transcriptions()
+
+        self.assertEqual(sorted(call.args[1] for call in process_recording.call_args_list), ['a.wav', 'b.wav'])
+        update_summaries.assert_not_called()
+
+    def test_dispatch_enqueues_one_task_for_recordings(self):
+        with mock.patch.object(tasks.enqueue_pending_transcriptions, 'delay') as enqueue, \
+                mock.patch.object(tasks.process_unprocessed_recordings, 'delay') as process_unprocessed, \
+                mock.patch('calls.metrics.inc'):
+            dispatcher._dispatch({'recordings': 3})
+        enqueue.assert_called_once_with()
+        process_unprocessed.assert_not_called()
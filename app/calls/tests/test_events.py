@@ -0,0 +1,62 @@
+import json
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from calls import events
+from calls.models import PhoneNumber, CallQueue, CallRecord
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class StatusEventTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(events.metrics, 'get_redis')
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def published(self):
+        return [json.loads(call.args[1]) for call in self.redis.publish.call_args_list]
+
+    def test_phone_status_changes_are_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            phone = PhoneNumber.objects.create(number='12125550100')
+        with self.captureOnCommitCallbacks(execute=True):
+            phone.summary = 'no status change'
+            phone.save()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            phone.status = 'completed'
+            phone.save()
+            self.assertEqual(len(self.published()), 1)
+        self.assertEqual(len(callbacks), 1)
+
+        self.assertEqual(self.published(), [
+            {'type': 'phone', 'id': phone.id, 'number': '12125550100', 'status': 'new', 'previous_status': None},
+            {'type': 'phone', 'id': phone.id, 'number': '12125550100', 'status': 'completed', 'previous_status': 'new'},
+        ])
+        self.assertTrue(all(call.args[0] == events.CHANNEL for call in self.redis.publish.call_args_list))
+
+    def test_queue_and_record_events(self):
+        phone = PhoneNumber.objects.create(number='12125550100')
+        with self.captureOnCommitCallbacks(execute=True):
+            item = CallQueue.objects.create(phone_number=phone, dtmf_sequence='[]')
+            record = CallRecord.objects.create(phone_number=phone, recording_file='a.wav')
+            record.transcription = 'menu'
+            record.save()
+            item.delete()
+
+        self.assertEqual([event['type'] for event in self.published()], ['queue', 'record', 'record', 'queue'])
+        queue_deleted = self.published()[-1]
+        self.assertEqual((queue_deleted['status'], queue_deleted['previous_status']), (None, 'pending'))
+        self.assertEqual(self.published()[2]['transcribed'], True)
+
+    def test_stream_yields_server_sent_events(self):
+        message = {'data': json.dumps({'type': 'phone', 'id': 1}).encode()}
+        with mock.patch('calls.events.redis.Redis.from_url') as from_url:
+            from_url.return_value.pubsub.return_value.get_message.side_effect = [None, message]
+            stream = events.stream()
+            chunks = [next(stream) for _ in range(3)]
+            stream.close()
+
+        self.assertEqual(chunks[0], 'retry: 3000\n\n')
+        self.assertEqual(chunks[1], ': keepalive\n\n')
+        self.assertEqual(chunks[2], 'event: phone\ndata: {"type": "phone", "id": 1}\n\n')
@@ -0,0 +1,117 @@
+import io
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from calls import importers
+from calls.models import PhoneNumber, SMSMessage
+from calls.services import PhoneNumberExtractor
+from calls.tasks import process_sms_messages
+
+
+class NormalizeNumberTests(SimpleTestCase):
+    def test_nanp_number_gets_country_code(self):
+        self.assertEqual(importers.normalize_number('(212) 555-0100'), '12125550100')
+        self.assertEqual(importers.normalize_number('1-212-555-0100'), '12125550100')
+
+    def test_international_number(self):
+        self.assertEqual(importers.normalize_number('+44 20 7946 0958'), '442079460958')
+        self.assertEqual(importers.normalize_number('0044 20 7946 0958'), '442079460958')
+
+    def test_invalid_numbers(self):
+        self.assertIsNone(importers.normalize_number('555-123-4567'))  # код станции начинается с 1
+        self.assertIsNone(importers.normalize_number('12345'))
+
+
+class PhoneShapeTests(SimpleTestCase):
+    def test_phone_shaped(self):
+        for value in ('(212) 555-0100', '212-555-0100', '212.555.0100', '1 212 555 0100', '+1 212 555 0100',
+                      '+44 20 7946 0958', '00442079460958'):
+            with self.subTest(value=value):
+                self.assertTrue(importers.is_phone_shaped(value))
+
+    def test_not_phone_shaped(self):
+        for value in ('2023-10-19 12', '2125550100', '20231019123', '12-34-56-78-90'):
+            with self.subTest(value=value):
+                self.assertFalse(importers.is_phone_shaped(value))
+
+
+class FindLocalTests(SimpleTestCase):
+    TEXT = (
+        'Call (212) 555-0100 or +44 20 7946 0958. '
+        'Logged 2023-10-19 12:30:45, order 2125550199, account 20231019123.'
+    )
+
+    def test_only_phone_shaped_numbers_are_accepted(self):
+        numbers, ambiguous = PhoneNumberExtractor.find_local(self.TEXT)
+        self.assertEqual(numbers, ['12125550100', '442079460958'])
+        fragments = [self.TEXT[start:end] for start, end in ambiguous]
+        self.assertEqual(fragments, ['2023-10-19 12', '2125550199', '20231019123'])
+
+    def test_dates_are_not_dialable(self):
+        numbers, _ = PhoneNumberExtractor.find_local('Created 2023-10-19 12:30:45')
+        self.assertEqual(numbers, [])
+
+
+class TextImportTests(SimpleTestCase):
+    def test_bare_number_lines_and_phone_shaped_fragments(self):
+        stream = io.BytesIO(
+            b'2125550100\n'
+            b'Office: (212) 555-0111, invoice 2023-10-19 12:30\n'
+        )
+        self.assertEqual(
+            list(importers.iter_raw_numbers(stream, 'text')),
+            ['2125550100', '(212) 555-0111']
+        )
+
+
+class StructuredImportTests(SimpleTestCase):
+    def test_detect_format(self):
+        self.assertEqual(importers.detect_format('numbers.CSV'), 'csv')
+        self.assertEqual(importers.detect_format('numbers.jsonl'), 'ndjson')
+        self.assertEqual(importers.detect_format('numbers.txt'), 'text')
+
+    def test_csv_number_column(self):
+        stream = io.BytesIO('﻿name,Phone\nSales,(212) 555-0100\nSupport,\n'.encode())
+        self.assertEqual(list(importers.iter_raw_numbers(stream, 'csv')), ['(212) 555-0100', ''])
+
+    def test_csv_without_header_reads_all_cells(self):
+        stream = io.BytesIO(b'2125550100,2125550111\n2125550122\n')
+        self.assertEqual(
+            list(importers.iter_raw_numbers(stream, 'csv')), ['2125550100', '2125550111', '2125550122']
+        )
+
+    def test_ndjson_objects_and_values(self):
+        stream = io.BytesIO(b'{"number": "2125550100"}\n\n"2125550111"\nnot json\n')
+        self.assertEqual(
+            list(importers.iter_raw_numbers(stream, 'ndjson')), ['2125550100', '2125550111']
+        )
+
+
+@override_settings(
+    METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False, OPENAI_API_KEY='test',
+    EXTRACTION_CHUNK_SIZE=200, EXTRACTION_CHUNK_OVERLAP=20
+)
+class ProcessSmsMessagesTests(TestCase):
+    def test_large_paste_is_extracted_in_chunks(self):
+        lines = [f"Office {n}: (212) 555-{n:04d}\n" for n in range(100, 140)]
+        lines.insert(30, "Florist: 1-800-FLOWERS\n")
+        text = ''.join(lines)
+        message = SMSMessage.objects.create(sender_number='user_input', message_text=text)
+
+        with mock.patch.object(
+            PhoneNumberExtractor, '_extract_with_llm', new=mock.AsyncMock(return_value=['18003569377'])
+        ) as extract_with_llm:
+            result = process_sms_messages()
+
+        self.assertEqual(result['status'], 'success')
+        chunks = extract_with_llm.await_args.args[0]
+        self.assertEqual(len(chunks), 1)
+        self.assertIn('1-800-FLOWERS', chunks[0])
+        self.assertLess(len(chunks[0]), len(text))
+        message.refresh_from_db()
+        self.assertEqual(message.status, SMSMessage.STATUS_PROCESSED)
+        self.assertEqual(len(json.loads(message.response_text)), 41)
+        self.assertEqual(PhoneNumber.objects.filter(status='new').count(), 41)
+        self.assertTrue(PhoneNumber.objects.filter(number='12125550139').exists())
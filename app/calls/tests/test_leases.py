@@ -0,0 +1,59 @@
+from unittest import mock
+
+import redis
+from django.test import SimpleTestCase, override_settings
+
+from calls import leases
+
+
+class FakeRedis:
+    """SET NX и DELETE в памяти; TTL не моделируется."""
+
+    def __init__(self):
+        self.keys = {}
+        self.results = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def set(self, key, value, nx=False, ex=None):
+        ok = not (nx and key in self.keys)
+        if ok:
+            self.keys[key] = (value, ex)
+        self.results.append(ok or None)
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+    def delete(self, *keys):
+        for key in keys:
+            self.keys.pop(key, None)
+
+
+@override_settings(METRICS_ENABLED=False, TASK_LEASE_TTL=600)
+class LeaseTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(leases.metrics, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_duplicate_work_is_blocked_until_release(self):
+        self.assertEqual(leases.acquire_many('recording', [1, 2]), [1, 2])
+        self.assertEqual(leases.acquire_many('recording', [2, 3]), [3])
+        self.assertFalse(leases.acquire('recording', 1))
+        self.assertEqual(self.redis.keys['calls:lease:recording:3'], (1, 600))
+
+        leases.release('recording', 1)
+        self.assertTrue(leases.acquire('recording', 1))
+
+    def test_kinds_are_independent(self):
+        self.assertTrue(leases.acquire('recording', 1))
+        self.assertTrue(leases.acquire('siblings', 1, ttl=30))
+        self.assertEqual(self.redis.keys['calls:lease:siblings:1'], (1, 30))
+
+    def test_redis_errors_grant_leases(self):
+        leases.metrics.get_redis.side_effect = redis.ConnectionError('down')
+        self.assertEqual(leases.acquire_many('recording', [1, 2]), [1, 2])
+        leases.release('recording', 1)
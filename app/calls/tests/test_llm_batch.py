@@ -0,0 +1,187 @@
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from calls import llm_batch
+from calls.models import PhoneNumber, CallRecord, DTMFSequence, LLMBatchJob
+from calls.services import DTMF_ANALYZER_VERSION, TranscriptionService, analysis_input_hash
+from calls.tasks import rebuild_dtmf_maps
+
+
+def result_line(custom_id, content, status_code=200):
+    return {
+        'custom_id': custom_id,
+        'response': {
+            'status_code': status_code,
+            'body': {
+                'choices': [{'message': {'content': content}}],
+                'usage': {'prompt_tokens': 10, 'completion_tokens': 5},
+            },
+        },
+    }
+
+
+def record_hash(record):
+    return analysis_input_hash(record.transcription, TranscriptionService.record_sequence_str(record))
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class ApplyChunkTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+        self.job = LLMBatchJob.objects.create(kind='dtmf')
+
+    def test_applies_results_with_matching_hash(self):
+        record = CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav', transcription='Press 1 for sales.')
+        options = [{'digit': '1', 'action': 'Sales', 'submenu': False}]
+
+        phone_ids, applied, failed = llm_batch._apply_chunk(
+            self.job, [result_line(f"record:{record.id}:{record_hash(record)}", json.dumps(options))]
+        )
+
+        self.assertEqual((phone_ids, applied, failed), ({self.phone.id}, 1, 0))
+        record.refresh_from_db()
+        self.assertEqual(record.dtmf_analysis, options)
+        self.assertEqual(record.analysis_version, DTMF_ANALYZER_VERSION)
+        self.assertIsNotNone(record.analyzed_at)
+
+    def test_skips_results_for_changed_transcription(self):
+        record = CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav', transcription='Press 1 for sales.')
+        stale_hash = record_hash(record)
+        CallRecord.objects.filter(id=record.id).update(transcription='Press 2 for support.')
+
+        phone_ids, applied, failed = llm_batch._apply_chunk(
+            self.job, [result_line(f"record:{record.id}:{stale_hash}", '[{"digit": "1", "action": "Sales"}]')]
+        )
+
+        self.assertEqual(phone_ids, set())
+        record.refresh_from_db()
+        self.assertIsNone(record.dtmf_analysis)
+        self.assertIsNone(record.analysis_version)
+
+    def test_counts_failed_lines(self):
+        record = CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav', transcription='menu')
+        phone_ids, applied, failed = llm_batch._apply_chunk(
+            self.job, [result_line(f"record:{record.id}:{record_hash(record)}", '[]', status_code=500)]
+        )
+        self.assertEqual((phone_ids, applied, failed), (set(), 0, 1))
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False, OPENAI_API_KEY='test')
+class RebuildDtmfMapsTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+        record = CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav', transcription='menu')
+        CallRecord.objects.filter(id=record.id).update(
+            dtmf_analysis=[
+                {'digit': '1', 'action': 'Sales', 'submenu': True},
+                {'digit': '2', 'action': 'Support', 'submenu': False},
+            ],
+            analysis_version=DTMF_ANALYZER_VERSION,
+            analysis_input_hash=record_hash(record),
+        )
+
+    def test_rebuild_keeps_explored_sequences(self):
+        DTMFSequence.objects.create(
+            phone_number=self.phone, sequence=['1'], level=1, description='Old', is_submenu=True, explored=True
+        )
+        DTMFSequence.objects.create(
+            phone_number=self.phone, sequence=['1', '3'], level=2, description='Orders', explored=True
+        )
+
+        rebuild_dtmf_maps([self.phone.id])
+
+        sequences = {tuple(s.sequence): s for s in DTMFSequence.objects.filter(phone_number=self.phone)}
+        self.assertEqual(set(sequences), {('1',), ('1', '3'), ('2',)})
+        self.assertTrue(sequences[('1',)].explored)
+        self.assertEqual(sequences[('1',)].description, 'Sales')
+        self.assertTrue(sequences[('1', '3')].explored)
+        self.assertFalse(sequences[('2',)].explored)
+        self.phone.refresh_from_db()
+        self.assertEqual(set(self.phone.dtmf_map), {'1', '2'})
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False, OPENAI_API_KEY='test')
+class SubmitTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        batch_dir = override_settings(LLM_BATCH_DIR=self.tmp.name)
+        batch_dir.enable()
+        self.addCleanup(batch_dir.disable)
+        phone = PhoneNumber.objects.create(number='12125550100')
+        CallRecord.objects.create(phone_number=phone, recording_file='a.wav', transcription='Press 1 for sales.')
+
+    def test_job_is_submitted_after_batch_is_created(self):
+        with mock.patch.object(llm_batch, 'upload_file', return_value='file-1'), \
+                mock.patch.object(llm_batch, 'create_batch', return_value={'id': 'batch-1', 'status': 'validating'}):
+            job, = llm_batch.submit('dtmf')
+        self.assertEqual((job.status, job.batch_id, job.request_count), ('submitted', 'batch-1', 1))
+
+    def test_interrupted_submission_does_not_block_or_get_polled(self):
+        with mock.patch.object(llm_batch, 'upload_file', side_effect=SoftTimeLimitExceeded()):
+            with self.assertRaises(SoftTimeLimitExceeded):
+                llm_batch.submit('dtmf')
+        job = LLMBatchJob.objects.get()
+        self.assertEqual((job.status, job.batch_id), ('pending', ''))
+
+        with mock.patch.object(llm_batch, 'retrieve_batch') as retrieve_batch:
+            llm_batch.poll()
+        retrieve_batch.assert_not_called()
+        with self.assertRaises(llm_batch.BatchError):
+            llm_batch.submit('dtmf')
+
+        LLMBatchJob.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(hours=2))
+        with mock.patch.object(llm_batch, 'upload_file', return_value='file-1'), \
+                mock.patch.object(llm_batch, 'create_batch', return_value={'id': 'batch-1', 'status': 'validating'}):
+            llm_batch.submit('dtmf')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class ApplyResultsTests(TestCase):
+    def setUp(self):
+        phone = PhoneNumber.objects.create(number='12125550100')
+        self.records = [
+            CallRecord.objects.create(phone_number=phone, recording_file=f'{n}.wav', transcription=f'Press {n}.')
+            for n in range(1, 4)
+        ]
+        self.lines = [
+            result_line(f"record:{record.id}:{record_hash(record)}", '[{"digit": "1", "action": "Sales"}]')
+            for record in self.records
+        ]
+        self.job = LLMBatchJob.objects.create(kind='dtmf', status='submitted', batch_id='batch-1')
+
+    def test_interrupted_apply_resumes_from_saved_line(self):
+        apply_chunk = llm_batch._apply_chunk
+        calls = []
+
+        def interrupt_second_chunk(job, lines):
+            calls.append(lines)
+            if len(calls) == 2:
+                raise SoftTimeLimitExceeded()
+            return apply_chunk(job, lines)
+
+        with mock.patch.object(llm_batch, 'APPLY_CHUNK_SIZE', 1), \
+                mock.patch.object(llm_batch, 'iter_file_lines', side_effect=lambda file_id: iter(self.lines)), \
+                mock.patch('calls.tasks.enqueue_dtmf_rebuild') as enqueue_dtmf_rebuild:
+            with mock.patch.object(llm_batch, '_apply_chunk', side_effect=interrupt_second_chunk):
+                with self.assertRaises(SoftTimeLimitExceeded):
+                    llm_batch.apply_results(self.job, 'file-1')
+            self.job.refresh_from_db()
+            self.assertEqual((self.job.applied_lines, self.job.applied_count), (1, 1))
+            enqueue_dtmf_rebuild.assert_called_once()
+
+            with mock.patch.object(llm_batch, '_apply_chunk', wraps=apply_chunk) as resumed:
+                llm_batch.apply_results(self.job, 'file-1')
+
+        self.assertEqual([c.args[1] for c in resumed.call_args_list], [self.lines[1:2], self.lines[2:3]])
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.applied_lines, self.job.applied_count), (3, 3))
+        self.assertEqual(CallRecord.objects.filter(analysis_version=DTMF_ANALYZER_VERSION).count(), 3)
@@ -0,0 +1,52 @@
+import io
+import json
+import logging
+import os
+import sys
+from unittest import mock
+
+from celery.signals import worker_process_shutdown
+from django.test import SimpleTestCase
+
+from calls.log import JsonFormatter, QueueHandler
+
+
+class QueueHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.handler = QueueHandler(format='json')
+        self.addCleanup(self.handler.stop_listener)
+        self.logger = logging.getLogger('calls.tests.log')
+
+    def make_record(self, msg, args, exc_info=None):
+        return self.logger.makeRecord(self.logger.name, logging.INFO, __file__, 1, msg, args, exc_info)
+
+    def test_prepare_formats_mutable_arguments(self):
+        items = ['a']
+        record = self.make_record('items: %s', (items,))
+
+        prepared = self.handler.prepare(record)
+        items.append('b')
+
+        self.assertEqual(prepared.getMessage(), "items: ['a']")
+        self.assertIsNone(prepared.args)
+        self.assertEqual(record.args, (items,))
+
+    def test_prepare_keeps_exception_text(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = self.make_record('failed', (), sys.exc_info())
+
+        prepared = self.handler.prepare(record)
+
+        self.assertIsNone(prepared.exc_info)
+        entry = json.loads(JsonFormatter().format(prepared))
+        self.assertIn('ValueError: boom', entry['exc_info'])
+
+    def test_worker_process_shutdown_flushes_queue(self):
+        with mock.patch('sys.stdout', new=io.StringIO()) as stdout:
+            self.handler.handle(self.make_record('last words', ()))
+            worker_process_shutdown.send(sender=None, pid=os.getpid(), exitcode=0)
+
+        self.assertIsNone(self.handler._listener)
+        self.assertEqual(json.loads(stdout.getvalue())['message'], 'last words')
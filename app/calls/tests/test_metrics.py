@@ -0,0 +1,89 @@
+from collections import defaultdict
+from unittest import mock
+
+import redis
+from django.test import SimpleTestCase, override_settings
+
+from calls import metrics
+
+
+class FakeRedis:
+    """Хеши Redis в памяти: только команды, которые использует calls.metrics."""
+
+    def __init__(self):
+        self.hashes = defaultdict(dict)
+        self.results = None
+
+    def _result(self, value):
+        if self.results is not None:
+            self.results.append(value)
+            return self
+        return value
+
+    def hincrbyfloat(self, key, field, amount):
+        value = float(self.hashes[key].get(field, 0)) + amount
+        self.hashes[key][field] = value
+        return self._result(value)
+
+    hincrby = hincrbyfloat
+
+    def hset(self, key, field, value):
+        self.hashes[key][field] = value
+        return self._result(1)
+
+    def hgetall(self, key):
+        return self._result({field.encode(): str(value).encode() for field, value in self.hashes[key].items()})
+
+    def llen(self, key):
+        return 0
+
+    def pipeline(self, transaction=True):
+        pipe = FakeRedis()
+        pipe.hashes = self.hashes
+        pipe.results = []
+        return pipe
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(metrics, 'get_redis', return_value=FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_timed_stage_renders_histogram_and_outcome(self):
+        with mock.patch.object(metrics.time, 'perf_counter', side_effect=[10.0, 10.3]):
+            with metrics.timed('transcribe', backend='replay'):
+                pass
+        with self.assertRaises(ValueError):
+            with metrics.timed('transcribe', backend='replay'):
+                raise ValueError
+
+        output = metrics.render()
+
+        self.assertIn('calls_stage_duration_seconds_bucket{backend="replay",stage="transcribe",le="0.25"} 1', output)
+        self.assertIn('calls_stage_duration_seconds_bucket{backend="replay",stage="transcribe",le="0.5"} 2', output)
+        self.assertIn('calls_stage_duration_seconds_count{backend="replay",stage="transcribe"} 2', output)
+        self.assertIn('calls_stage_total{backend="replay",outcome="error",stage="transcribe"} 1', output)
+        self.assertIn('calls_stage_total{backend="replay",outcome="ok",stage="transcribe"} 1', output)
+
+    def test_token_usage(self):
+        metrics.record_token_usage({'prompt_tokens': 120, 'completion_tokens': 30}, 'analyze_ivr_menu')
+        output = metrics.render()
+        self.assertIn(
+            'calls_llm_tokens_total{kind="prompt",model="gpt-4o-mini",operation="analyze_ivr_menu"} 120', output
+        )
+
+    def test_redis_errors_are_not_raised(self):
+        metrics.get_redis.side_effect = redis.ConnectionError('down')
+        metrics.inc('calls_stage_total', stage='llm', outcome='ok')
+        self.assertIn('# TYPE calls_stage_total counter', metrics.render())
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        metrics.inc('calls_stage_total', stage='llm', outcome='ok')
+        metrics.get_redis.assert_not_called()
@@ -0,0 +1,51 @@
+from django.test import TestCase, override_settings
+
+from calls.models import PhoneNumber, CallRecord, DTMFSequence
+from calls.views import TRANSCRIPTION_PREVIEW_LENGTH
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class PhoneDetailPagesTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+
+    def test_records_pages_with_transcription_preview(self):
+        long_text = 'x' * (TRANSCRIPTION_PREVIEW_LENGTH + 50)
+        records = [
+            CallRecord.objects.create(phone_number=self.phone, recording_file=f'{n}.wav', transcription=long_text)
+            for n in range(3)
+        ]
+        url = f'/api/phone/{self.phone.id}/records/'
+
+        first = self.client.get(url, {'limit': 2}).json()
+        second = self.client.get(url, {'limit': 2, 'cursor': first['next_cursor']}).json()
+
+        self.assertEqual([r['id'] for r in first['records'] + second['records']], [r.id for r in reversed(records)])
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(len(first['records'][0]['transcription']), TRANSCRIPTION_PREVIEW_LENGTH)
+        self.assertTrue(first['records'][0]['transcription_truncated'])
+        self.assertEqual(first['records'][0]['recording_url'], '/recordings/2.wav')
+
+        full = self.client.get(f"/api/records/{records[0].id}/transcription/").json()
+        self.assertEqual(full['transcription'], long_text)
+
+    def test_sequences_page_in_tree_order(self):
+        for sequence in (['1', '2'], ['2'], ['1'], ['1', '1', '3']):
+            DTMFSequence.objects.create(phone_number=self.phone, sequence=sequence, level=len(sequence))
+        url = f'/api/phone/{self.phone.id}/sequences/'
+
+        first = self.client.get(url, {'limit': 2}).json()
+        second = self.client.get(url, {'limit': 2, 'cursor': first['next_cursor']}).json()
+
+        self.assertEqual(
+            [s['sequence'] for s in first['sequences'] + second['sequences']],
+            [['2'], ['1'], ['1', '2'], ['1', '1', '3']]
+        )
+        self.assertIsNone(second['next_cursor'])
+
+    def test_detail_page_does_not_render_all_records(self):
+        CallRecord.objects.create(phone_number=self.phone, recording_file='a.wav', transcription='secret menu text')
+        response = self.client.get(f'/phone/{self.phone.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'secret menu text')
+        self.assertContains(response, "const transcriptionUrl = '/api/records/0/transcription/'")
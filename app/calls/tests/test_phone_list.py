@@ -0,0 +1,33 @@
+from django.test import TestCase, override_settings
+
+from calls.models import PhoneNumber, CallRecord
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class PhoneListApiTests(TestCase):
+    def setUp(self):
+        self.phones = [PhoneNumber.objects.create(number=f'121255501{n:02d}') for n in range(5)]
+        CallRecord.objects.create(phone_number=self.phones[-1], recording_file='a.wav', transcription='menu')
+
+    def test_keyset_pages_cover_all_phones_newest_first(self):
+        numbers = []
+        cursor = ''
+        for _ in range(3):
+            with self.assertNumQueries(1):
+                data = self.client.get('/api/phone-list/', {'limit': 2, 'cursor': cursor}).json()
+            numbers += [phone['number'] for phone in data['phones']]
+            cursor = data['next_cursor']
+        self.assertIsNone(cursor)
+        self.assertEqual(numbers, [phone.number for phone in reversed(self.phones)])
+
+    def test_counters_come_from_phone_row(self):
+        first = self.client.get('/api/phone-list/', {'limit': 1}).json()['phones'][0]
+        self.assertEqual((first['call_count'], first['transcribed_count']), (1, 1))
+
+    def test_unchanged_page_returns_304(self):
+        response = self.client.get('/api/phone-list/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/phone-list/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        CallRecord.objects.create(phone_number=self.phones[0], recording_file='b.wav')
+        self.assertEqual(self.client.get('/api/phone-list/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,78 @@
+import gzip
+import os
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from calls.recordings import parse_range
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=500-5000', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=1000-', 1000), 'unsatisfiable')
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range(None, 1000))
+
+
+class ServeRecordingTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.hot = os.path.join(tmp.name, 'hot')
+        self.archive = os.path.join(tmp.name, 'archive')
+        os.makedirs(self.hot)
+        os.makedirs(self.archive)
+        self.content = bytes(range(256)) * 4
+        with open(os.path.join(self.hot, 'a.wav'), 'wb') as f:
+            f.write(self.content)
+        paths = override_settings(RECORDINGS_PATH=self.hot, RECORDINGS_ARCHIVE_PATH=self.archive,
+                                  RECORDINGS_SENDFILE='')
+        paths.enable()
+        self.addCleanup(paths.disable)
+
+    def test_full_file_and_conditional_get(self):
+        response = self.client.get('/recordings/a.wav')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'audio/wav')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        cached = self.client.get('/recordings/a.wav', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_range_request(self):
+        response = self.client.get('/recordings/a.wav', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.client.get('/recordings/a.wav', HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_stale_if_range_returns_full_file(self):
+        response = self.client.get('/recordings/a.wav', HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_path_outside_recordings_is_not_served(self):
+        self.assertEqual(self.client.get('/recordings/../hot/../../etc/passwd').status_code, 404)
+
+    @override_settings(RECORDINGS_SENDFILE='x-accel-redirect', RECORDINGS_ACCEL_PREFIX='/protected-recordings/')
+    def test_x_accel_redirect(self):
+        response = self.client.get('/recordings/a.wav')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-recordings/a.wav')
+        self.assertEqual(response.content, b'')
+
+    def test_archived_recording_is_served_gzip_encoded(self):
+        with gzip.open(os.path.join(self.archive, 'b.wav.gz'), 'wb') as f:
+            f.write(self.content)
+        response = self.client.get('/recordings/b.wav', HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.content)
@@ -0,0 +1,138 @@
+import gzip
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.db import OperationalError, connection
+from django.db.backends.utils import CursorWrapper
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from calls import retention
+from calls.models import PhoneNumber, CallRecord
+from calls.pagination import table_estimate
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.hot = os.path.join(self.tmp.name, 'hot')
+        self.archive = os.path.join(self.tmp.name, 'archive')
+        os.makedirs(self.hot)
+        paths = override_settings(RECORDINGS_PATH=self.hot, RECORDINGS_ARCHIVE_PATH=self.archive)
+        paths.enable()
+        self.addCleanup(paths.disable)
+
+    def record(self, created_at, recording_file=''):
+        if recording_file:
+            with open(os.path.join(self.hot, recording_file), 'wb') as f:
+                f.write(b'RIFF' + b'\0' * 64)
+        record = CallRecord.objects.create(phone_number=self.phone, recording_file=recording_file)
+        CallRecord.objects.filter(id=record.id).update(created_at=created_at)
+        return record
+
+    def partition_of(self, record):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT tableoid::regclass::text FROM {retention.TABLE} WHERE id = %s", [record.id])
+            return cursor.fetchone()[0]
+
+    def test_ensure_partitions_moves_rows_from_default(self):
+        month = retention.add_months(retention.month_start(timezone.now()), 12)
+        record = self.record(month + timedelta(days=14))
+        self.assertEqual(self.partition_of(record), retention.DEFAULT_PARTITION)
+
+        created = retention.ensure_partitions(months_ahead=12)
+
+        self.assertIn(retention.partition_name(month), created)
+        self.assertEqual(self.partition_of(record), retention.partition_name(month))
+        self.assertEqual(retention.ensure_partitions(months_ahead=12), [])
+
+    @override_settings(CALL_RECORD_RETENTION_MONTHS=12)
+    def test_drop_expired_partitions(self):
+        retention.ensure_partitions(months_ahead=0)
+        old_month = retention.add_months(retention.month_start(timezone.now()), -13)
+        if old_month not in {month for _, month in retention.list_partitions()}:
+            with connection.cursor() as cursor:
+                retention._create_partition(cursor, old_month)
+        old = self.record(old_month + timedelta(days=3), 'old.wav')
+        current = self.record(timezone.now(), 'current.wav')
+        with connection.cursor() as cursor:
+            # Отложенные проверки внешних ключей иначе не дают удалить секцию внутри транзакции теста
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        dropped = retention.drop_expired_partitions()
+
+        self.assertIn(retention.partition_name(old_month), dropped)
+        self.assertFalse(CallRecord.objects.filter(id=old.id).exists())
+        self.assertTrue(CallRecord.objects.filter(id=current.id).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.hot, 'old.wav')))
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.call_count, 1)
+
+    @override_settings(CALL_RECORD_RETENTION_MONTHS=12)
+    def test_failed_detach_keeps_files(self):
+        retention.ensure_partitions(months_ahead=0)
+        old_month = retention.add_months(retention.month_start(timezone.now()), -13)
+        if old_month not in {month for _, month in retention.list_partitions()}:
+            with connection.cursor() as cursor:
+                retention._create_partition(cursor, old_month)
+        old = self.record(old_month + timedelta(days=3), 'old.wav')
+        execute = CursorWrapper.execute
+
+        def lock_timeout(cursor, sql, params=None):
+            if 'DETACH PARTITION' in sql:
+                raise OperationalError('canceling statement due to lock timeout')
+            return execute(cursor, sql, params)
+
+        with mock.patch.object(CursorWrapper, 'execute', lock_timeout):
+            dropped = retention.drop_expired_partitions()
+
+        self.assertNotIn(retention.partition_name(old_month), dropped)
+        self.assertTrue(CallRecord.objects.filter(id=old.id).exists())
+        self.assertTrue(os.path.exists(os.path.join(self.hot, 'old.wav')))
+
+    @override_settings(RECORDING_ARCHIVE_DAYS=30, RECORDING_RETENTION_DAYS=0)
+    def test_archive_recordings(self):
+        old = self.record(timezone.now() - timedelta(days=40), 'old.wav')
+        fresh = self.record(timezone.now() - timedelta(days=1), 'fresh.wav')
+
+        self.assertEqual(retention.archive_recordings(), 1)
+
+        old.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertIsNotNone(old.archived_at)
+        self.assertIsNone(fresh.archived_at)
+        self.assertFalse(os.path.exists(os.path.join(self.hot, 'old.wav')))
+        with gzip.open(retention.archive_path('old.wav'), 'rb') as f:
+            self.assertTrue(f.read().startswith(b'RIFF'))
+        self.assertTrue(os.path.exists(os.path.join(self.hot, 'fresh.wav')))
+
+    @override_settings(RECORDING_RETENTION_DAYS=365)
+    def test_delete_expired_recordings_keeps_transcription(self):
+        old = self.record(datetime.now(dt_timezone.utc) - timedelta(days=400), 'old.wav')
+        CallRecord.objects.filter(id=old.id).update(transcription='menu')
+
+        self.assertEqual(retention.delete_expired_recordings(), 1)
+
+        old.refresh_from_db()
+        self.assertEqual(old.recording_file, '')
+        self.assertEqual(old.transcription, 'menu')
+        self.assertFalse(os.path.exists(os.path.join(self.hot, 'old.wav')))
+
+
+class TableEstimateTests(TestCase):
+    def test_partitioned_table_sums_partitions(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [retention.TABLE])
+            self.assertEqual(cursor.fetchone()[0], 'p')
+            cursor.execute(
+                "SELECT coalesce(sum(greatest(c.reltuples, 0)), 0)::bigint FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+                [retention.TABLE]
+            )
+            expected = cursor.fetchone()[0]
+        self.assertEqual(table_estimate(CallRecord), expected)
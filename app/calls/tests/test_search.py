@@ -0,0 +1,50 @@
+import json
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from calls.models import PhoneNumber, CallRecord, DTMFSequence
+from calls.search import dtmf_path
+
+
+class DtmfPathTests(SimpleTestCase):
+    def test_formats(self):
+        self.assertEqual(dtmf_path(json.dumps([{'digit': '1', 'delay': 2}, {'digit': '3', 'delay': 2}])), ['1', '3'])
+        self.assertEqual(dtmf_path(['2', 4]), ['2', '4'])
+        self.assertEqual(dtmf_path('not json'), [])
+        self.assertEqual(dtmf_path(None), [])
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class SearchApiTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100', summary='Main line of the pharmacy.')
+        CallRecord.objects.create(
+            phone_number=self.phone, recording_file='a.wav',
+            dtmf_sequence=json.dumps([{'digit': '2', 'delay': 2}]),
+            transcription='For prescription refills, press 1. For store hours, press 2.'
+        )
+        DTMFSequence.objects.create(phone_number=self.phone, sequence=['2', '1'], level=2,
+                                    description='Prescription refills')
+
+    def search(self, q):
+        return self.client.get('/api/search/', {'q': q}).json()['results']
+
+    def test_finds_transcriptions_and_menu_items_with_paths(self):
+        results = {result['source']: result for result in self.search('refills')}
+
+        self.assertEqual(set(results), {'transcription', 'dtmf'})
+        self.assertEqual(results['transcription']['path'], ['2'])
+        self.assertEqual(results['dtmf']['path'], ['2', '1'])
+        self.assertIn('<b>', results['transcription']['snippet'])
+        self.assertEqual(results['transcription']['number'], '12125550100')
+
+    def test_summary_and_websearch_syntax(self):
+        self.assertEqual([result['source'] for result in self.search('pharmacy')], ['summary'])
+        self.assertEqual([result['source'] for result in self.search('refills -hours')], ['dtmf'])
+
+    def test_search_vector_follows_bulk_update(self):
+        CallRecord.objects.update(transcription='For billing, press 3.')
+        self.assertEqual([result['source'] for result in self.search('billing')], ['transcription'])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/api/search/').status_code, 400)
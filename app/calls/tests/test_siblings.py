@@ -0,0 +1,87 @@
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from calls import siblings
+from calls.models import PhoneNumber, CallRecord
+from calls.services import DTMF_ANALYZER_VERSION, TranscriptionService
+
+
+def path_sequence(*digits):
+    return [{'digit': digit, 'delay': 2} for digit in digits]
+
+
+def chat_response(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@override_settings(
+    METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False, OPENAI_API_KEY='test',
+    SIBLING_ANALYSIS_WINDOW=10, SIBLING_ANALYSIS_MAX_ITEMS=10
+)
+class SiblingAnalysisTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+
+    def record(self, *digits, transcription='menu'):
+        return CallRecord.objects.create(
+            phone_number=self.phone, recording_file=f"{'-'.join(digits) or 'root'}.wav",
+            transcription=transcription, dtmf_sequence=path_sequence(*digits)
+        )
+
+    def test_parent_key(self):
+        self.assertIsNone(siblings.parent_key(self.record()))
+        self.assertEqual(siblings.parent_key(self.record('1')), '')
+        self.assertEqual(siblings.parent_key(self.record('1', '2', '3')), '1-2')
+
+    def test_collect_schedules_one_task_per_group(self):
+        record = self.record('1', '2')
+        with mock.patch.object(siblings.leases, 'acquire', side_effect=[True, False]) as acquire, \
+                mock.patch('calls.tasks.analyze_sibling_menus.apply_async') as apply_async:
+            self.assertTrue(siblings.collect(record))
+            self.assertTrue(siblings.collect(self.record('1', '3')))
+
+        self.assertEqual(acquire.call_args_list[0].args, ('siblings', f"{self.phone.id}:1"))
+        apply_async.assert_called_once_with((self.phone.id, '1'), countdown=10)
+
+    def test_collect_skips_root_menu_and_disabled_window(self):
+        with mock.patch.object(siblings.leases, 'acquire') as acquire:
+            self.assertFalse(siblings.collect(self.record()))
+            with override_settings(SIBLING_ANALYSIS_WINDOW=0):
+                self.assertFalse(siblings.collect(self.record('1')))
+        acquire.assert_not_called()
+
+    def test_analyze_saves_results_from_one_request(self):
+        first = self.record('1', transcription='Sales menu')
+        second = self.record('2', transcription='Support menu')
+        other_group = self.record('1', '1', transcription='Orders menu')
+        menus = {
+            '1': [{'digit': '1', 'action': 'New orders', 'submenu': False}],
+            '2': [{'digit': '9', 'action': 'Operator', 'submenu': False}],
+        }
+        service = TranscriptionService()
+
+        with mock.patch.object(siblings.leases, 'release') as release, \
+                mock.patch.object(service.client.chat.completions, 'create',
+                                  return_value=chat_response(json.dumps(menus))) as create:
+            records = siblings.analyze(service, self.phone.id, '')
+
+        release.assert_called_once_with('siblings', f"{self.phone.id}:")
+        create.assert_called_once()
+        self.assertEqual({record.id for record in records}, {first.id, second.id})
+        for record, options in ((first, menus['1']), (second, menus['2'])):
+            record.refresh_from_db()
+            self.assertEqual(record.dtmf_analysis, options)
+            self.assertEqual(record.analysis_version, DTMF_ANALYZER_VERSION)
+            self.assertIsNotNone(record.analysis_input_hash)
+        other_group.refresh_from_db()
+        self.assertIsNone(other_group.analysis_version)
+
+    def test_single_record_is_left_for_regular_analysis(self):
+        record = self.record('1')
+        service = TranscriptionService()
+        with mock.patch.object(service.client.chat.completions, 'create') as create:
+            self.assertEqual(service.analyze_sibling_records([record]), 0)
+        create.assert_not_called()
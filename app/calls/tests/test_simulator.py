@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from calls.simulator import CallerSimulator, build_tree, count_nodes, walk_tree
+
+
+class CallerSimulatorTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.simulator = CallerSimulator(self.tmp.name, tree=build_tree(1, 2), seed=1)
+
+    def test_tree(self):
+        tree = build_tree(2, 3)
+        self.assertEqual(count_nodes(tree), 12)
+        self.assertIn('For the 1 menu, press 1.', tree['prompt'])
+        self.assertEqual(walk_tree(tree, ['2', '3'])['options'], {})
+        self.assertIn('not a valid option', walk_tree(tree, ['9'])['prompt'])
+
+    def test_call_recording_is_transcribed_to_menu_prompt(self):
+        name = self.simulator.place_call('12125550100', [])
+
+        with open(os.path.join(self.tmp.name, name), 'rb') as recording:
+            transcription = self.simulator.transcribe(recording.read())
+        self.assertEqual(transcription, self.simulator.default_tree['prompt'])
+
+        options = json.loads(self.simulator.complete([{'role': 'user', 'content': transcription}]))
+        self.assertEqual([option['digit'] for option in options], ['1', '2'])
+
+    def test_stats_track_full_map(self):
+        self.simulator.place_call('12125550100', [['1', 1]])
+        self.assertIsNone(self.simulator.stats()['numbers']['12125550100']['time_to_full_map'])
+
+        self.simulator.place_call('12125550100', [['2', 1]])
+        stats = self.simulator.stats()
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['numbers']['12125550100']['visited_nodes'], 2)
+        self.assertIsNotNone(stats['numbers']['12125550100']['time_to_full_map'])
+
+    def test_failure_rate(self):
+        simulator = CallerSimulator(self.tmp.name, failure_rate=1.0)
+        self.assertIsNone(simulator.place_call('12125550100', []))
+        self.assertEqual(simulator.stats()['failures'], 1)
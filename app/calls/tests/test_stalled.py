@@ -0,0 +1,44 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from calls import tasks
+from calls.models import PhoneNumber, CallRecord, CallQueue
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class CheckStalledRecordingsTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+
+    def record(self, minutes_ago, transcription=None, dtmf_sequence=None):
+        record = CallRecord.objects.create(
+            phone_number=self.phone, recording_file=f'{minutes_ago}.wav',
+            transcription=transcription, dtmf_sequence=dtmf_sequence or []
+        )
+        CallRecord.objects.filter(id=record.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return record
+
+    def test_requeues_stalled_records_without_per_row_signals(self):
+        self.record(30, dtmf_sequence=[{'digit': '1', 'delay': 5}])
+        self.record(40, transcription='...')
+        fresh = self.record(5)
+        done = self.record(60, transcription='For sales, press 1. For support, press 2.')
+        deleted = mock.Mock()
+        post_delete.connect(deleted, sender=CallRecord)
+        self.addCleanup(post_delete.disconnect, deleted, sender=CallRecord)
+
+        with mock.patch.object(tasks.dispatcher, 'wake') as wake:
+            tasks.check_stalled_recordings()
+
+        deleted.assert_not_called()
+        self.assertEqual(
+            set(CallRecord.objects.values_list('id', flat=True)), {fresh.id, done.id}
+        )
+        self.assertEqual(CallQueue.objects.filter(phone_number=self.phone).count(), 2)
+        wake.assert_called_once_with('call_queue', 2)
+        self.phone.refresh_from_db()
+        self.assertEqual((self.phone.call_count, self.phone.transcribed_count, self.phone.queue_depth), (2, 1, 2))
@@ -0,0 +1,39 @@
+import os
+import re
+from unittest import skipUnless
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from core.celery import app
+
+COMPOSE_FILE = os.path.join(settings.BASE_DIR.parent, 'docker-compose.yml')
+
+
+class TaskRoutesTests(SimpleTestCase):
+    def test_routes_point_to_registered_tasks(self):
+        app.loader.import_default_modules()
+        for task in settings.CELERY_TASK_ROUTES:
+            self.assertIn(task, app.tasks)
+
+    def queues(self):
+        return {route['queue'] for route in settings.CELERY_TASK_ROUTES.values()} | {
+            settings.CELERY_TASK_DEFAULT_QUEUE
+        }
+
+    def test_every_queue_has_time_limits(self):
+        self.assertEqual(self.queues(), set(settings.TASK_QUEUE_TIME_LIMITS))
+
+    # В образе web есть только app/, docker-compose.yml лежит уровнем выше
+    @skipUnless(os.path.exists(COMPOSE_FILE), 'docker-compose.yml is not available')
+    def test_every_queue_has_a_worker(self):
+        with open(COMPOSE_FILE) as compose:
+            consumed = set(re.findall(r'--queues=(\w+)', compose.read()))
+        self.assertLessEqual(self.queues(), consumed)
+
+    def test_annotations_follow_queue_limits(self):
+        soft, hard = settings.TASK_QUEUE_TIME_LIMITS['transcription']
+        self.assertEqual(
+            settings.CELERY_TASK_ANNOTATIONS['calls.tasks.process_recording'],
+            {'soft_time_limit': soft, 'time_limit': hard}
+        )
@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from calls.transcription_backends import ReplayBackend, audio_hash, get_transcription_backend
+
+
+@override_settings(TRANSCRIPTION_REPLAY_DEFAULT=None)
+class ReplayBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fixtures = os.path.join(self.tmp.name, 'fixtures')
+
+    def audio(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_transcripts_index(self):
+        path = self.audio('a.wav', b'menu a')
+        os.makedirs(self.fixtures)
+        with open(os.path.join(self.fixtures, 'transcripts.json'), 'w') as f:
+            json.dump({audio_hash(path): 'Press 1 for sales.'}, f)
+
+        self.assertEqual(ReplayBackend(self.fixtures).transcribe(path), 'Press 1 for sales.')
+
+    def test_saved_fixture_is_found_by_content(self):
+        original = self.audio('a.wav', b'menu b')
+        copy = self.audio('copy.wav', b'menu b')
+        ReplayBackend(self.fixtures).save_fixture(original, 'Press 2 for support.')
+
+        self.assertEqual(ReplayBackend(self.fixtures).transcribe(copy), 'Press 2 for support.')
+
+    def test_missing_fixture_returns_default(self):
+        path = self.audio('a.wav', b'unknown')
+        self.assertIsNone(ReplayBackend(self.fixtures).transcribe(path))
+        with self.settings(TRANSCRIPTION_REPLAY_DEFAULT='silence'):
+            self.assertEqual(ReplayBackend(self.fixtures).transcribe(path), 'silence')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_transcription_backend('nonexistent')
@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, override_settings
+
+from calls.services import TranscriptionPool
+from calls.transcription_backends import TranscriptionBackend
+
+
+class FakeBackend(TranscriptionBackend):
+    name = 'fake'
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.closed = False
+
+    async def atranscribe(self, file_path):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if file_path == 'broken.wav':
+            raise IOError('unreadable')
+        return f"text of {file_path}"
+
+    async def aclose(self):
+        self.closed = True
+
+
+@override_settings(METRICS_ENABLED=False)
+class TranscriptionPoolTests(SimpleTestCase):
+    def test_bounded_concurrency_and_batches(self):
+        backend = FakeBackend()
+        items = [(SimpleNamespace(id=n, transcription=None), f'{n}.wav') for n in range(7)]
+        items.append((SimpleNamespace(id=7, transcription=None), 'broken.wav'))
+        batches = []
+
+        pool = TranscriptionPool(concurrency=3, batch_size=3, backend=backend)
+        done = asyncio.run(pool.run(items, lambda batch: batches.append(list(batch))))
+
+        self.assertEqual(done, 7)
+        self.assertEqual(backend.max_active, 3)
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+        self.assertEqual(
+            {record.transcription for batch in batches for record in batch},
+            {f'text of {n}.wav' for n in range(7)}
+        )
+        self.assertIsNone(items[-1][0].transcription)
+        self.assertTrue(backend.closed)
@@ -0,0 +1,46 @@
+import json
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from calls import tasks
+from calls.models import PhoneNumber, DTMFSequence, CallQueue
+
+
+def queued_sequence(*digits):
+    return json.dumps([{'digit': digit, 'delay': 2} for digit in digits])
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_ENABLED=False)
+class CheckUnexploredDtmfTests(TestCase):
+    def setUp(self):
+        self.phone = PhoneNumber.objects.create(number='12125550100')
+        for sequence, explored in ((['1'], False), (['2'], False), (['1', '3'], False), (['3'], True)):
+            DTMFSequence.objects.create(
+                phone_number=self.phone, sequence=sequence, level=len(sequence), explored=explored
+            )
+        CallQueue.objects.create(phone_number=self.phone, dtmf_sequence=queued_sequence('1'))
+        wake = mock.patch.object(tasks.dispatcher, 'wake')
+        self.wake = wake.start()
+        self.addCleanup(wake.stop)
+
+    def queued(self):
+        return sorted(CallQueue.objects.filter(phone_number=self.phone).values_list('dtmf_sequence', flat=True))
+
+    def test_enqueues_unexplored_sequences_once(self):
+        tasks.check_unexplored_dtmf(per_number_limit=0)
+
+        self.assertEqual(self.queued(), sorted([queued_sequence('1'), queued_sequence('2'), queued_sequence('1', '3')]))
+        self.wake.assert_called_with('call_queue', 2)
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.queue_depth, 3)
+
+        tasks.check_unexplored_dtmf(per_number_limit=0)
+        self.assertEqual(CallQueue.objects.count(), 3)
+        self.wake.assert_called_with('call_queue', 0)
+
+    def test_per_number_limit_takes_shallow_sequences_first(self):
+        tasks.check_unexplored_dtmf(per_number_limit=1)
+
+        # ['1'] уже в очереди и в лимит не входит; из остальных первая по (level, id) - ['2']
+        self.assertEqual(self.queued(), sorted([queued_sequence('1'), queued_sequence('2')]))
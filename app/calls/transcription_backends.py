@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+import httpx
+import openai
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger('calls.services')
+
+
+def audio_hash(file_path: str) -> str:
+    """Возвращает sha256 содержимого аудиофайла, читая его блоками."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as audio_file:
+        for chunk in iter(lambda: audio_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TranscriptionBackend:
+    """
+    Базовый класс бэкенда транскрибации.
+
+    Бэкенд обязан реализовать transcribe(). Асинхронная версия по умолчанию
+    выполняет transcribe() в отдельном потоке.
+    """
+
+    name = None
+
+    def transcribe(self, file_path: str) -> str:
+        raise NotImplementedError
+
+    async def atranscribe(self, file_path: str) -> str:
+        return await asyncio.to_thread(self.transcribe, file_path)
+
+    async def aclose(self):
+        """Закрывает ресурсы, созданные в atranscribe()."""
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Транскрибация через OpenAI API (модель whisper-1)."""
+
+    name = 'openai'
+
+    def __init__(self):
+        self.client = openai.OpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=httpx.Client(timeout=30.0)
+        )
+        self._async_client = None
+        self._async_http_client = None
+
+    def transcribe(self, file_path: str) -> str:
+        with open(file_path, "rb") as audio_file:
+            return self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                response_format="text"
+            )
+
+    async def atranscribe(self, file_path: str) -> str:
+        # Асинхронный клиент привязан к event loop, поэтому создается лениво
+        if self._async_client is None:
+            self._async_http_client = httpx.AsyncClient(
+                timeout=60.0,
+                limits=httpx.Limits(max_connections=settings.TRANSCRIPTION_CONCURRENCY)
+            )
+            self._async_client = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=self._async_http_client
+            )
+
+        # Передаем открытый файл, чтобы httpx отправлял его потоком,
+        # не загружая запись целиком в память
+        with open(file_path, "rb") as audio_file:
+            return await self._async_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                response_format="text"
+            )
+
+    async def aclose(self):
+        if self._async_http_client is not None:
+            await self._async_http_client.aclose()
+        self._async_client = None
+        self._async_http_client = None
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """Локальная транскрибация на CPU через faster-whisper (ставится отдельно)."""
+
+    name = 'local'
+
+    def __init__(self):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise ImproperlyConfigured(
+                "TRANSCRIPTION_BACKEND='local' requires the faster-whisper package"
+            )
+
+        self.model = WhisperModel(
+            settings.LOCAL_WHISPER_MODEL,
+            device="cpu",
+            compute_type="int8",
+            cpu_threads=settings.LOCAL_WHISPER_THREADS
+        )
+
+    def transcribe(self, file_path: str) -> str:
+        segments, _ = self.model.transcribe(file_path)
+        return " ".join(segment.text.strip() for segment in segments)
+
+
+class ReplayBackend(TranscriptionBackend):
+    """
+    Детерминированный бэкенд для офлайн нагрузочного тестирования.
+
+    Возвращает заранее записанные транскрипции по sha256 аудиофайла.
+    Фикстуры хранятся в TRANSCRIPTION_REPLAY_DIR: либо файлы <sha256>.txt,
+    либо общий transcripts.json вида {"<sha256>": "текст"}.
+    """
+
+    name = 'replay'
+
+    def __init__(self, fixtures_dir: str = None):
+        self.fixtures_dir = fixtures_dir or settings.TRANSCRIPTION_REPLAY_DIR
+        self.default = settings.TRANSCRIPTION_REPLAY_DEFAULT
+        self.transcripts = {}
+
+        index_path = os.path.join(self.fixtures_dir, "transcripts.json")
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                self.transcripts = json.load(index_file)
+        logger.info(f"Loaded {len(self.transcripts)} replay transcripts from {self.fixtures_dir}")
+
+    def transcribe(self, file_path: str) -> str:
+        key = audio_hash(file_path)
+        if key in self.transcripts:
+            return self.transcripts[key]
+
+        fixture_path = os.path.join(self.fixtures_dir, f"{key}.txt")
+        if os.path.exists(fixture_path):
+            with open(fixture_path) as fixture:
+                return fixture.read()
+
+        if self.default is None:
+            logger.warning(f"No replay transcript for {file_path} ({key})")
+        return self.default
+
+    async def atranscribe(self, file_path: str) -> str:
+        # Чтение фикстуры быстрое, отдельный поток не нужен
+        return self.transcribe(file_path)
+
+    def save_fixture(self, file_path: str, transcription: str):
+        """Сохраняет транскрипцию как фикстуру для указанного аудиофайла."""
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        key = audio_hash(file_path)
+        with open(os.path.join(self.fixtures_dir, f"{key}.txt"), "w") as fixture:
+            fixture.write(transcription)
+        self.transcripts[key] = transcription
+
+
+TRANSCRIPTION_BACKENDS = {
+    backend.name: backend
+    for backend in (OpenAIWhisperBackend, LocalWhisperBackend, ReplayBackend)
+}
+
+_backends = {}
+
+
+def get_transcription_backend(name: str = None) -> TranscriptionBackend:
+    """Возвращает бэкенд транскрибации, выбранный в TRANSCRIPTION_BACKEND."""
+    name = name or settings.TRANSCRIPTION_BACKEND
+    if name not in TRANSCRIPTION_BACKENDS:
+        raise ImproperlyConfigured(f"Unknown TRANSCRIPTION_BACKEND: {name}")
+
+    # Локальная модель загружается долго, поэтому бэкенд создается один раз на процесс
+    if name not in _backends:
+        _backends[name] = TRANSCRIPTION_BACKENDS[name]()
+    return _backends[name]
@@ -1,14 +1,28 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Под ASGI API-эндпоинты с долгими соединениями обслуживаются асинхронными версиями
+if settings.ASYNC_VIEWS:
+    from . import async_views as api_views
+else:
+    api_views = views
+
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
     path('add/', views.AddPhoneNumbersView.as_view(), name='add_numbers'),
+    path('import/', views.import_numbers, name='import_numbers'),
     path('phone/<int:pk>/', views.PhoneNumberDetailView.as_view(), name='phone_detail'),
     path('phone/<int:pk>/delete/', views.delete_phone, name='delete_phone'),
     path('phone/<int:pk>/add_dtmf/', views.add_manual_dtmf, name='add_manual_dtmf'),
     path('phone/<int:pk>/recall/', views.recall_phone, name='recall_phone'),
-    path('api/queue-count/', views.queue_count, name='queue_count'),
-    path('api/phone-list/', views.phone_list, name='phone_list'),
-    path('recordings/<path:filepath>', views.serve_recording, name='serve_recording'),
+    path('api/queue-count/', api_views.queue_count, name='queue_count'),
+    path('api/phone-list/', api_views.phone_list, name='phone_list'),
+    path('api/events/', api_views.events, name='events'),
+    path('api/phone/<int:pk>/records/', views.phone_records, name='phone_records'),
+    path('api/phone/<int:pk>/sequences/', views.phone_sequences, name='phone_sequences'),
+    path('api/records/<int:pk>/transcription/', views.record_transcription, name='record_transcription'),
+    path('api/search/', views.search, name='search'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('recordings/<path:filepath>', api_views.serve_recording, name='serve_recording'),
 ]
@@ -4,15 +4,28 @@ from django.views.generic.edit import FormView
 from django.contrib import messages
 from django.urls import reverse_lazy
 from .models import PhoneNumber, CallRecord, DTMFSequence, SMSMessage
-from .tasks import make_call_with_sequence, make_initial_call, extract_phone_numbers
+from .tasks import make_call_with_sequence, make_initial_call
 from django import forms
-from django.http import JsonResponse, FileResponse, Http404
+from django.http import JsonResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from celery import chain
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.conf import settings
 import os
 from .forms import ManualDTMFForm
+from . import metrics as pipeline_metrics
+from . import events as live_events
+from . import caching
+from .pagination import keyset_page, level_keyset_page
+from django.db.models.functions import Length, Substr
+from django.urls import reverse
+from .recordings import resolve_recording_path, recording_response
+from . import importers
+from . import search as full_text_search
+import json
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,7 +43,23 @@ class HomeView(ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        return PhoneNumber.objects.all().order_by('-created_at')
+        # Keyset-пагинация вместо OFFSET: страница не замедляется по мере роста таблицы
+        cursor = self.request.GET.get('cursor')
+        phones, self.next_cursor = caching.cached(
+            'home', [caching.PHONES],
+            lambda: keyset_page(PhoneNumber.objects.all(), cursor, self.paginate_by),
+            cursor
+        )
+        return phones
+
+    def paginate_queryset(self, queryset, page_size):
+        return None, None, queryset, self.next_cursor is not None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        context['is_first_page'] = not self.request.GET.get('cursor')
+        return context
 
 class PhoneDetailView(DetailView):
     model = PhoneNumber
@@ -49,12 +78,20 @@ class PhoneNumberDetailView(DetailView):
     model = PhoneNumber
     template_name = 'calls/phone_detail.html'
     context_object_name = 'phone'
+
+    def get_object(self, queryset=None):
+        pk = self.kwargs['pk']
+        return caching.cached(
+            'phone_detail', [caching.phone_scope(pk), caching.ALL_PHONE_DETAILS],
+            lambda: get_object_or_404(PhoneNumber, pk=pk),
+            pk
+        )
     
     def get_context_data(self, **kwargs):
+        # Записи и последовательности подгружаются страницами через phone_records и phone_sequences,
+        # поэтому время рендера не зависит от размера дерева
         context = super().get_context_data(**kwargs)
-        phone = self.get_object()
-        context['call_records'] = phone.call_records.all()
-        context['dtmf_sequences'] = phone.dtmf_sequences.all()
+        phone = self.object
         if phone.summary:
             # Передаем raw JSON строку в шаблон
             context['phone'].summary_raw = phone.summary
@@ -76,36 +113,174 @@ class AddPhoneNumbersView(FormView):
         )
         sms_message.save()
 
-        # Запускаем задачу извлечения номеров
-        
+        # Номера извлечет по кускам задача process_sms_messages (см. PhoneNumberExtractor)
         messages.success(self.request, 'Текст отправлен на обработку. Номера будут обработаны автоматически.')
         return super().form_valid(form)
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['import_formats'] = importers.FORMATS
+        return context
+
+@require_http_methods(["POST"])
+def import_numbers(request):
+    """
+    Массовый импорт номеров из файла (CSV, NDJSON или текст) без GPT.
+
+    Отвечает потоком NDJSON: строка прогресса после каждой пачки, последняя с done=true.
+    """
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({'error': 'Файл не передан'}, status=400)
+    fmt = request.POST.get('format') or importers.detect_format(upload.name)
+    if fmt not in importers.FORMATS:
+        return JsonResponse({'error': f'Неизвестный формат: {fmt}'}, status=400)
+
+    def progress():
+        try:
+            for stats in importers.import_numbers(upload, fmt):
+                yield json.dumps(stats) + '\n'
+        except Exception as e:
+            logger.error(f"Error importing {upload.name}: {str(e)}")
+            yield json.dumps({'error': str(e), 'done': True}) + '\n'
+
+    response = StreamingHttpResponse(progress(), content_type='application/x-ndjson')
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def queue_count(request):
     """Возвращает количество номеров в очереди на обработку"""
-    count = PhoneNumber.objects.filter(status='new').count()
-    return JsonResponse({'count': count})
+    return JsonResponse({'count': cached_queue_count()})
+
+def cached_queue_count():
+    return caching.cached('queue_count', [caching.QUEUE], PhoneNumber.objects.filter(status='new').count)
+
+PHONE_LIST_FIELDS = (
+    'id', 'number', 'status', 'created_at', 'updated_at',
+    'call_count', 'transcribed_count', 'explored_count', 'queue_depth'
+)
+
 
 def phone_list(request):
-    """API endpoint для получения списка номеров"""
-    phones = PhoneNumber.objects.all().order_by('-created_at')[:20]
+    """
+    API endpoint для получения списка номеров.
+
+    Один запрос на страницу: счетчики денормализованы в PhoneNumber.
+    Параметры: cursor (из next_cursor предыдущей страницы), limit (до 100).
+    Отвечает 304, если строки страницы не изменились с прошлого запроса.
+    """
+    phones, next_cursor = keyset_page(
+        PhoneNumber.objects.values(*PHONE_LIST_FIELDS), request.GET.get('cursor'), _page_limit(request)
+    )
+    return phone_list_response(request, phones, next_cursor)
+
+def phone_list_response(request, phones, next_cursor):
+    """Ответ phone_list по уже выбранной странице (общий для sync и async версий)"""
+    # updated_at меняется при любом изменении номера или его счетчиков
+    fingerprint = ';'.join(f"{phone['id']}:{phone['updated_at'].timestamp()}" for phone in phones)
+    etag = quote_etag(hashlib.md5(f"{fingerprint}|{next_cursor}".encode()).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified:
+        return not_modified
+
     data = [{
-        'id': phone.id,
-        'number': phone.number,
-        'status': phone.status,
-        'created_at': phone.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-        'call_count': phone.call_records.count()
+        'id': phone['id'],
+        'number': phone['number'],
+        'status': phone['status'],
+        'created_at': phone['created_at'].strftime('%Y-%m-%d %H:%M:%S'),
+        'call_count': phone['call_count'],
+        'transcribed_count': phone['transcribed_count'],
+        'explored_count': phone['explored_count'],
+        'queue_depth': phone['queue_depth'],
     } for phone in phones]
-    return JsonResponse({'phones': data})
+    response = JsonResponse({'phones': data, 'next_cursor': next_cursor})
+    response['ETag'] = etag
+    return response
+
+def events(request):
+    """Лента изменений статусов в формате server-sent events"""
+    response = StreamingHttpResponse(live_events.stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+    return response
+
+def metrics(request):
+    """Метрики конвейера в текстовом формате Prometheus"""
+    pipeline_metrics.collect_queue_depth()
+    return HttpResponse(pipeline_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Сколько символов транскрипции отдается в списке; полный текст - через record_transcription
+TRANSCRIPTION_PREVIEW_LENGTH = 300
+
+
+def _page_limit(request, default=20):
+    try:
+        return min(max(int(request.GET.get('limit', default)), 1), 100)
+    except ValueError:
+        return default
+
+
+def phone_records(request, pk):
+    """Страница записей звонков номера: без полного текста транскрипций"""
+    cursor, limit = request.GET.get('cursor'), _page_limit(request)
+
+    def page():
+        records, next_cursor = keyset_page(
+            CallRecord.objects.filter(phone_number_id=pk).values('id', 'created_at', 'recording_file', 'dtmf_sequence').annotate(
+                transcription_preview=Substr('transcription', 1, TRANSCRIPTION_PREVIEW_LENGTH),
+                transcription_length=Length('transcription'),
+            ),
+            cursor,
+            limit
+        )
+        data = [{
+            'id': record['id'],
+            'created_at': record['created_at'].strftime('%d.%m.%Y %H:%M'),
+            'recording_url': reverse('serve_recording', args=[record['recording_file']]) if record['recording_file'] else None,
+            'dtmf_sequence': record['dtmf_sequence'],
+            'transcription': record['transcription_preview'],
+            'transcription_truncated': (record['transcription_length'] or 0) > TRANSCRIPTION_PREVIEW_LENGTH,
+        } for record in records]
+        return {'records': data, 'next_cursor': next_cursor}
+
+    return JsonResponse(caching.cached(
+        'phone_records', [caching.phone_scope(pk), caching.ALL_PHONE_DETAILS], page, pk, cursor, limit
+    ))
+
+def record_transcription(request, pk):
+    """Полный текст транскрипции одной записи"""
+    record = get_object_or_404(CallRecord.objects.only('id', 'transcription'), pk=pk)
+    return JsonResponse({'id': record.id, 'transcription': record.transcription})
+
+def search(request):
+    """Полнотекстовый поиск: номер и путь DTMF для найденных транскрипций и пунктов меню"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Параметр q обязателен'}, status=400)
+    return JsonResponse({'query': query, 'results': full_text_search.search(query, _page_limit(request))})
+
+def phone_sequences(request, pk):
+    """Страница последовательностей DTMF номера в порядке обхода дерева"""
+    cursor, limit = request.GET.get('cursor'), _page_limit(request, default=50)
+
+    def page():
+        sequences, next_cursor = level_keyset_page(
+            DTMFSequence.objects.filter(phone_number_id=pk).values('id', 'level', 'sequence', 'description', 'explored'),
+            cursor,
+            limit
+        )
+        return {'sequences': sequences, 'next_cursor': next_cursor}
+
+    return JsonResponse(caching.cached(
+        'phone_sequences', [caching.phone_scope(pk), caching.ALL_PHONE_DETAILS], page, pk, cursor, limit
+    ))
 
 def serve_recording(request, filepath):
-    """Отдает файл записи из директории recordings"""
-    # Убираем возможные лишние слэши и нормализуем путь
-    filepath = os.path.normpath(filepath).lstrip('/')
-    file_path = os.path.join(settings.RECORDINGS_PATH, filepath)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        return FileResponse(open(file_path, 'rb'), content_type='audio/wav')
-    raise Http404(f"Recording {filepath} not found")
+    """Отдает файл записи из директории recordings с поддержкой Range и условных запросов"""
+    file_path = resolve_recording_path(filepath)
+    if not file_path:
+        raise Http404(f"Recording {filepath} not found")
+    return recording_response(request, file_path)
 
 @require_http_methods(["POST"])
 def delete_phone(request, pk):
@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'calls.apps.CallsConfig',
 ]
 
@@ -100,8 +101,39 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Asterisk recordings
-ASTERISK_RECORDING_PATH = "/var/spool/asterisk/recording"
-RECORDINGS_PATH = "/recordings"
+ASTERISK_RECORDING_PATH = os.getenv('ASTERISK_RECORDING_PATH', "/var/spool/asterisk/recording")
+RECORDINGS_PATH = os.getenv('RECORDINGS_PATH', "/recordings")
+# Отдача записей фронт-прокси: '' (отдает Django), 'x-accel-redirect' (nginx) или 'x-sendfile'
+RECORDINGS_SENDFILE = os.getenv('RECORDINGS_SENDFILE', '').lower()
+RECORDINGS_ACCEL_PREFIX = os.getenv('RECORDINGS_ACCEL_PREFIX', '/protected-recordings/')  # internal location в nginx
+RECORDINGS_CACHE_MAX_AGE = int(os.getenv('RECORDINGS_CACHE_MAX_AGE', str(365 * 24 * 3600)))  # Записи не меняются
+# Архивный уровень: сжатые gzip записи (можно вынести на отдельный дешевый диск)
+RECORDINGS_ARCHIVE_PATH = os.getenv('RECORDINGS_ARCHIVE_PATH', os.path.join(RECORDINGS_PATH, 'archive'))
+
+# Политики хранения (calls.retention), 0 - отключить политику
+RECORDING_ARCHIVE_DAYS = int(os.getenv('RECORDING_ARCHIVE_DAYS', '30'))  # Через сколько дней сжимать файл записи
+RECORDING_RETENTION_DAYS = int(os.getenv('RECORDING_RETENTION_DAYS', '365'))  # Через сколько дней удалять файл
+CALL_RECORD_RETENTION_MONTHS = int(os.getenv('CALL_RECORD_RETENTION_MONTHS', '24'))  # Через сколько месяцев удалять секцию записей с транскрипциями
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))  # Секций calls_callrecord вперед
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))  # Строк в одной пачке
+RETENTION_TIME_BUDGET = int(os.getenv('RETENTION_TIME_BUDGET', '150'))  # Секунд на запуск (меньше мягкого лимита задачи)
+
+# Асинхронные версии API-представлений (включать при запуске через core.asgi)
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Логирование: calls.* пишут через очередь, форматирование и вывод - в фоновом потоке (calls.log)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' или 'text' (цветной, для разработки)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queue': {'()': 'calls.log.QueueHandler', 'format': LOG_FORMAT},
+    },
+    'loggers': {
+        'calls': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -124,12 +156,59 @@ CELERY_WORKER_HIJACK_ROOT_LOGGER = False
 # Ограничение размера результатов задач
 CELERY_RESULT_EXPIRES = 3600  # Хранить результаты в Redis только 1 час
 
+# Очереди по классам нагрузки: у каждой свой воркер (пул, concurrency) в docker-compose,
+# поэтому долгий звонок не задерживает транскрибацию, а периодические задачи - звонки
+CELERY_TASK_DEFAULT_QUEUE = 'housekeeping'
+CELERY_TASK_ROUTES = {
+    # Звонки через caller API: ожидание сети
+    'calls.tasks.make_initial_call': {'queue': 'dialing'},
+    'calls.tasks.make_call_with_sequence': {'queue': 'dialing'},
+    'calls.tasks.process_call_queue': {'queue': 'dialing'},
+    # Копирование и транскрибация записей (локальный whisper нагружает CPU)
+    'calls.tasks.process_recording': {'queue': 'transcription'},
+    'calls.tasks.transcribe_pending_recordings': {'queue': 'transcription'},
+    # Запросы к LLM
+    'calls.tasks.analyze_recording': {'queue': 'llm'},
+    'calls.tasks.analyze_sibling_menus': {'queue': 'llm'},
+    'calls.tasks.update_phone_summaries': {'queue': 'llm'},
+    'calls.tasks.analyze_recordings_for_dtmf': {'queue': 'llm'},
+    'calls.tasks.extract_phone_numbers': {'queue': 'llm'},
+    'calls.tasks.process_sms_messages': {'queue': 'llm'},
+    # Batch API: запись и загрузка JSONL корпуса, применение файла результатов
+    'calls.tasks.submit_llm_batch': {'queue': 'batch'},
+    'calls.tasks.poll_llm_batches': {'queue': 'batch'},
+    # Остальные периодические задачи (поиск работы в БД) идут в очередь по умолчанию
+}
+
+# Тайм-ауты задач по очередям (soft, hard), в секундах. Принудительно их соблюдает только prefork;
+# в пулах потоков (dialing, llm) задачи ограничены тайм-аутами HTTP-клиентов
+TASK_QUEUE_TIME_LIMITS = {
+    'dialing': (int(os.getenv('DIALING_SOFT_TIME_LIMIT', '90')), int(os.getenv('DIALING_TIME_LIMIT', '120'))),
+    'transcription': (int(os.getenv('TRANSCRIPTION_SOFT_TIME_LIMIT', '540')),
+                      int(os.getenv('TRANSCRIPTION_TIME_LIMIT', '600'))),
+    'llm': (int(os.getenv('LLM_SOFT_TIME_LIMIT', '240')), int(os.getenv('LLM_TIME_LIMIT', '300'))),
+    # Заметно больше тайм-аута загрузки файла (llm_batch.UPLOAD_TIMEOUT)
+    'batch': (int(os.getenv('LLM_BATCH_SOFT_TIME_LIMIT', '3300')), int(os.getenv('LLM_BATCH_TIME_LIMIT', '3600'))),
+    'housekeeping': (CELERY_TASK_SOFT_TIME_LIMIT, CELERY_TASK_TIME_LIMIT),
+}
+CELERY_TASK_ANNOTATIONS = {
+    task: dict(zip(('soft_time_limit', 'time_limit'), TASK_QUEUE_TIME_LIMITS[route['queue']]))
+    for task, route in CELERY_TASK_ROUTES.items()
+}
+
+
+# Диспетчер (manage.py run_dispatcher): ставит задачи сразу при появлении работы через BLPOP,
+# а Beat для задач, которые он запускает, остается редкой страховкой
+DISPATCHER_ENABLED = os.getenv('DISPATCHER_ENABLED', 'false').lower() == 'true'
+DISPATCHER_MIN_IDLE = int(os.getenv('DISPATCHER_MIN_IDLE', '1'))  # Начальный интервал проверки базы (сек)
+DISPATCHER_MAX_IDLE = int(os.getenv('DISPATCHER_MAX_IDLE', '60'))  # Предельный интервал при простое (сек)
+DISPATCHER_MAX_BATCH = int(os.getenv('DISPATCHER_MAX_BATCH', '50'))  # Звонков, запускаемых за одно пробуждение
 
 # Celery Beat schedule configuration
 CELERY_BEAT_SCHEDULE = {
     'process-unprocessed-recordings': {
         'task': 'calls.tasks.process_unprocessed_recordings',
-        'schedule': crontab(minute='*/2'),  # каждые 2 минуты
+        'schedule': crontab(minute='*/2'),  # каждые 2 минуты; диспетчер будит только транскрибацию, не summary
     },
     'update-phone-summaries': {
         'task': 'calls.tasks.update_phone_summaries',
@@ -137,11 +216,11 @@ CELERY_BEAT_SCHEDULE = {
     },
     'process-new-phones': {
         'task': 'calls.tasks.process_new_phones',
-        'schedule': crontab(minute='*/2'),  # Каждые 2 минуты
+        'schedule': crontab(minute='*/10') if DISPATCHER_ENABLED else crontab(minute='*/2'),  # Каждые 2 минуты (с диспетчером - 10)
     },
     'process-call-queue': {
         'task': 'calls.tasks.process_call_queue',
-        'schedule': timedelta(seconds=10),  # Каждые 10 секунд
+        'schedule': timedelta(minutes=1) if DISPATCHER_ENABLED else timedelta(seconds=10),  # Каждые 10 секунд (с диспетчером - минута)
     },
     'analyze-recordings-for-dtmf': {
         'task': 'calls.tasks.analyze_recordings_for_dtmf',
@@ -157,12 +236,84 @@ CELERY_BEAT_SCHEDULE = {
     },
     'process-sms-every-minute': {
         'task': 'calls.tasks.process_sms_messages',
-        'schedule': crontab(minute='*'),  # Каждую минуту
+        'schedule': crontab(minute='*/5') if DISPATCHER_ENABLED else crontab(minute='*'),  # Каждую минуту (с диспетчером - 5)
+    },
+    'poll-llm-batches': {
+        'task': 'calls.tasks.poll_llm_batches',
+        'schedule': crontab(minute='*/5'),  # Каждые 5 минут; без отправленных пакетов ничего не делает
+    },
+    'apply-retention-policies-hourly': {
+        'task': 'calls.tasks.apply_retention_policies',
+        'schedule': crontab(minute=30),  # Каждый час; запуск ограничен RETENTION_TIME_BUDGET
     },
 }
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')  # Например, http://caller-simulator:5050/v1 для симулятора
+
+# Записи соседних пунктов меню собираются SIBLING_ANALYSIS_WINDOW секунд и анализируются одним
+# запросом к LLM (0 - каждая запись отдельно), не больше SIBLING_ANALYSIS_MAX_ITEMS меню в запросе
+SIBLING_ANALYSIS_WINDOW = int(os.getenv('SIBLING_ANALYSIS_WINDOW', '10'))
+SIBLING_ANALYSIS_MAX_ITEMS = int(os.getenv('SIBLING_ANALYSIS_MAX_ITEMS', '10'))
+
+# Пакетный анализ через Batch API (manage.py llm_batch): JSONL с запросами, лимиты одного пакета
+LLM_BATCH_DIR = os.getenv('LLM_BATCH_DIR', os.path.join(MEDIA_ROOT, 'llm_batches'))
+LLM_BATCH_MAX_REQUESTS = int(os.getenv('LLM_BATCH_MAX_REQUESTS', '50000'))  # Запросов в одном файле (лимит API)
+LLM_BATCH_MAX_BYTES = int(os.getenv('LLM_BATCH_MAX_BYTES', str(190 * 1024 * 1024)))  # Размер файла (лимит API 200 МБ)
+LLM_BATCH_COMPLETION_WINDOW = os.getenv('LLM_BATCH_COMPLETION_WINDOW', '24h')
+
+# Бэкенд транскрибации: 'openai' (whisper-1), 'local' (faster-whisper на CPU) или 'replay' (фикстуры)
+TRANSCRIPTION_BACKEND = os.getenv('TRANSCRIPTION_BACKEND', 'openai')
+LOCAL_WHISPER_MODEL = os.getenv('LOCAL_WHISPER_MODEL', 'base')
+LOCAL_WHISPER_THREADS = int(os.getenv('LOCAL_WHISPER_THREADS', '4'))
+TRANSCRIPTION_REPLAY_DIR = os.getenv('TRANSCRIPTION_REPLAY_DIR', os.path.join(BASE_DIR, 'fixtures', 'transcripts'))
+TRANSCRIPTION_REPLAY_DEFAULT = os.getenv('TRANSCRIPTION_REPLAY_DEFAULT')  # Ответ, если фикстура не найдена
+
+# Асинхронный пул транскрибации
+TRANSCRIPTION_POOL_ENABLED = os.getenv('TRANSCRIPTION_POOL_ENABLED', 'false').lower() == 'true'
+TRANSCRIPTION_CONCURRENCY = int(os.getenv('TRANSCRIPTION_CONCURRENCY', '16'))  # Одновременных запросов к API
+TRANSCRIPTION_BATCH_SIZE = int(os.getenv('TRANSCRIPTION_BATCH_SIZE', '25'))  # Размер пачки при сохранении
+TRANSCRIPTION_POOL_LIMIT = int(os.getenv('TRANSCRIPTION_POOL_LIMIT', '500'))  # Записей за один запуск
+
+# Метрики конвейера (эндпоинт /metrics в формате Prometheus)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_REDIS_URL = os.getenv('METRICS_REDIS_URL', CELERY_BROKER_URL)
+
+# Кэш ответов дашборда (Redis, инвалидация сигналами моделей)
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', METRICS_REDIS_URL)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'KEY_PREFIX': 'calls:cache',
+        'OPTIONS': {
+            'socket_timeout': 1,
+            'socket_connect_timeout': 1,
+        },
+    }
+}
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))  # TTL значений (сек)
+
+# Сколько неисследованных последовательностей одного номера check_unexplored_dtmf ставит за запуск (0 - все)
+UNEXPLORED_DTMF_PER_NUMBER = int(os.getenv('UNEXPLORED_DTMF_PER_NUMBER', '0'))
+
+# Извлечение номеров из больших текстов: размер куска (символов), перекрытие и параллельные запросы к LLM
+EXTRACTION_CHUNK_SIZE = int(os.getenv('EXTRACTION_CHUNK_SIZE', '4000'))
+EXTRACTION_CHUNK_OVERLAP = int(os.getenv('EXTRACTION_CHUNK_OVERLAP', '200'))
+EXTRACTION_CONCURRENCY = int(os.getenv('EXTRACTION_CONCURRENCY', '8'))
+
+# Номеров в одной пачке при массовом импорте (import_numbers)
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+
+# Админка: таблицы больше этого числа строк (по pg_class) не пересчитываются COUNT(*),
+# а точный подсчет отфильтрованного списка ограничен по времени (мс)
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('ADMIN_EXACT_COUNT_LIMIT', '10000'))
+ADMIN_COUNT_TIMEOUT_MS = int(os.getenv('ADMIN_COUNT_TIMEOUT_MS', '200'))
+
+# Время жизни аренды задачи (сек): защита от повторной постановки той же записи в очередь
+TASK_LEASE_TTL = int(os.getenv('TASK_LEASE_TTL', '1800'))
 
 # Asterisk ARI Configuration
 ARI_URL = os.getenv('ARI_URL', 'http://165.227.123.113:8088')
@@ -170,5 +321,5 @@ ARI_USERNAME = os.getenv('ARI_USERNAME', 'aridid')
 ARI_PASSWORD = os.getenv('ARI_PASSWORD', '6TK5VA3zDSN01')
 
 # Caller API settings
-CALLER_SERVER_IP = "165.227.123.113"
-CALLER_SERVER_PORT = 5050
+CALLER_SERVER_IP = os.getenv('CALLER_SERVER_IP', "165.227.123.113")
+CALLER_SERVER_PORT = int(os.getenv('CALLER_SERVER_PORT', '5050'))